@@ -1,3 +1,7 @@
+import time
+
+BOOT_STARTED = time.perf_counter()
+
 from flask import Flask
 from extensions import db, mail, migrate
 from flask_cors import CORS
@@ -77,7 +81,11 @@ def create_app():
     host = os.getenv("DB_HOST")
     port = os.getenv("DB_PORT")
 
-    if not all([username, password, database, host, port]):
+    # DATABASE_URL (full SQLAlchemy URL) wins if set, e.g. a throwaway
+    # SQLite file for the benchmark suite
+    if os.getenv("DATABASE_URL"):
+        app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL")
+    elif not all([username, password, database, host, port]):
         print("⚠ Missing database configuration. Falling back to SQLite.")
         app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///users.db"
     else:
@@ -87,11 +95,43 @@ def create_app():
 
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # Pool sizing / timeouts from env, SQLite gets WAL (see services/db_pool.py)
+    from services.db_pool import engine_options, init_db_pool
+
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+
     # Initialize extensions with app
     db.init_app(app)
+    with app.app_context():
+        init_db_pool(app, db)
     mail.init_app(app)
     migrate.init_app(app, db)  # Flask-Migrate
 
+    # Outgoing mail goes through a background queue (pooled SMTP sessions)
+    from services.mail_queue import init_mail_queue
+
+    init_mail_queue(app)
+
+    # Email templates (templates/emails/*.html) compiled once here
+    from services.email_templates import init_email_templates
+
+    init_email_templates(app)
+
+    # Password reset OTPs (SQL table + expiry sweeper, or Redis / in-memory)
+    from services.otp_store import init_otp_store
+
+    init_otp_store(app)
+
+    # Per-route latency histograms + GET /metrics (Prometheus text format)
+    from services.metrics import init_metrics
+
+    init_metrics(app)
+
+    # Token-bucket throttling for auth + prediction routes (429 before any work)
+    from services.rate_limit import init_rate_limit
+
+    init_rate_limit(app)
+
     # ----------------------------------------------------
     # Register models and blueprints
     # ----------------------------------------------------
@@ -106,8 +146,16 @@ def create_app():
                 # If OTP model import fails, log and continue
                 print("⚠ Could not import OTP model before creating tables")
 
-            # Create tables for all registered models
-            db.create_all()
+            from models.prediction_job import PredictionJob  # noqa: F401
+
+            # Create tables for all registered models -- unless the schema
+            # is managed by Flask-Migrate (see DB_CREATE_ALL in services/startup.py)
+            from services.startup import should_create_all
+
+            if should_create_all(db):
+                db.create_all()
+            else:
+                print("✅ Schema managed by migrations, skipping create_all")
 
             # Register authentication routes (login/register/forgot/smtp-test)
             from routes.auth_route import auth_bp
@@ -117,10 +165,26 @@ def create_app():
             print("⚠ Database setup error:", e)
 
         # Register prediction routes (no DB dependency required here)
-        from routes.prediction_route import prediction_bp
+        from routes.prediction_route import prediction_bp, start_warm_up, model_readiness, job_runner
 
         app.register_blueprint(prediction_bp, url_prefix="/api/prediction")
 
+    # Bulk CSV prediction jobs: runner threads start in each worker on its first request
+    from services.prediction_jobs import init_prediction_jobs
+
+    init_prediction_jobs(app, job_runner)
+
+    # GET /healthz (liveness) + GET /readyz (models warmed up, DB reachable)
+    from services.health import DatabaseCheck, add_readiness_check, init_health
+
+    add_readiness_check("database", DatabaseCheck(db))
+    add_readiness_check("models", model_readiness)
+    init_health(app)
+
+    # Models (and pandas) load in the background from here on
+    start_warm_up()
+
+    print(f"✅ App ready in {time.perf_counter() - BOOT_STARTED:.2f}s (pid {os.getpid()})")
     return app
 
 
@@ -0,0 +1,18 @@
+"""
+Gunicorn settings hooks (read automatically when gunicorn is started from
+the Backend folder, e.g. `gunicorn app:app`). Command line flags still set
+workers, bind address etc.
+
+Keeps the multi-worker metrics directory (METRICS_MULTIPROC_DIR, see
+services/metrics.py) consistent: emptied when the master starts, and an
+exited worker's snapshot folded into the archive.
+"""
+from services.metrics import clear_multiproc_dir, mark_process_dead
+
+
+def on_starting(server):
+    clear_multiproc_dir()
+
+
+def child_exit(server, worker):
+    mark_process_dead(worker.pid)
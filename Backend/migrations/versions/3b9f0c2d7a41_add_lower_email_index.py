@@ -0,0 +1,28 @@
+"""Add case-normalized email index
+
+Revision ID: 3b9f0c2d7a41
+Revises: 971ddd67430d
+Create Date: 2026-10-17 10:12:31.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9f0c2d7a41'
+down_revision = '971ddd67430d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Functional index on lower(email): login / register / forgot / reset look
+    # users up with lower(email) = :email. MySQL needs 8.0.13+ for this.
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_email_lower', [sa.func.lower(sa.column('email'))], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_email_lower')
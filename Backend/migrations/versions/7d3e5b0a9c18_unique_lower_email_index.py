@@ -0,0 +1,53 @@
+"""Make the lower(email) index unique and store emails normalized
+
+Revision ID: 7d3e5b0a9c18
+Revises: e4a7d19b6c20
+Create Date: 2026-10-17 18:41:09.733105
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3e5b0a9c18'
+down_revision = 'e4a7d19b6c20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    user = sa.table('user', sa.column('id', sa.Integer), sa.column('email', sa.String))
+    key = sa.func.lower(sa.func.trim(user.c.email))
+
+    # Accounts registered before this revision may differ only in case
+    # ("A@x.com" / "a@x.com"). Login already treats them as one address, so
+    # they have to be merged by hand (pick the account to keep, move or drop
+    # the other) before the index can be unique.
+    duplicates = conn.execute(
+        sa.select(key, sa.func.count()).group_by(key).having(sa.func.count() > 1)
+    ).fetchall()
+    if duplicates:
+        rows = conn.execute(
+            sa.select(user.c.id, user.c.email).where(key.in_([d[0] for d in duplicates])).order_by(key, user.c.id)
+        ).fetchall()
+        listing = "\n".join(f"  user.id={row.id} email={row.email!r}" for row in rows)
+        raise RuntimeError(
+            f"{len(duplicates)} email address(es) belong to more than one account "
+            f"(differing only in case / surrounding spaces):\n{listing}\n"
+            "Merge or remove the extra accounts, then run the upgrade again."
+        )
+
+    # stored in the same form User() / register now write
+    conn.execute(user.update().where(user.c.email != key).values(email=key))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_email_lower')
+        batch_op.create_index('ix_user_email_lower', [sa.func.lower(sa.column('email'))], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_email_lower')
+        batch_op.create_index('ix_user_email_lower', [sa.func.lower(sa.column('email'))], unique=False)
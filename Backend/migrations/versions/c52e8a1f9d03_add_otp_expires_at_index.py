@@ -0,0 +1,26 @@
+"""Add otp.expires_at index for the expiry sweeper
+
+Revision ID: c52e8a1f9d03
+Revises: 3b9f0c2d7a41
+Create Date: 2026-10-17 11:40:07.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52e8a1f9d03'
+down_revision = '3b9f0c2d7a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('otp', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_otp_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('otp', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_otp_expires_at'))
@@ -0,0 +1,50 @@
+"""Add prediction_job table for bulk CSV prediction jobs
+
+Revision ID: e4a7d19b6c20
+Revises: c52e8a1f9d03
+Create Date: 2026-10-17 16:05:44.318027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7d19b6c20'
+down_revision = 'c52e8a1f9d03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('prediction_job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('output_format', sa.String(length=8), nullable=False),
+    sa.Column('input_path', sa.String(length=512), nullable=False),
+    sa.Column('output_path', sa.String(length=512), nullable=True),
+    sa.Column('bytes_total', sa.BigInteger(), nullable=False),
+    sa.Column('bytes_done', sa.BigInteger(), nullable=False),
+    sa.Column('rows_done', sa.Integer(), nullable=False),
+    sa.Column('rows_failed', sa.Integer(), nullable=False),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('worker', sa.String(length=64), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('prediction_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_prediction_job_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_prediction_job_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('prediction_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_prediction_job_status'))
+        batch_op.drop_index(batch_op.f('ix_prediction_job_created_at'))
+
+    op.drop_table('prediction_job')
@@ -3,22 +3,12 @@ from datetime import datetime, timedelta
 import secrets
 import string
 
-class OTP(db.Model):
-    """Model to store OTP codes for password reset."""
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(100), nullable=False, unique=True, index=True)
-    otp_code = db.Column(db.String(6), nullable=False)  # 6-digit OTP
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    expires_at = db.Column(db.DateTime, nullable=False)
-    is_verified = db.Column(db.Boolean, default=False)
-    
-    def __init__(self, email):
-        self.email = email
-        self.otp_code = self.generate_otp()
-        self.created_at = datetime.utcnow()
-        self.expires_at = datetime.utcnow() + timedelta(minutes=10)  # OTP valid for 10 minutes
-        self.is_verified = False
-    
+OTP_VALID_MINUTES = 10
+
+
+class OTPChecks:
+    """Expiry / code checks shared by the OTP table and the key-value OTP records."""
+
     @staticmethod
     def generate_otp():
         """Generate a random 6-digit OTP."""
@@ -36,6 +26,24 @@ class OTP(db.Model):
             return False, "Invalid OTP code"
         self.is_verified = True
         return True, "OTP verified successfully"
+
+
+class OTP(OTPChecks, db.Model):
+    """Model to store OTP codes for password reset."""
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    otp_code = db.Column(db.String(6), nullable=False)  # 6-digit OTP
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # indexed for the expiry sweeper (services/otp_store.py)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    is_verified = db.Column(db.Boolean, default=False)
+    
+    def __init__(self, email):
+        self.email = email
+        self.otp_code = self.generate_otp()
+        self.created_at = datetime.utcnow()
+        self.expires_at = datetime.utcnow() + timedelta(minutes=OTP_VALID_MINUTES)
+        self.is_verified = False
     
     def __repr__(self):
         return f'<OTP {self.email}>'
@@ -0,0 +1,78 @@
+from extensions import db
+from datetime import datetime
+import secrets
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class PredictionJob(db.Model):
+    """Bulk prediction job for an uploaded dataset CSV (services/prediction_jobs.py)."""
+    __tablename__ = "prediction_job"
+
+    id = db.Column(db.String(32), primary_key=True)
+    # queued -> running -> done / failed / cancelled; workers claim by status
+    status = db.Column(db.String(16), nullable=False, default="queued", index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    output_format = db.Column(db.String(8), nullable=False, default="csv")  # csv / ndjson
+    input_path = db.Column(db.String(512), nullable=False)
+    output_path = db.Column(db.String(512))
+    bytes_total = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_done = db.Column(db.BigInteger, nullable=False, default=0)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    rows_failed = db.Column(db.Integer, nullable=False, default=0)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    # updated with every chunk; a running job whose heartbeat stops is picked up again
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __init__(self, filename, input_path, bytes_total, output_format="csv"):
+        self.id = secrets.token_hex(16)
+        self.status = "queued"
+        self.filename = filename
+        self.input_path = input_path
+        self.bytes_total = bytes_total
+        self.bytes_done = 0
+        self.rows_done = 0
+        self.rows_failed = 0
+        self.output_format = output_format
+        self.cancel_requested = False
+        self.created_at = datetime.utcnow()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def progress(self):
+        """Share of the upload processed so far (0..1, by bytes read)."""
+        if self.status == "done":
+            return 1.0
+        if not self.bytes_total:
+            return 0.0
+        return round(min(self.bytes_done / self.bytes_total, 1.0), 4)
+
+    def to_dict(self):
+        def iso(value):
+            return value.isoformat() + "Z" if value else None
+
+        return {
+            "id": self.id,
+            "status": self.status,
+            "filename": self.filename,
+            "format": self.output_format,
+            "progress": self.progress(),
+            "rows_done": self.rows_done,
+            "rows_failed": self.rows_failed,
+            "cancel_requested": self.cancel_requested,
+            "error": self.error,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+        }
+
+    def __repr__(self):
+        return f'<PredictionJob {self.id} {self.status}>'
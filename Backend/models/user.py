@@ -1,17 +1,50 @@
 from extensions import db
 from datetime import datetime
 
+
+def normalize_email(email):
+    """Stored / lookup form of an email address (addresses are matched case-insensitively)."""
+    return (email or "").strip().lower()
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)  # Increased length for hash
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Auth lookups filter on lower(email); this index serves them and keeps
+    # case variants of one address from becoming two accounts
+    # (migrations 3b9f0c2d7a41, 7d3e5b0a9c18)
+    __table_args__ = (db.Index("ix_user_email_lower", db.func.lower(email), unique=True),)
     
     def __init__(self, name, email, password):
         self.name = name
-        self.email = email
+        self.email = normalize_email(email)
         self.password = password  # Password should be hashed before passing to init
 
+    @classmethod
+    def email_matches(cls, email):
+        """Filter clause for `email`, case-insensitive and using ix_user_email_lower."""
+        return db.func.lower(cls.email) == normalize_email(email)
+
+    @classmethod
+    def email_exists(cls, email):
+        """True if an account uses `email` (index-only, no row is loaded)."""
+        return db.session.query(cls.id).filter(cls.email_matches(email)).first() is not None
+
+    @classmethod
+    def credentials_for(cls, email):
+        """(id, name, password) row for `email` or None -- what login needs, nothing more."""
+        return db.session.query(cls.id, cls.name, cls.password).filter(cls.email_matches(email)).first()
+
+    @classmethod
+    def set_password(cls, user_id, password_hash):
+        """UPDATE the stored hash without loading the user."""
+        return db.session.query(cls).filter(cls.id == user_id).update(
+            {cls.password: password_hash}, synchronize_session=False
+        )
+
     def __repr__(self):
-        return f'<User {self.email}>'
\ No newline at end of file
+        return f'<User {self.email}>'
@@ -1,13 +1,18 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
-from flask_mail import Message
-from werkzeug.security import generate_password_hash, check_password_hash
-from extensions import db, mail
-from models.user import User
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models.user import User, normalize_email
+from services.password_hashing import hasher, HashPoolBusy
+from services.mail_queue import mail_queue
+from services.email_templates import build_message
+from services.token_cache import token_cache
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 import time
-from models.otp import OTP
+from services.otp_store import otp_store
 import re
 import traceback
+import hmac
+import hashlib
 
 # NEW: for smtp-test debug route
 import smtplib
@@ -19,6 +24,9 @@ auth_bp = Blueprint('auth_bp', __name__)
 # Token expiry time in seconds (1 hour = 3600 seconds)
 TOKEN_EXPIRY = 3600
 
+# Seconds the client should wait before retrying when hashing is saturated
+HASH_BUSY_RETRY_AFTER = 1
+
 """
 IMPORTANT (for Brevo SMTP):
 
@@ -33,20 +41,61 @@ MAIL_PASSWORD = '<your Brevo SMTP key>'   # SMTP key, NOT API key
 """
 
 
+def hash_busy_response():
+    """Fast 503 when the password hashing pool is full."""
+    response = jsonify({'success': False, 'message': 'Server is busy, please try again in a moment.'})
+    response.headers['Retry-After'] = str(HASH_BUSY_RETRY_AFTER)
+    return response, 503
+
+
+# One serializer per secret key (per process), not one per request
+_serializers = {}
+
+
 def make_serializer():
     secret = current_app.config.get('SECRET_KEY', None)
-    return URLSafeTimedSerializer(secret) if secret else None
+    if not secret:
+        return None
+    serializer = _serializers.get(secret)
+    if serializer is None:
+        serializer = _serializers[secret] = URLSafeTimedSerializer(secret)
+    return serializer
+
+
+def password_fingerprint(password_hash):
+    """
+    Short HMAC of the stored password hash, put into the token.
+    A password reset changes it, so tokens issued before the reset stop validating.
+    """
+    secret = current_app.config.get('SECRET_KEY', '')
+    return hmac.new(secret.encode('utf-8'), password_hash.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+
+def token_matches_password(data, user):
+    """False for tokens issued before the user's last password change."""
+    fingerprint = data.get('pwd')
+    # tokens issued before fingerprints existed don't have one
+    return fingerprint is None or hmac.compare_digest(fingerprint, password_fingerprint(user.password))
+
 
+def make_token(user_id, password_hash):
+    serializer = make_serializer()
+    if not serializer:
+        return ''
+    return serializer.dumps({'user_id': user_id, 'pwd': password_fingerprint(password_hash)})
 
-def validate_token(token):
-    """Validate token and check expiry. Returns user_id if valid, None if invalid/expired."""
+
+def decode_token(token):
+    """
+    Check signature + expiry. Returns (payload, expires_at) or None if invalid/expired.
+    """
     try:
         serializer = make_serializer()
         if not serializer or not token:
             return None
         # max_age in seconds — token expires after TOKEN_EXPIRY seconds
-        data = serializer.loads(token, max_age=TOKEN_EXPIRY)
-        return data.get('user_id')
+        data, issued_at = serializer.loads(token, max_age=TOKEN_EXPIRY, return_timestamp=True)
+        return data, issued_at.timestamp() + TOKEN_EXPIRY
     except SignatureExpired:
         print("⏰ Token expired")
         return None
@@ -137,17 +186,18 @@ def register():
             password = request.form.get('password')
             confirm_password = request.form.get('confirm_password')
 
+        email = normalize_email(email)
         if not all([name, email, password, confirm_password]):
             return jsonify({'success': False, 'message': 'All fields are required.'}), 400
 
         if password != confirm_password:
             return jsonify({'success': False, 'message': 'Passwords do not match.'}), 400
 
-        if User.query.filter_by(email=email).first():
+        if User.email_exists(email):
             return jsonify({'success': False, 'message': 'Email already registered.'}), 409
 
-        # Hash password before storing
-        hashed_password = generate_password_hash(password)
+        # Hash password before storing (in the hashing pool)
+        hashed_password = hasher.hash(password)
         user = User(name=name, email=email, password=hashed_password)
 
         db.session.add(user)
@@ -155,45 +205,11 @@ def register():
 
         # --------------- Send Welcome Email ---------------
         try:
-            msg = Message(
-                subject=f"🎉 Welcome to Our Platform, {name}! 🌱✨",
-                recipients=[email],
-                html=f"""
-                        <div style="font-family: 'Segoe UI', Arial, sans-serif; background: #f4f9ff; padding: 20px; border-radius: 10px;">
-        
-                        <div style="text-align: center; padding: 20px; background: linear-gradient(135deg, #3a8ef6, #6f3af6); border-radius: 10px; color: white;">
-                        <h2 style="margin: 0; font-size: 28px;">Welcome Aboard, {name}! 👋</h2>
-                         <p style="margin-top: 8px; font-size: 16px;">We're thrilled to have you with us!</p>
-                         </div>
-
-                         <div style="padding: 20px; background: #ffffff; border-radius: 10px; margin-top: 15px; box-shadow: 0 2px 10px rgba(0,0,0,0.06);">
-                         <p style="font-size: 15px; color: #333; line-height: 1.6;">
-                         Thanks for registering with us! 🌟<br><br>
-                         You now have full access to explore our water quality prediction tools 🚀
-                        </p>
-
-                        <div style="text-align: center; margin: 20px 0;">
-                        <a href="https://your-website-url/login" 
-                        style="text-decoration:none; background: #3a8ef6; color: #fff; padding: 12px 25px; border-radius: 50px; font-size: 16px; display: inline-block;">
-                       🔐 Login & Get Started
-                        </a>
-                        </div>
-
-                         <p style="font-size: 14px; color: #777;">
-                         If you have any questions or need support, feel free to reply to this email anytime 💬
-                         </p>
-                         </div>
-
-                         <div style="text-align:center; margin-top:15px; color: #888; font-size: 13px;">
-                         <hr style="border: none; border-top: 1px solid #ddd; margin: 20px 0;">
-                         <p>With gratitude 💧<br><strong>Your Platform Team</strong></p>
-                         </div>
-                         </div>
-                            """
-            )
-
-            mail.send(msg)
-            print(f"📧 Welcome email sent to {email}")
+            msg = build_message("welcome", [email], name=name)
+
+            # queued; delivered in the background by the mail dispatcher
+            mail_queue.send(msg)
+            print(f"📧 Welcome email queued for {email}")
         except Exception as e:
             print(f"❌ Email send failed: {str(e)}")
             # Registration succeeded even if email failed; inform frontend
@@ -201,6 +217,14 @@ def register():
 
         return jsonify({'success': True, 'message': 'Registration successful.'}), 201
 
+    except HashPoolBusy as e:
+        db.session.rollback()
+        print(f"⚠️ Registration rejected, hashing pool busy: {str(e)}")
+        return hash_busy_response()
+    except IntegrityError:
+        # concurrent registration of the same address (ix_user_email_lower is unique)
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Email already registered.'}), 409
     except Exception as e:
         db.session.rollback()
         print(f"❌ Registration error: {str(e)}")
@@ -222,16 +246,34 @@ def login():
         if not email or not password:
             return jsonify({'success': False, 'message': 'Email and password are required.'}), 400
 
-        user = User.query.filter_by(email=email).first()
+        # only (id, name, password) -- no full User object
+        user = User.credentials_for(email)
+
+        if user and hasher.verify(user.password, password):
+            password_hash = user.password
+            # Hash made with older parameters -> store one with the current ones
+            if hasher.needs_rehash(password_hash):
+                try:
+                    new_hash = hasher.hash(password)
+                    User.set_password(user.id, new_hash)
+                    db.session.commit()
+                    password_hash = new_hash
+                except HashPoolBusy:
+                    # not important enough to fail the login; next login retries
+                    db.session.rollback()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️ Password rehash failed for {email}: {str(e)}")
 
-        if user and check_password_hash(user.password, password):
             # Create a signed token that the frontend can store
-            serializer = make_serializer()
-            token = serializer.dumps({'user_id': user.id}) if serializer else ''
+            token = make_token(user.id, password_hash)
             return jsonify({'success': True, 'message': f'Welcome back, {user.name}!', 'token': token}), 200
         else:
             return jsonify({'success': False, 'message': 'Invalid email or password.'}), 401
 
+    except HashPoolBusy as e:
+        print(f"⚠️ Login rejected, hashing pool busy: {str(e)}")
+        return hash_busy_response()
     except Exception as e:
         print(f"❌ Login error: {str(e)}")
         return "❌ An error occurred during login. Please try again."
@@ -255,10 +297,20 @@ def validate_token_endpoint():
         if not token:
             return jsonify({'valid': False, 'message': 'No token provided'}), 401
 
-        user_id = validate_token(token)
-        if user_id:
-            user = User.query.get(user_id)
-            if user:
+        # Polling hits the cache: no signature check, no DB round trip
+        # (a password reset in another worker is seen through its revocation marker)
+        cached = token_cache.get(token)
+        if cached:
+            user_id, user_name = cached
+            return jsonify({'valid': True, 'user_id': user_id, 'user_name': user_name}), 200
+
+        decoded = decode_token(token)
+        if decoded:
+            data, expires_at = decoded
+            user_id = data.get('user_id')
+            user = db.session.query(User.name, User.password).filter(User.id == user_id).first() if user_id else None
+            if user and token_matches_password(data, user):
+                token_cache.put(token, user_id, user.name, expires_at)
                 return jsonify({'valid': True, 'user_id': user_id, 'user_name': user.name}), 200
 
         return jsonify({'valid': False, 'message': 'Token expired or invalid'}), 401
@@ -284,81 +336,29 @@ def forgot_password():
             return jsonify({'success': False, 'message': 'Invalid email format'}), 400
 
         # Check if user exists
-        user = User.query.filter_by(email=email).first()
-        if not user:
+        if not User.email_exists(email):
             # For security, don't reveal if email exists or not
             return jsonify({'success': True, 'message': 'If email exists, OTP has been sent'}), 200
 
-        # Delete any existing OTP for this email to avoid unique constraint issues
+        # Generate new OTP (replaces an earlier one for this email in one statement)
         try:
-            existing = OTP.query.filter_by(email=email).first()
-            if existing:
-                db.session.delete(existing)
-                db.session.commit()
+            otp_code = otp_store.issue(email)
         except Exception as e:
-            db.session.rollback()
-            current_app.logger.exception('Failed to delete existing OTP')
-
-        # Generate new OTP
-        try:
-            otp_obj = OTP(email=email)
-            db.session.add(otp_obj)
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.exception('Failed to create OTP object')
+            current_app.logger.exception('Failed to create OTP')
             return jsonify({'success': False, 'message': 'Server error creating OTP'}), 500
 
         # Send OTP via email
         try:
-            msg = Message(
-                subject="🔐 Password Reset OTP - Water Quality Analyzer",
-                recipients=[email],
-                html=f"""
-                <div style="font-family: 'Segoe UI', Arial, sans-serif; background: #f4f9ff; padding: 20px; border-radius: 10px;">
-                    <div style="text-align: center; padding: 20px; background: linear-gradient(135deg, #3a8ef6, #6f3af6); border-radius: 10px; color: white;">
-                        <h2 style="margin: 0; font-size: 28px;">Password Reset Request 🔒</h2>
-                        <p style="margin-top: 8px; font-size: 16px;">We received a request to reset your password</p>
-                    </div>
-
-                    <div style="padding: 20px; background: #ffffff; border-radius: 10px; margin-top: 15px; box-shadow: 0 2px 10px rgba(0,0,0,0.06);">
-                        <p style="font-size: 15px; color: #333; line-height: 1.6;">
-                            Use this One-Time Password (OTP) to reset your password:<br><br>
-                        </p>
-
-                        <div style="text-align: center; margin: 20px 0;">
-                            <div style="background: #f0f7ff; padding: 20px; border-radius: 10px; border: 2px dashed #3a8ef6;">
-                                <p style="margin: 0; font-size: 32px; font-weight: bold; color: #3a8ef6; letter-spacing: 5px;">
-                                    {otp_obj.otp_code}
-                                </p>
-                            </div>
-                        </div>
-
-                        <p style="font-size: 13px; color: #e74c3c; text-align: center;">
-                            ⏰ This OTP will expire in 10 minutes
-                        </p>
-
-                        <p style="font-size: 14px; color: #777; margin-top: 20px;">
-                            If you didn't request this, please ignore this email. Your account is safe. 🛡️
-                        </p>
-                    </div>
-
-                    <div style="text-align:center; margin-top:15px; color: #888; font-size: 13px;">
-                        <hr style="border: none; border-top: 1px solid #ddd; margin: 20px 0;">
-                        <p>For security 🔒<br><strong>Water Quality Analyzer Team</strong></p>
-                    </div>
-                </div>
-                """
-            )
-            mail.send(msg)
-            print(f"📧 OTP sent to {email}")
+            msg = build_message("password_reset_otp", [email], otp_code=otp_code)
+            mail_queue.send(msg)
+            print(f"📧 OTP queued for {email}")
         except Exception as e:
             # Don't fail the whole request if email sending isn't configured (dev environment)
             print(f"❌ Failed to send OTP email: {str(e)}")
             # Log OTP to console for development/testing so developer can continue flow without SMTP
             try:
-                print(f"ℹ️ Development fallback - OTP for {email}: {otp_obj.otp_code}")
-                current_app.logger.warning(f"OTP send failed for {email}, OTP: {otp_obj.otp_code}")
+                print(f"ℹ️ Development fallback - OTP for {email}: {otp_code}")
+                current_app.logger.warning(f"OTP send failed for {email}, OTP: {otp_code}")
             except Exception:
                 pass
             # Continue and return success to frontend to avoid exposing internal SMTP config
@@ -385,7 +385,7 @@ def verify_otp():
             return jsonify({'success': False, 'message': 'Email and OTP code are required'}), 400
 
         # Find OTP record
-        otp_obj = OTP.query.filter_by(email=email).first()
+        otp_obj = otp_store.get(email)
         if not otp_obj:
             return jsonify({'success': False, 'message': 'No OTP found for this email'}), 404
 
@@ -395,7 +395,7 @@ def verify_otp():
             return jsonify({'success': False, 'message': message}), 400
 
         # OTP verified
-        db.session.commit()
+        otp_store.save(otp_obj)
         return jsonify({'success': True, 'message': 'OTP verified successfully'}), 200
 
     except Exception as e:
@@ -424,7 +424,7 @@ def reset_password():
             return jsonify({'success': False, 'message': 'Password must be at least 6 characters'}), 400
 
         # Verify OTP is valid and verified
-        otp_obj = OTP.query.filter_by(email=email).first()
+        otp_obj = otp_store.get(email)
         if not otp_obj or not otp_obj.is_verified:
             return jsonify({'success': False, 'message': 'OTP not verified or expired'}), 400
 
@@ -432,49 +432,33 @@ def reset_password():
             return jsonify({'success': False, 'message': 'OTP has expired'}), 400
 
         # Find user and update password
-        user = User.query.filter_by(email=email).first()
-        if not user:
+        user_id = db.session.query(User.id).filter(User.email_matches(email)).scalar()
+        if user_id is None:
             return jsonify({'success': False, 'message': 'User not found'}), 404
 
         # Hash and update password
-        user.password = generate_password_hash(new_password)
+        User.set_password(user_id, hasher.hash(new_password))
 
-        # Delete OTP after use
-        db.session.delete(otp_obj)
+        # Delete OTP after use (same transaction as the new password)
+        otp_store.discard(email)
         db.session.commit()
 
+        # Old tokens are invalid now (new password fingerprint); drop cached ones
+        token_cache.revoke_user(user_id)
+
         # Send confirmation email
         try:
-            msg = Message(
-                subject="✅ Password Reset Successful - Water Quality Analyzer",
-                recipients=[email],
-                html=f"""
-                <div style="font-family: 'Segoe UI', Arial, sans-serif; background: #f4f9ff; padding: 20px; border-radius: 10px;">
-                    <div style="text-align: center; padding: 20px; background: linear-gradient(135deg, #27ae60, #2ecc71); border-radius: 10px; color: white;">
-                        <h2 style="margin: 0; font-size: 28px;">✅ Password Reset Successful!</h2>
-                        <p style="margin-top: 8px; font-size: 16px;">Your password has been updated</p>
-                    </div>
-
-                    <div style="padding: 20px; background: #ffffff; border-radius: 10px; margin-top: 15px; box-shadow: 0 2px 10px rgba(0,0,0,0.06);">
-                        <p style="font-size: 15px; color: #333; line-height: 1.6;">
-                            Your password has been successfully reset! 🎉<br><br>
-                            You can now log in with your new password.
-                        </p>
-                    </div>
-
-                    <div style="text-align:center; margin-top:15px; color: #888; font-size: 13px;">
-                        <hr style="border: none; border-top: 1px solid #ddd; margin: 20px 0;">
-                        <p>Secure & Protected 🛡️<br><strong>Water Quality Analyzer Team</strong></p>
-                    </div>
-                </div>
-                """
-            )
-            mail.send(msg)
+            msg = build_message("password_reset_success", [email])
+            mail_queue.send(msg)
         except Exception as e:
             print(f"⚠️ Confirmation email failed (but password was reset): {str(e)}")
 
         return jsonify({'success': True, 'message': 'Password reset successfully. Please log in with your new password.'}), 200
 
+    except HashPoolBusy as e:
+        db.session.rollback()
+        print(f"⚠️ Password reset rejected, hashing pool busy: {str(e)}")
+        return hash_busy_response()
     except Exception as e:
         db.session.rollback()
         print(f"❌ Password reset error: {str(e)}")
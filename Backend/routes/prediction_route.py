@@ -1,58 +1,427 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, send_file, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
 import numpy as np
-import joblib
 import os
-import traceback
 import sys
+import time
 from extensions import db
-import pandas as pd  # for DataFrame inputs (main + tap models)
+from services.model_bundle import current_bundle_dir, current_path, feature_spec, load_bundle
+from services.model_registry import ModelRegistry, joblib_load
+from services.prediction_jobs import (BULK_JOB_MAX_BYTES, OUTPUT_FORMATS, JobRunner, UploadTooLarge, cancel_job,
+                                     create_job, get_job)
+from services.prediction_cache import PredictionCache, parse_rounding
+from services.prediction_pipeline import PredictionPipeline, label_table
+from services.shadow_eval import ShadowEvaluator
+from services.structured_log import get_logger, log_event
+from services.metrics import phase
+from services.startup import lazy_module, preload
+import json
+import functools
+import hmac
+import importlib.metadata
+import threading
+import warnings
 
 prediction_bp = Blueprint('prediction_bp', __name__)
 
+# pandas (DataFrame inputs, /river/batch validation) is imported on first
+# use / by the warm-up thread, not when the app module is imported
+pd = lazy_module("pandas")
+
+# Per-request records (endpoint, latency, label, errors) -> JSON lines via a queue
+log = get_logger("prediction")
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), '..', 'ml_models')
+
+# Models are served from versioned bundles (services/model_bundle.py,
+# ml_models/bundles/<name>/CURRENT) when there is one; otherwise from the
+# plain pickles below.
+
+# Old pre-trained model and label encoder (8-features wale model)
+model_path = os.path.join(MODELS_DIR, 'best_water_model.pkl')
+le_path = os.path.join(MODELS_DIR, 'label_encoder.pkl')
+
+# NEW: tap water model (tap_water.pkl) -> 5 features, string labels
+tap_model_path = os.path.join(MODELS_DIR, 'tap_water.pkl')
+
+# --------------------------------------------------------------------
+# Model loading
+#   MODEL_LOADING = background  -> warm-up thread starts once the app is created (default)
+#                   lazy        -> load on first prediction request
+#                   eager       -> load synchronously while the app is created
+#   MODEL_MMAP    = True        -> share model arrays between workers via mmap
+#   MODEL_MMAP_DIR              -> where memory-mappable copies are written
+#   MODEL_WATCH_INTERVAL        -> seconds between checks of ml_models/ for
+#                                  changed files (0 = off, use /admin/reload)
+#   MODEL_ADMIN_TOKEN           -> enables POST /admin/reload (X-Admin-Token header)
+# --------------------------------------------------------------------
+MODEL_LOADING = os.getenv("MODEL_LOADING", "background").lower()
+MODEL_MMAP = os.getenv("MODEL_MMAP", "True").lower() == "true"
+MODEL_MMAP_DIR = os.getenv("MODEL_MMAP_DIR") or os.path.join(MODELS_DIR, '.mmap')
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 0))
+MODEL_ADMIN_TOKEN = os.getenv("MODEL_ADMIN_TOKEN")
+
+# --------------------------------------------------------------------
+# Shadow / A-B evaluation (services/shadow_eval.py)
+#   SHADOW_MAIN_MODEL  candidate for the main model: a bundle directory, or
+#                      a pickle like best_water_model.pkl (labels from
+#                      label_encoder.pkl)
+#   SHADOW_TAP_MODEL   candidate for the tap model: bundle directory or pickle
+#   SHADOW_SAMPLE_RATE / SHADOW_WORKERS / SHADOW_QUEUE -> see shadow_eval.py
+# Candidates are loaded, checked and hot-reloaded by the registry like the
+# models they shadow ("main_candidate", "tap_candidate"), but a missing or
+# broken candidate never affects /readyz or the responses.
+# --------------------------------------------------------------------
+SHADOW_MAIN_MODEL = os.getenv("SHADOW_MAIN_MODEL")
+SHADOW_TAP_MODEL = os.getenv("SHADOW_TAP_MODEL")
+# own copy dir: a candidate named like the served pickle must not replace its mmap copy
+SHADOW_MMAP_DIR = os.path.join(MODEL_MMAP_DIR, "shadow")
+
+# JSON keys sent by the frontend for the main (8-feature) model,
+# in the same order as the training columns.
+MAIN_MODEL_FIELDS = [
+    "temperature", "dissolvedOxygen", "ph", "conductivity",
+    "bod", "nitrate", "fecalColiform", "totalColiform"
+]
+
+# Tap model JSON keys (same as its training column names)
+TAP_MODEL_FIELDS = ["ph", "Hardness", "Chloramines", "Sulfate", "Turbidity"]
+
+# Reference samples every newly loaded model must be able to predict
+# before it replaces the current one (values taken from the datasets)
+MAIN_REFERENCE_SAMPLES = [
+    {"temperature": 24, "dissolvedOxygen": 4.8, "ph": 7.6, "conductivity": 32400,
+     "bod": 1.2, "nitrate": 0.32, "fecalColiform": 4, "totalColiform": 64},
+    {"temperature": 20, "dissolvedOxygen": 7.5, "ph": 7.4, "conductivity": 250,
+     "bod": 1.0, "nitrate": 0.5, "fecalColiform": 2, "totalColiform": 10},
+    {"temperature": 30, "dissolvedOxygen": 1.0, "ph": 7.0, "conductivity": 1500,
+     "bod": 30, "nitrate": 10, "fecalColiform": 90000, "totalColiform": 500000},
+]
+TAP_REFERENCE_SAMPLES = [
+    {"ph": 8.32, "Hardness": 214.37, "Chloramines": 8.06, "Sulfate": 356.89, "Turbidity": 4.63},
+    {"ph": 9.09, "Hardness": 181.10, "Chloramines": 6.55, "Sulfate": 310.14, "Turbidity": 4.08},
+    {"ph": 5.58, "Hardness": 188.31, "Chloramines": 7.54, "Sulfate": 326.68, "Turbidity": 4.43},
+]
+
+# Column names used when the main model has no feature_names_in_
+DEFAULT_MAIN_COLUMNS = [
+    "Temperature", "Dissolved Oxygen", "pH", "Conductivity",
+    "BOD", "Nitrate", "Fecal Coliform", "Total Coliform"
+]
+
+# Upper limit on readings accepted by /river/batch in one request
+MAX_BATCH_ROWS = int(os.getenv("PREDICTION_MAX_BATCH_ROWS", 5000))
+
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+# Fast inference: pack each request into a preallocated float64 NumPy row
+# instead of building a one-row DataFrame. Column order is resolved once
+# per loaded model, so results are identical to the DataFrame path.
+FAST_INFERENCE = os.getenv("PREDICTION_FAST_INFERENCE", "True").lower() == "true"
+
+# Plain arrays carry no column names; sklearn warns about that on every
+# predict call even though our column order matches the training order.
+warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+
+
 # --------------------------------------------------------------------
-# Load old pre-trained model and label encoder (8-features wale model)
+# Prediction engine switch
+#   sklearn  -> estimator.predict (default)
+#   compiled -> flattened tree tables evaluated with NumPy (services/tree_engine.py)
 # --------------------------------------------------------------------
-try:
-    model_path = os.path.join(os.path.dirname(__file__), '..', 'ml_models', 'best_water_model.pkl')
-    le_path = os.path.join(os.path.dirname(__file__), '..', 'ml_models', 'label_encoder.pkl')
-
-    model = joblib.load(model_path)
-    le = joblib.load(le_path)
-    print(" Loaded pre-trained model and label encoder successfully")
-except Exception as e:
-    print(f" Error loading old model: {str(e)}")
-    print("Model path:", model_path)
-    print("Label encoder path:", le_path)
-    model = None
-    le = None
+PREDICTION_ENGINE = os.getenv("PREDICTION_ENGINE", "sklearn").lower()
+
+
+def load_predictor(estimator, name):
+    """Return the object used for .predict on `estimator` for the configured engine."""
+    if estimator is None or PREDICTION_ENGINE != "compiled":
+        return estimator
+    try:
+        from services.tree_engine import compile_model
+        compiled = compile_model(estimator)
+        print(f" Compiled {name} into tree tables")
+        return compiled
+    except Exception as e:
+        print(f" Could not compile {name}, using sklearn predict: {str(e)}")
+        return estimator
+
+
+class MainModel:
+    """
+    Main (8-feature) model + label encoder. Feature order and class labels
+    come from its manifest, the predictor is resolved once.
+    """
+
+    def __init__(self, model, le, manifest, mmap=False, source=None):
+        self.model = model
+        self.le = le
+        self.manifest = manifest
+        self.source = source  # bundle directory or pickle path
+        # API keys and the training column names, in model order
+        self.fields = [f["name"] for f in manifest["features"]]
+        self.features = [f["column"] for f in manifest["features"]]
+        self.predictor = load_predictor(model, "main model")
+        # class index -> label, so requests skip le.inverse_transform
+        self.labels = label_table(manifest["classes"])
+        self.mmap = mmap
+        self.warmup_seconds = None
+
+
+class TapModel:
+    """Tap water model (no label encoder); feature order from its manifest, predictor resolved once."""
+
+    def __init__(self, model, manifest, mmap=False, source=None):
+        self.model = model
+        self.manifest = manifest
+        self.source = source
+        self.fields = [f["name"] for f in manifest["features"]]
+        self.features = [f["column"] for f in manifest["features"]]
+        self.predictor = load_predictor(model, "tap water model")
+        self.labels = None  # predicts "Low"/"Average"/"High" directly
+        self.mmap = mmap
+        self.warmup_seconds = None
+
+
+def legacy_manifest(name, model, fields, default_columns, classes):
+    """
+    Manifest for a plain pickle from ml_models/ (no bundle). Model ko jis
+    naam ke features ke saath train kiya gaya tha, wo sklearn model ke andar
+    feature_names_in_ me saved rehte hain -- read here, once per load.
+    """
+    columns = [str(c) for c in getattr(model, "feature_names_in_", default_columns)]
+    if len(columns) != len(fields):
+        raise ValueError(f"Model expects {len(columns)} features, API sends {len(fields)}")
+    return {
+        "name": name,
+        "version": "legacy",
+        "estimator": type(model).__name__,
+        "features": [feature_spec(f, c) for f, c in zip(fields, columns)],
+        "classes": [str(c) for c in classes],
+    }
+
+
+def _main_model_from(bundle_dir, pickle_path, mmap_dir=MODEL_MMAP_DIR):
+    """MainModel from a bundle directory if given, else from a pickle + label_encoder.pkl."""
+    if bundle_dir:
+        manifest, objects, mmap_used = load_bundle(bundle_dir, installed_packages(), mmap=MODEL_MMAP)
+        return MainModel(objects["model"], objects["label_encoder"], manifest, mmap=mmap_used, source=bundle_dir)
+    model, mmap_used = joblib_load(pickle_path, mmap=MODEL_MMAP, mmap_dir=mmap_dir)
+    le, _ = joblib_load(le_path, mmap=False)
+    manifest = legacy_manifest("main", model, MAIN_MODEL_FIELDS, DEFAULT_MAIN_COLUMNS, le.classes_)
+    return MainModel(model, le, manifest, mmap=mmap_used, source=pickle_path)
+
+
+def _tap_model_from(bundle_dir, pickle_path, mmap_dir=MODEL_MMAP_DIR):
+    """TapModel from a bundle directory if given, else from a pickle."""
+    if bundle_dir:
+        manifest, objects, mmap_used = load_bundle(bundle_dir, installed_packages(), mmap=MODEL_MMAP)
+        return TapModel(objects["model"], manifest, mmap=mmap_used, source=bundle_dir)
+    tap_model, mmap_used = joblib_load(pickle_path, mmap=MODEL_MMAP, mmap_dir=mmap_dir)
+    # tap training columns are the API keys themselves
+    columns = [str(c) for c in getattr(tap_model, "feature_names_in_", TAP_MODEL_FIELDS)]
+    manifest = legacy_manifest("tap", tap_model, columns, columns, getattr(tap_model, "classes_", []))
+    return TapModel(tap_model, manifest, mmap=mmap_used, source=pickle_path)
+
+
+def _load_main_model():
+    return _main_model_from(current_bundle_dir("main"), model_path)
+
+
+def _load_tap_model():
+    return _tap_model_from(current_bundle_dir("tap"), tap_model_path)
+
+
+def _candidate_source(path):
+    """(bundle_dir, pickle_path) for a SHADOW_*_MODEL setting."""
+    return (path, None) if os.path.isdir(path) else (None, path)
+
+
+def _candidate_paths(path, *extra):
+    """Files the watcher checks for a candidate (a bundle changes through its manifest)."""
+    if os.path.isdir(path):
+        return [os.path.join(path, "manifest.json")]
+    return [path, *extra]
+
+
+def _load_main_candidate():
+    return _main_model_from(*_candidate_source(SHADOW_MAIN_MODEL), mmap_dir=SHADOW_MMAP_DIR)
+
+
+def _load_tap_candidate():
+    return _tap_model_from(*_candidate_source(SHADOW_TAP_MODEL), mmap_dir=SHADOW_MMAP_DIR)
+
+
+def _rows_input(values, feature_names):
+    """Model input for a (rows, features) float64 array in model column order."""
+    if FAST_INFERENCE:
+        return values
+    return pd.DataFrame(values, columns=feature_names)
+
+
+def _reference_input(samples, fields, feature_names):
+    values = np.array([[float(s[f]) for f in fields] for s in samples], dtype=np.float64)
+    return _rows_input(values, feature_names)
+
+
+def validate_main_model(main):
+    """Raise ValueError if a freshly loaded main model can't serve the reference samples."""
+    if main.fields != MAIN_MODEL_FIELDS:
+        raise ValueError(f"Model features {main.fields} do not match API fields {MAIN_MODEL_FIELDS}")
+    if [str(c) for c in main.le.classes_] != list(main.labels):
+        raise ValueError("Label encoder classes do not match the model manifest")
+    X = _reference_input(MAIN_REFERENCE_SAMPLES, MAIN_MODEL_FIELDS, main.features)
+    labels = main_pipeline.predict_rows(main, X)
+    if len(labels) != len(MAIN_REFERENCE_SAMPLES):
+        raise ValueError("Model returned wrong number of predictions for reference samples")
+
+
+def validate_tap_model(tap):
+    """Raise ValueError if a freshly loaded tap model can't serve the reference samples."""
+    if sorted(tap.fields) != sorted(TAP_MODEL_FIELDS):
+        raise ValueError(f"Tap model features {tap.fields} do not match {TAP_MODEL_FIELDS}")
+    X = _reference_input(TAP_REFERENCE_SAMPLES, tap.fields, tap.features)
+    preds = tap_pipeline.predict_rows(tap, X)
+    known = set(getattr(tap.model, "classes_", preds))
+    if len(preds) != len(TAP_REFERENCE_SAMPLES) or not set(preds) <= known:
+        raise ValueError("Tap model returned unexpected predictions for reference samples")
+
+
+def prepare_main_model(main):
+    validate_main_model(main)
+    main_pipeline.warm_up(main, MAIN_REFERENCE_SAMPLES)
+
+
+def prepare_tap_model(tap):
+    validate_tap_model(tap)
+    tap_pipeline.warm_up(tap, TAP_REFERENCE_SAMPLES)
+
+
+def _main_swapped(_):
+    main_cache.invalidate()
+    if main_shadow is not None:
+        main_shadow.reset()
+
+
+def _tap_swapped(_):
+    tap_cache.invalidate()
+    if tap_shadow is not None:
+        tap_shadow.reset()
+
+
+# A model only becomes "ok" (and /readyz only passes) after prepare_*:
+# reference samples validated and warm-up predictions done.
+registry = ModelRegistry()
+registry.register("main", _load_main_model, [current_path("main"), model_path, le_path],
+                  validator=prepare_main_model, on_swap=_main_swapped)
+registry.register("tap", _load_tap_model, [current_path("tap"), tap_model_path],
+                  validator=prepare_tap_model, on_swap=_tap_swapped)
+
+# Shadow candidates: same checks and warm-up as the models they shadow;
+# a swap starts a fresh comparison
+CANDIDATE_MODELS = []
+if SHADOW_MAIN_MODEL:
+    registry.register("main_candidate", _load_main_candidate, _candidate_paths(SHADOW_MAIN_MODEL, le_path),
+                      validator=prepare_main_model, on_swap=lambda _: main_shadow.reset())
+    CANDIDATE_MODELS.append("main_candidate")
+if SHADOW_TAP_MODEL:
+    registry.register("tap_candidate", _load_tap_candidate, _candidate_paths(SHADOW_TAP_MODEL),
+                      validator=prepare_tap_model, on_swap=lambda _: tap_shadow.reset())
+    CANDIDATE_MODELS.append("tap_candidate")
+
+
+def _import_deferred_modules():
+    preload(pd)
+
+
+def start_warm_up():
+    """
+    Called by create_app() after everything else is set up, so the warm-up
+    thread doesn't compete with the rest of the boot for the GIL.
+    """
+    if MODEL_LOADING == "background":
+        registry.warm_up(background=True, before=_import_deferred_modules)
+    elif MODEL_LOADING == "eager":
+        registry.warm_up(background=False, before=_import_deferred_modules)
+
+
+def model_readiness():
+    """
+    (ready, details) for /readyz. Ready once every model is loaded and
+    warmed up. With MODEL_LOADING=lazy the first probe starts the loading.
+    """
+    details = {}
+    for name in registry.names():
+        if name in CANDIDATE_MODELS:
+            continue
+        status = registry.status(name)
+        obj = registry.get(name) if status["state"] == "ok" else None
+        details[name] = {
+            "state": status["state"],
+            "version": status["version"],
+            "warmup_seconds": obj.warmup_seconds if obj else None,
+        }
+        if status["state"] == "error":
+            details[name]["error"] = status["error"]
+    if any(d["state"] == "not_loaded" for d in details.values()):
+        registry.warm_up(background=True, before=_import_deferred_modules)
+    return all(d["state"] == "ok" for d in details.values()), details
+
+registry.watch(MODEL_WATCH_INTERVAL)
+
+
+def get_main_model():
+    """Loaded MainModel (loads on first call), or None if loading failed."""
+    return registry.get("main")
+
+
+def get_tap_model():
+    """Loaded TapModel (loads on first call), or None if loading failed."""
+    return registry.get("tap")
 
 # --------------------------------------------------------------------
-# NEW: Load tap water model (tap_water.pkl) -> 5 features, string labels
+# Prediction result cache (LRU + TTL) for single-row requests
+#   PREDICTION_CACHE_SIZE      max entries per model (0 disables)
+#   PREDICTION_CACHE_TTL       seconds an entry stays valid
+#   PREDICTION_CACHE_ROUNDING  per-feature decimals, e.g. "temperature=1,ph=2,Hardness=0"
 # --------------------------------------------------------------------
-try:
-    tap_model_path = os.path.join(os.path.dirname(__file__), '..', 'ml_models', 'tap_water.pkl')
-    tap_model = joblib.load(tap_model_path)
-    print(" Loaded tap water model successfully")
-except Exception as e:
-    print(f" Error loading tap water model: {str(e)}")
-    print("Tap model path:", tap_model_path)
-    tap_model = None
+CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 4096))
+CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", 300))
+CACHE_ROUNDING = parse_rounding(os.getenv("PREDICTION_CACHE_ROUNDING", ""))
+
+main_cache = PredictionCache(
+    "main", MAIN_MODEL_FIELDS, max_size=CACHE_SIZE, ttl=CACHE_TTL,
+    rounding=CACHE_ROUNDING, source_paths=[current_path("main"), model_path, le_path],
+)
+tap_cache = PredictionCache(
+    "tap", TAP_MODEL_FIELDS, max_size=CACHE_SIZE, ttl=CACHE_TTL,
+    rounding=CACHE_ROUNDING, source_paths=[current_path("tap"), tap_model_path],
+)
+
+
+# One preallocated input row per thread (gunicorn threads share the module)
+_row_buffers = threading.local()
+
+
+def _input_row(name, width):
+    """Return this thread's contiguous (1, width) float64 buffer for `name`."""
+    buf = getattr(_row_buffers, name, None)
+    if buf is None or buf.shape[1] != width:
+        buf = np.empty((1, width), dtype=np.float64)
+        setattr(_row_buffers, name, buf)
+    return buf
 
 
 # ------------------------------------------------------------
 # HELPER: build input DataFrame for main (8-feature) model
 #       -> uses SAME column names as training DataFrame
 # ------------------------------------------------------------
-def build_main_model_df(d):
+def build_main_model_df(d, feature_names):
     """
     Convert JSON body from frontend into a pandas DataFrame with
     the same feature names that were used when fitting the model.
     """
 
-    required_fields = [
-        "temperature", "dissolvedOxygen", "ph", "conductivity",
-        "bod", "nitrate", "fecalColiform", "totalColiform"
-    ]
+    required_fields = MAIN_MODEL_FIELDS
     missing = [f for f in required_fields if d.get(f) is None]
     if missing:
         raise ValueError(f"Missing required fields: {', '.join(missing)}")
@@ -72,14 +441,6 @@ def build_main_model_df(d):
     except Exception as e:
         raise ValueError(f"Invalid numeric value in input: {e}")
 
-    # Model ko jis naam ke features ke saath train kiya gaya tha,
-    # wo sklearn model ke andar feature_names_in_ me saved rehte hain.
-    default_cols = [
-        "Temperature", "Dissolved Oxygen", "pH", "Conductivity",
-        "BOD", "Nitrate", "Fecal Coliform", "Total Coliform"
-    ]
-    feature_names = list(getattr(model, "feature_names_in_", default_cols))
-
     if len(feature_names) != len(values):
         raise ValueError(
             f"Model expects {len(feature_names)} features but received {len(values)}."
@@ -91,137 +452,374 @@ def build_main_model_df(d):
     return df
 
 
+def build_main_model_row(d):
+    """
+    Fast path twin of build_main_model_df(): same validation, but the values
+    are written into a preallocated float64 row in training column order
+    (the model's feature count was checked against the API fields at load).
+    """
+    missing = [f for f in MAIN_MODEL_FIELDS if d.get(f) is None]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+
+    row = _input_row("main", len(MAIN_MODEL_FIELDS))
+    try:
+        for i, f in enumerate(MAIN_MODEL_FIELDS):
+            row[0, i] = float(d.get(f))
+    except Exception as e:
+        raise ValueError(f"Invalid numeric value in input: {e}")
+    return row
+
+
+def build_main_model_input(d, main):
+    """Model input for one reading: float64 row (fast mode) or one-row DataFrame."""
+    if FAST_INFERENCE:
+        return build_main_model_row(d)
+    return build_main_model_df(d, main.features)
+
+
+def build_tap_model_input(data, tap):
+    """Model input for /tap-status: float64 row (fast mode) or one-row DataFrame."""
+    missing = [f for f in tap.fields if data.get(f) is None]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+
+    if FAST_INFERENCE:
+        row = _input_row("tap", len(tap.fields))
+        for i, f in enumerate(tap.fields):
+            row[0, i] = float(data[f])
+        return row
+
+    # Build DataFrame with same columns used in training
+    sample = {c: float(data[f]) for f, c in zip(tap.fields, tap.features)}
+    return pd.DataFrame([sample])
+
+
+# ------------------------------------------------------------
+# Prediction pipelines (services/prediction_pipeline.py): one per model,
+# shared by its endpoints, the warm-up and the reference-sample checks
+# ------------------------------------------------------------
+main_shadow = ShadowEvaluator("main", lambda: registry.get("main_candidate")) if SHADOW_MAIN_MODEL else None
+tap_shadow = ShadowEvaluator("tap", lambda: registry.get("tap_candidate")) if SHADOW_TAP_MODEL else None
+
+main_pipeline = PredictionPipeline("main", get_main_model, build_main_model_input, cache=main_cache,
+                                   shadow=main_shadow)
+tap_pipeline = PredictionPipeline("tap", get_tap_model, build_tap_model_input, cache=tap_cache,
+                                  shadow=tap_shadow)
+
+
+# ------------------------------------------------------------
+# HELPER: batch input for main model (/river/batch)
+# ------------------------------------------------------------
+def read_batch_rows():
+    """
+    Read the list of readings from the request body.
+    Accepts a JSON array or NDJSON (one JSON object per line).
+    Lines that are not valid JSON are returned as None so that
+    they are reported as row errors instead of failing the batch.
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        rows = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+        return rows
+
+    data = request.get_json(force=True)
+    if not isinstance(data, list):
+        raise ValueError("Request body must be a JSON array of readings.")
+    return data
+
+
+def build_main_model_batch_df(rows, feature_names):
+    """
+    Validate all readings in one vectorized pass.
+
+    Returns (input_df, valid_positions, errors) where input_df only holds
+    the valid rows (with model feature names), valid_positions maps each
+    of its rows back to the request index and errors maps request index
+    -> validation message.
+    """
+    errors = {}
+    records = []
+    positions = []
+    for i, row in enumerate(rows):
+        if isinstance(row, dict):
+            records.append(row)
+            positions.append(i)
+        else:
+            errors[i] = "Each reading must be a JSON object."
+
+    raw = pd.DataFrame.from_records(records, columns=MAIN_MODEL_FIELDS)
+    missing = raw.isna().to_numpy()
+    numeric = raw.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    invalid = np.isnan(numeric) & ~missing
+
+    bad = missing.any(axis=1) | invalid.any(axis=1)
+    for r in np.flatnonzero(bad):
+        if missing[r].any():
+            fields = [MAIN_MODEL_FIELDS[c] for c in np.flatnonzero(missing[r])]
+            errors[positions[r]] = f"Missing required fields: {', '.join(fields)}"
+        else:
+            fields = [MAIN_MODEL_FIELDS[c] for c in np.flatnonzero(invalid[r])]
+            errors[positions[r]] = f"Invalid numeric value in input: {', '.join(fields)}"
+
+    ok = ~bad
+    valid_positions = [p for p, keep in zip(positions, ok) if keep]
+    values = np.ascontiguousarray(numeric[ok])
+    if FAST_INFERENCE:
+        return values, valid_positions, errors
+    input_df = pd.DataFrame(values, columns=feature_names)
+    return input_df, valid_positions, errors
+
+
+# ------------------------------------------------------------
+# Bulk jobs (services/prediction_jobs.py): uploaded dataset CSVs scored
+# in the background, chunk by chunk, through the main pipeline
+# ------------------------------------------------------------
+def score_river_chunk(chunk):
+    """
+    (features, labels, errors) for one RiverChunk of an uploaded dataset.
+    Each feature is the midpoint of the station's Min / Max reading (or
+    whichever of the two is given); rows missing a feature get an error
+    instead of a label, like /river/batch.
+    """
+    main = get_main_model()
+    if main is None:
+        raise RuntimeError("Model not loaded properly.")
+    features = chunk.midpoints(MAIN_MODEL_FIELDS)
+    missing = np.isnan(features)
+    bad = missing.any(axis=1)
+    labels = np.full(len(chunk), None, dtype=object)
+    if not bad.all():
+        labels[~bad] = main_pipeline.predict_rows(main, _rows_input(features[~bad], main.features))
+    errors = {}
+    for r in np.flatnonzero(bad):
+        fields = [MAIN_MODEL_FIELDS[c] for c in np.flatnonzero(missing[r])]
+        errors[int(r)] = f"Missing values: {', '.join(fields)}"
+    return features, labels, errors
+
+
+job_runner = JobRunner(score_river_chunk, MAIN_MODEL_FIELDS)
+
+
 # Routes
 # --------------------------------------------------------------------
 
-@prediction_bp.route('/diagnostics', methods=['GET'])
-def diagnostics():
-    """Return diagnostic information about the model setup."""
-    if model is None or le is None:
-        main_model_status = "error"
-    else:
-        main_model_status = "ok"
-
-    if tap_model is None:
-        tap_status = "error"
-    else:
-        tap_status = "ok"
-
-    default_cols = [
-        "Temperature", "Dissolved Oxygen", "pH", "Conductivity",
-        "BOD", "Nitrate", "Fecal Coliform", "Total Coliform"
-    ]
-    main_features = list(getattr(model, "feature_names_in_", default_cols)) if model else None
-
-    info = {
-        "python_version": sys.version,
-        "main_model_status": main_model_status,
-        "tap_model_status": tap_status,
-        "model_type": type(model).__name__ if model else None,
-        "model_path": model_path if model else None,
-        "tap_model_path": tap_model_path if tap_model else None,
-        "features_main_model": main_features,
-        "tap_features": [
-            "ph", "Hardness", "Chloramines", "Sulfate", "Turbidity"
-        ],
-        "classes_main_model": list(le.classes_) if le else None
+@functools.lru_cache(maxsize=None)
+def installed_packages():
+    """{distribution: version} of the model libraries (None = not installed), read once."""
+    # package metadata only: importing sklearn here while the warm-up thread
+    # unpickles a model can hand one of them a half-initialised module
+    versions = {}
+    for dist in ("scikit-learn", "xgboost", "numpy", "pandas"):
+        try:
+            versions[dist] = importlib.metadata.version(dist)
+        except importlib.metadata.PackageNotFoundError:
+            versions[dist] = None
+    return versions
+
+
+@functools.lru_cache(maxsize=None)
+def runtime_versions():
+    """Python / library versions, read once per process."""
+    versions = {"python_version": sys.version}
+    for key, dist in (("sklearn_version", "scikit-learn"), ("xgboost_version", "xgboost"),
+                      ("numpy_version", "numpy"), ("pandas_version", "pandas")):
+        versions[key] = installed_packages()[dist] or "not installed"
+    return versions
+
+
+def bundle_summary(obj):
+    """What /diagnostics shows of a model's manifest."""
+    m = obj.manifest
+    return {
+        "version": m.get("version"),
+        "created_at": m.get("created_at"),
+        "source": obj.source,
+        "estimator": m.get("estimator"),
+        "training_data_sha256": (m.get("training_data") or {}).get("sha256"),
+        "test_accuracy": (m.get("metrics") or {}).get("test", {}).get("selected", {}).get("accuracy"),
+        "feature_ranges": {f["name"]: [f["min"], f["max"]] for f in m["features"] if "min" in f},
+    }
+
+
+@functools.lru_cache(maxsize=8)
+def model_metadata(name, version):
+    """Descriptive fields of a loaded model, computed once per (model, version); 0 = not loaded."""
+    obj = registry.get(name) if version else None
+    if name == "main":
+        return {
+            "model_type": type(obj.model).__name__ if obj else None,
+            "model_path": obj.source if obj else None,
+            "features_main_model": obj.features if obj else None,
+            "classes_main_model": list(obj.labels) if obj else None,
+            "main_predictor": type(obj.predictor).__name__ if obj else None,
+            "main_bundle": bundle_summary(obj) if obj else None,
+        }
+    return {
+        "tap_model_path": obj.source if obj else None,
+        "tap_features": obj.fields if obj else TAP_MODEL_FIELDS,
+        "tap_predictor": type(obj.predictor).__name__ if obj else None,
+        "tap_bundle": bundle_summary(obj) if obj else None,
     }
 
-    try:
-        import sklearn
-        info["sklearn_version"] = sklearn.__version__
-    except Exception as e:
-        info["sklearn_version"] = f"not installed ({e})"
 
+def shadow_diagnostics(shadow, candidate_name):
+    """Comparison stats of a shadowed model plus which candidate they are for."""
+    if shadow is None:
+        return None
+    status = registry.status(candidate_name)
+    candidate = registry.get(candidate_name) if status["state"] == "ok" else None
+    info = shadow.stats()
+    info["candidate_status"] = status["state"]
+    info["candidate"] = bundle_summary(candidate) if candidate else None
+    return info
+
+
+@prediction_bp.route('/diagnostics', methods=['GET'])
+def diagnostics():
+    """Return diagnostic information about the model setup (does not force a load)."""
+    main_status = registry.status("main")
+    tap_status = registry.status("tap")
+    main_ok = main_status["state"] == "ok"
+    tap_ok = tap_status["state"] == "ok"
+    main = registry.get("main") if main_ok else None
+    tap = registry.get("tap") if tap_ok else None
+
+    info = dict(runtime_versions())
+    # version 0 = not loaded yet; the None fields are cached under that key
+    info.update(model_metadata("main", main_status["version"] if main_ok else 0))
+    info.update(model_metadata("tap", tap_status["version"] if tap_ok else 0))
+    info.update({
+        "main_model_status": main_status["state"],
+        "tap_model_status": tap_status["state"],
+        "fast_inference": FAST_INFERENCE,
+        "prediction_engine": PREDICTION_ENGINE,
+        "prediction_cache": {
+            "main": main_cache.stats(),
+            "tap": tap_cache.stats(),
+        },
+        "model_loading": MODEL_LOADING,
+        "model_mmap": {
+            "main": main.mmap if main else None,
+            "tap": tap.mmap if tap else None,
+        },
+        "model_registry": registry.diagnostics(),
+        "bulk_jobs": job_runner.stats(),
+        "shadow": {
+            "main": shadow_diagnostics(main_shadow, "main_candidate"),
+            "tap": shadow_diagnostics(tap_shadow, "tap_candidate"),
+        },
+    })
     return jsonify(info)
 
 
-@prediction_bp.route('/predict', methods=['POST'])
-def predict():
-    """Make a water quality prediction based on input parameters (old 8-feature model)."""
-    if model is None or le is None:
-        return jsonify({
-            "success": False,
-            "error": "Model not loaded properly. Check server logs."
-        }), 500
-    try:
-        data = request.get_json(force=True)
-        print("📥 /predict Received data:", data)
+@prediction_bp.route('/admin/reload', methods=['POST'])
+def reload_models():
+    """
+    Hot-reload model files without restarting the app.
+    Header: X-Admin-Token: <MODEL_ADMIN_TOKEN>
+    Body (optional): {"model": "main" | "tap", "wait": true}
+
+    The new model is loaded and checked against reference samples before it
+    replaces the current one; in-flight requests finish on the old model.
+    Only the worker that handles this request reloads -- with several
+    gunicorn workers use MODEL_WATCH_INTERVAL instead.
+    """
+    if not MODEL_ADMIN_TOKEN:
+        return jsonify({"success": False, "error": "Model reload endpoint is disabled."}), 403
 
-        input_df = build_main_model_df(data)
-        print(" /predict Processed input DF:")
-        print(input_df)
+    token = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(token, MODEL_ADMIN_TOKEN):
+        return jsonify({"success": False, "error": "Invalid admin token."}), 401
 
-        pred_label = model.predict(input_df)
-        prediction = le.inverse_transform(pred_label)[0]
-        print(" /predict Prediction result:", prediction)
+    payload = request.get_json(silent=True) or {}
+    names = [payload["model"]] if payload.get("model") else registry.names()
+    unknown = [n for n in names if n not in registry.names()]
+    if unknown:
+        return jsonify({"success": False, "error": f"Unknown model: {', '.join(unknown)}"}), 400
 
-        return jsonify({
-            "success": True,
-            "prediction": prediction
-        })
-    except ValueError as ve:
-        print(" /predict Validation error:", str(ve))
-        return jsonify({"success": False, "error": str(ve)}), 400
-    except Exception as e:
-        traceback.print_exc()
-        print(" /predict Error during prediction:", str(e))
-        return jsonify({"success": False, "error": "Internal server error"}), 500
+    if not payload.get("wait"):
+        for name in names:
+            registry.reload(name, background=True)
+        return jsonify({"success": True, "message": "Reload started", "models": names}), 202
+
+    results = {name: registry.reload(name, background=False) for name in names}
+    ok = all(r and r["ok"] for r in results.values())
+    versions = {name: registry.status(name)["version"] for name in names}
+    return jsonify({"success": ok, "results": results, "versions": versions}), (200 if ok else 422)
+
+
+@prediction_bp.route('/predict', methods=['POST'])
+def predict():
+    """Make a water quality prediction based on input parameters (old 8-feature model)."""
+    return main_pipeline.handle("/predict", "Model not loaded properly. Check server logs.")
 
 
 @prediction_bp.route('/tap', methods=['POST'])
 def predict_tap():
     """Tap endpoint but using main 8-feature model (not tap_water.pkl)."""
-    if model is None or le is None:
-        return jsonify({"success": False, "error": "Model not loaded properly."}), 500
+    return main_pipeline.handle("/tap")
 
-    try:
-        data = request.get_json(force=True)
-        print("📥 /tap Received data:", data)
 
-        input_df = build_main_model_df(data)
-        print(" /tap Processed input DF:")
-        print(input_df)
+@prediction_bp.route('/river', methods=['POST'])
+def predict_river():
+    """River endpoint using main 8-feature model."""
+    return main_pipeline.handle("/river")
 
-        pred_label = model.predict(input_df)
-        prediction = le.inverse_transform(pred_label)[0]
-        print(" /tap Prediction result:", prediction)
 
-        return jsonify({"success": True, "prediction": prediction})
-    except ValueError as ve:
-        print(" /tap Validation error:", str(ve))
-        return jsonify({"success": False, "error": str(ve)}), 400
-    except Exception as e:
-        traceback.print_exc()
-        print(" /tap Error during prediction:", str(e))
-        return jsonify({"success": False, "error": "Internal server error"}), 500
+@prediction_bp.route('/river/batch', methods=['POST'])
+def predict_river_batch():
+    """
+    Batch river endpoint: many readings -> one model.predict call.
+    Body: JSON array of reading objects, or NDJSON with
+    Content-Type: application/x-ndjson.
+    Output:
+    {
+        "success": true,
+        "count": 3,
+        "results": [
+            {"index": 0, "success": true, "prediction": "Clean"},
+            {"index": 1, "success": false, "error": "Missing required fields: bod"},
+            ...
+        ]
+    }
+    """
+    return main_pipeline.serve("/river/batch", "Model not loaded properly.", _river_batch)
 
 
-@prediction_bp.route('/river', methods=['POST'])
-def predict_river():
-    """River endpoint using main 8-feature model."""
-    if model is None or le is None:
-        return jsonify({"success": False, "error": "Model not loaded properly."}), 500
-    try:
-        data = request.get_json(force=True)
-        print("📥 /river Received data:", data)
+def _river_batch(main, endpoint, started):
+    rows = read_batch_rows()
+    if len(rows) > MAX_BATCH_ROWS:
+        raise ValueError(f"Too many readings: {len(rows)} (max {MAX_BATCH_ROWS}).")
+    phase("parse")
 
-        input_df = build_main_model_df(data)
-        print(" River input DF:")
-        print(input_df)
+    input_df, valid_positions, errors = build_main_model_batch_df(rows, main.features)
+    phase("validation")
 
-        pred_label = model.predict(input_df)
-        prediction = le.inverse_transform(pred_label)[0]
-        print(" /river Prediction result:", prediction)
+    predictions = {}
+    if valid_positions:
+        labels = main_pipeline.predict_rows(main, input_df, endpoint)
+        predictions = dict(zip(valid_positions, labels.tolist()))
+    phase("inference")
 
-        return jsonify({"success": True, "prediction": prediction})
-    except ValueError as ve:
-        print(" River ValueError:", str(ve))
-        return jsonify({"success": False, "error": str(ve)}), 400
-    except Exception as e:
-        traceback.print_exc()
-        print(" /river Error during prediction:", str(e))
-        return jsonify({"success": False, "error": "Internal server error"}), 500
+    results = []
+    for i in range(len(rows)):
+        if i in errors:
+            results.append({"index": i, "success": False, "error": errors[i]})
+        else:
+            results.append({"index": i, "success": True, "prediction": predictions[i]})
+
+    log_event(log, "batch_prediction", started, endpoint=endpoint,
+              rows=len(rows), predicted=len(predictions), rejected=len(errors))
+    response = jsonify({"success": True, "count": len(rows), "results": results})
+    phase("serialization")
+    return response
 
 
 # --------------------------------------------------------------------
@@ -245,42 +843,94 @@ def predict_tap_status():
         "prediction": "Low" / "Average" / "High"
     }
     """
-    if tap_model is None:
-        return jsonify({"success": False, "error": "Tap water model not loaded."}), 500
+    return tap_pipeline.handle("/tap-status", "Tap water model not loaded.")
 
-    try:
-        data = request.get_json(force=True)
-        print("📥 /tap-status Received tap data:", data)
-
-        required_fields = ["ph", "Hardness", "Chloramines", "Sulfate", "Turbidity"]
-        missing = [f for f in required_fields if data.get(f) is None]
-        if missing:
-            raise ValueError(f"Missing required fields: {', '.join(missing)}")
-
-        # Build DataFrame with same columns used in training
-        sample = {
-            "ph": float(data["ph"]),
-            "Hardness": float(data["Hardness"]),
-            "Chloramines": float(data["Chloramines"]),
-            "Sulfate": float(data["Sulfate"]),
-            "Turbidity": float(data["Turbidity"])
-        }
 
-        X_new = pd.DataFrame([sample])
-        print(" Tap-status input processed:")
-        print(X_new)
+# --------------------------------------------------------------------
+# Bulk prediction jobs for dataset CSVs (services/prediction_jobs.py)
+# --------------------------------------------------------------------
+def _job_response(job, status=200):
+    body = {"success": True, "job": job.to_dict(),
+            "status_url": url_for("prediction_bp.river_job_status", job_id=job.id)}
+    if job.status == "done":
+        body["result_url"] = url_for("prediction_bp.river_job_result", job_id=job.id)
+    return jsonify(body), status
+
+
+def _job_not_found():
+    return jsonify({"success": False, "error": "Job not found."}), 404
+
+
+def _upload_too_large():
+    return jsonify({"success": False, "error": f"File too large (max {BULK_JOB_MAX_BYTES} bytes)."}), 413
 
-        pred = tap_model.predict(X_new)[0]  # already "Low"/"Average"/"High"
-        print(" Tap water prediction:", pred)
 
-        return jsonify({
-            "success": True,
-            "prediction": pred
-        })
+@prediction_bp.route('/river/jobs', methods=['POST'])
+def create_river_job():
+    """
+    Queue a bulk prediction job for a CSV shaped like Dataset/Complete_Dataset.csv.
+    multipart/form-data: file=<csv>, format=csv | ndjson (result format, default csv)
+    Answers 202 with the job; poll status_url, download result_url when done.
+    """
+    if request.content_length and request.content_length > BULK_JOB_MAX_BYTES:
+        return _upload_too_large()
+    try:
+        # MAX_CONTENT_LENGTH stops a chunked body while werkzeug reads it
+        upload = request.files.get("file")
+    except RequestEntityTooLarge:
+        return _upload_too_large()
+    if upload is None:
+        return jsonify({"success": False, "error": "Upload the CSV as multipart field 'file'."}), 400
+
+    started = time.perf_counter()
+    try:
+        job = create_job(upload, request.form.get("format", "csv").lower())
+    except UploadTooLarge:
+        return _upload_too_large()
     except ValueError as ve:
-        print(" Tap-status validation error:", str(ve))
+        log_event(log, "validation_error", started, status=400, endpoint="/river/jobs", error=str(ve))
         return jsonify({"success": False, "error": str(ve)}), 400
     except Exception as e:
-        traceback.print_exc()
-        print(" Error during tap-status prediction:", str(e))
+        log_event(log, "job_error", started, status=500, exc_info=True, endpoint="/river/jobs", error=str(e))
         return jsonify({"success": False, "error": "Internal server error"}), 500
+
+    job_runner.notify()
+    log_event(log, "job_created", started, status=202, endpoint="/river/jobs", job=job.id,
+              filename=job.filename, bytes=job.bytes_total)
+    response, status = _job_response(job, 202)
+    response.headers["Location"] = url_for("prediction_bp.river_job_status", job_id=job.id)
+    return response, status
+
+
+@prediction_bp.route('/river/jobs/<job_id>', methods=['GET'])
+def river_job_status(job_id):
+    """Job status and progress (share of the file processed, rows done / rejected)."""
+    job = get_job(job_id)
+    if job is None:
+        return _job_not_found()
+    return _job_response(job)
+
+
+@prediction_bp.route('/river/jobs/<job_id>/result', methods=['GET'])
+def river_job_result(job_id):
+    """Download the results of a finished job (CSV or NDJSON, one line per input row)."""
+    job = get_job(job_id)
+    if job is None:
+        return _job_not_found()
+    if job.status != "done":
+        return jsonify({"success": False, "error": f"Job is {job.status}, no result to download.",
+                        "job": job.to_dict()}), 409
+    base = os.path.splitext(job.filename)[0] or "dataset"
+    return send_file(job.output_path, mimetype=OUTPUT_FORMATS[job.output_format], as_attachment=True,
+                     download_name=f"{base}-predictions.{job.output_format}")
+
+
+@prediction_bp.route('/river/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_river_job(job_id):
+    """Cancel a queued or running job (a running job stops after its current chunk)."""
+    job = cancel_job(job_id)
+    if job is None:
+        return _job_not_found()
+    if job.status in ("done", "failed"):
+        return jsonify({"success": False, "error": f"Job already {job.status}.", "job": job.to_dict()}), 409
+    return _job_response(job)
@@ -0,0 +1,504 @@
+"""
+Benchmark for the prediction and auth hot paths.
+
+Replays payloads taken from Dataset/Complete_Dataset.csv (/river) and
+Dataset/water_potability.csv (/tap-status), plus /login and /validate-token
+for a seeded benchmark user, and reports p50/p95/p99 latency, throughput
+and memory for each endpoint. Email templates are measured too (render
+time, time to build the MIME message, message size).
+
+Two targets:
+  testclient  -- in-process through Flask's test client (no network, one thread)
+  gunicorn    -- a local gunicorn server driven over HTTP by N client threads
+
+Results are written as JSON (git commit, environment, config + numbers) so
+runs from two commits can be compared with --compare.
+
+Run from the Backend folder:
+    python scripts/benchmark.py                        # test client only
+    python scripts/benchmark.py --target both --workers 2 --concurrency 8
+    python scripts/benchmark.py --compare benchmark_results/old.json --max-regression 20
+
+The app uses a throwaway SQLite database (DATABASE_URL) so your real
+users table is never touched.
+"""
+import argparse
+import collections
+import http.client
+import itertools
+import json
+import os
+import platform
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from scripts.check_engine_parity import load_river_rows, load_tap_rows, TAP_COLUMNS  # noqa: E402
+from services.build_info import git_info  # noqa: E402
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmark_results')
+
+RIVER_FIELDS = [
+    "temperature", "dissolvedOxygen", "ph", "conductivity",
+    "bod", "nitrate", "fecalColiform", "totalColiform"
+]
+
+BENCH_USER = {"name": "Benchmark User", "email": "benchmark@example.com", "password": "BenchPass123"}
+
+# env vars that change what is being measured -> stored with the results
+RECORDED_ENV_PREFIXES = ("PREDICTION_", "MODEL_", "REQUEST_LOG_", "METRICS_", "PASSWORD_", "SQLALCHEMY_",
+                         "RATE_LIMIT_")
+
+
+# ------------------------------------------------------------
+# Payloads
+# ------------------------------------------------------------
+def river_payloads():
+    """One /river body per Min / Max reading of every station."""
+    return [dict(zip(RIVER_FIELDS, map(float, row))) for row in load_river_rows()]
+
+
+def tap_payloads():
+    """One /tap-status body per complete row of water_potability.csv."""
+    X = load_tap_rows()
+    X = X[~np.isnan(X).any(axis=1)]
+    return [dict(zip(TAP_COLUMNS, map(float, row))) for row in X]
+
+
+# password hashing makes these ~100x slower -> fewer requests (--slow-requests)
+SLOW_SCENARIOS = {"login"}
+
+
+def build_scenarios(token):
+    """name -> (path, list of JSON bodies). Bodies are replayed round-robin."""
+    login = {"email": BENCH_USER["email"], "password": BENCH_USER["password"]}
+    return {
+        "river": ("/api/prediction/river", river_payloads()),
+        "tap-status": ("/api/prediction/tap-status", tap_payloads()),
+        "login": ("/api/auth/login", [login]),
+        "validate-token": ("/api/auth/validate-token", [{"token": token}]),
+    }
+
+
+def request_counts(name, args):
+    """(warmup, measured) request counts for one scenario."""
+    if name in SLOW_SCENARIOS:
+        return min(args.warmup, 5), min(args.requests, args.slow_requests)
+    return args.warmup, args.requests
+
+
+# ------------------------------------------------------------
+# Stats
+# ------------------------------------------------------------
+def summarize(latencies, wall_seconds, errors):
+    """errors -> {status: count} of non-200 responses (None = connection error)."""
+    lat = np.asarray(latencies, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if len(lat) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(lat),
+        "errors": sum(errors.values()),
+        "error_statuses": {str(k): v for k, v in sorted(errors.items(), key=str)},
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(lat.mean()), 3) if len(lat) else 0.0,
+        "max_ms": round(float(lat.max()), 3) if len(lat) else 0.0,
+        "throughput_rps": round(len(lat) / wall_seconds, 1) if wall_seconds else 0.0,
+    }
+
+
+def proc_memory(pid):
+    """Current / peak RSS (MB) of one process from /proc/<pid>/status."""
+    info = {"pid": pid}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key = "rss_mb" if line.startswith("VmRSS") else "peak_rss_mb"
+                    info[key] = round(int(line.split()[1]) / 1024, 2)
+    except OSError:
+        pass
+    return info
+
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+# ------------------------------------------------------------
+# Setup shared by both targets
+# ------------------------------------------------------------
+def load_app():
+    from app import app
+    return app
+
+
+def seed_user(app):
+    """Create the benchmark user in the (throwaway) database."""
+    from extensions import db
+    from models.user import User
+    from services.password_hashing import hasher
+
+    with app.app_context():
+        db.create_all()
+        if not User.query.filter_by(email=BENCH_USER["email"]).first():
+            db.session.add(User(name=BENCH_USER["name"], email=BENCH_USER["email"],
+                                password=hasher.hash(BENCH_USER["password"])))
+            db.session.commit()
+
+
+# ------------------------------------------------------------
+# Email templates (render cost + message size)
+# ------------------------------------------------------------
+# values for every variable the templates use; a template that needs
+# something else shows up with an "error" entry
+EMAIL_CONTEXT = {"name": BENCH_USER["name"], "otp_code": "482913"}
+
+
+def run_email_templates(app, args):
+    from services.email_templates import email_templates, build_message
+
+    results = {}
+    for template in email_templates.names():
+        try:
+            subject, body_html, body_text = email_templates.render(template, **EMAIL_CONTEXT)
+        except Exception as e:
+            results[template] = {"error": str(e)}
+            print(f"  email      {template:25s} ❌ {e}")
+            continue
+
+        render_times = []
+        for _ in range(args.requests):
+            t0 = time.perf_counter()
+            email_templates.render(template, **EMAIL_CONTEXT)
+            render_times.append(time.perf_counter() - t0)
+
+        # full MIME message, as handed to the mail queue
+        with app.app_context():
+            build_times = []
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                msg = build_message(template, [BENCH_USER["email"]], **EMAIL_CONTEXT)
+                msg.sender = msg.sender or "noreply@example.com"
+                data = msg.as_bytes()
+                build_times.append(time.perf_counter() - t0)
+
+        render = np.asarray(render_times) * 1000
+        build = np.asarray(build_times) * 1000
+        results[template] = {
+            "render_p50_ms": round(float(np.percentile(render, 50)), 4),
+            "render_p95_ms": round(float(np.percentile(render, 95)), 4),
+            "message_p50_ms": round(float(np.percentile(build, 50)), 4),
+            "message_p95_ms": round(float(np.percentile(build, 95)), 4),
+            "subject_bytes": len(subject.encode("utf-8")),
+            "html_bytes": len(body_html.encode("utf-8")),
+            "text_bytes": len(body_text.encode("utf-8")),
+            "message_bytes": len(data),
+        }
+        r = results[template]
+        print(f"  email      {template:25s} render p50 {r['render_p50_ms']:.3f} ms  "
+              f"message p50 {r['message_p50_ms']:.3f} ms  {r['message_bytes']} bytes")
+    return results
+
+
+# ------------------------------------------------------------
+# Target: Flask test client
+# ------------------------------------------------------------
+def run_testclient(app, args):
+    from services.model_registry import process_memory
+
+    client = app.test_client()
+    login = {"email": BENCH_USER["email"], "password": BENCH_USER["password"]}
+    token = client.post("/api/auth/login", json=login).get_json()["token"]
+
+    results = {}
+    for name, (path, bodies) in build_scenarios(token).items():
+        warmup, total = request_counts(name, args)
+        for body in itertools.islice(itertools.cycle(bodies), warmup):
+            client.post(path, json=body)
+
+        latencies, errors = [], collections.Counter()
+        start = time.perf_counter()
+        for body in itertools.islice(itertools.cycle(bodies), total):
+            t0 = time.perf_counter()
+            resp = client.post(path, json=body)
+            latencies.append(time.perf_counter() - t0)
+            if resp.status_code != 200:
+                errors[resp.status_code] += 1
+        results[name] = summarize(latencies, time.perf_counter() - start, errors)
+        print(f"  testclient {name:15s} {format_row(results[name])}")
+
+    return {"endpoints": results, "memory": process_memory()}
+
+
+# ------------------------------------------------------------
+# Target: local gunicorn
+# ------------------------------------------------------------
+def http_post(port, path, body, timeout=30):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        data = resp.read()
+        return resp.status, data
+    finally:
+        conn.close()
+
+
+def wait_until_ready(port, proc, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/readyz")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"gunicorn did not answer on port {port} within {timeout}s")
+
+
+def drive(port, path, bodies, total, concurrency):
+    """Send `total` requests from `concurrency` threads. Returns (latencies, errors, wall)."""
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies, errors = [], collections.Counter()
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                i = next(counter)
+            if i >= total:
+                break
+            t0 = time.perf_counter()
+            try:
+                status, _ = http_post(port, path, bodies[i % len(bodies)])
+            except OSError:
+                status = None
+            local.append(time.perf_counter() - t0)
+            if status != 200:
+                with lock:
+                    errors[status] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_gunicorn(args, env, log_path):
+    cmd = [sys.executable, "-m", "gunicorn", "app:app",
+           "--workers", str(args.workers), "--bind", f"127.0.0.1:{args.port}",
+           "--timeout", "120"]
+    if args.preload:
+        cmd.append("--preload")
+    print(f"  starting: {' '.join(cmd[2:])}")
+    with open(log_path, "w") as log_file:
+        proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    try:
+        wait_until_ready(args.port, proc, args.startup_timeout)
+        login = {"email": BENCH_USER["email"], "password": BENCH_USER["password"]}
+        status, data = http_post(args.port, "/api/auth/login", login)
+        if status != 200:
+            raise RuntimeError(f"benchmark login failed ({status}): {data[:200]!r}")
+        token = json.loads(data)["token"]
+
+        results = {}
+        for name, (path, bodies) in build_scenarios(token).items():
+            warmup, total = request_counts(name, args)
+            # every worker loads its models / caches before we measure
+            drive(args.port, path, bodies, warmup * args.workers, args.concurrency)
+            latencies, errors, wall = drive(args.port, path, bodies, total, args.concurrency)
+            results[name] = summarize(latencies, wall, errors)
+            print(f"  gunicorn   {name:15s} {format_row(results[name])}")
+
+        workers = [proc_memory(pid) for pid in child_pids(proc.pid)]
+        memory = {
+            "master": proc_memory(proc.pid),
+            "workers": workers,
+            "total_rss_mb": round(proc_memory(proc.pid).get("rss_mb", 0)
+                                  + sum(w.get("rss_mb", 0) for w in workers), 2),
+        }
+        return {
+            "endpoints": results,
+            "memory": memory,
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "preload": args.preload,
+        }
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# ------------------------------------------------------------
+# Output / comparison
+# ------------------------------------------------------------
+def format_row(r):
+    return (f"p50 {r['p50_ms']:8.3f} ms  p95 {r['p95_ms']:8.3f} ms  p99 {r['p99_ms']:8.3f} ms  "
+            f"{r['throughput_rps']:8.1f} req/s  errors {r['errors']}")
+
+
+def environment_info():
+    import flask
+    import sklearn
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "flask": flask.__version__ if hasattr(flask, "__version__") else None,
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith(RECORDED_ENV_PREFIXES)},
+    }
+
+
+def compare(old, new, max_regression=None):
+    """Print p50/p95/p99/throughput changes. Returns True if p95 regressed beyond max_regression %."""
+    regressed = False
+    print(f"\nComparing against {old['git'].get('commit', '?')[:10]} ({old.get('timestamp')})")
+    for target, res in new["targets"].items():
+        old_res = old.get("targets", {}).get(target)
+        if not old_res:
+            continue
+        for name, r in res["endpoints"].items():
+            o = old_res["endpoints"].get(name)
+            if not o:
+                continue
+            parts = []
+            for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+                change = (r[key] - o[key]) / o[key] * 100 if o[key] else 0.0
+                parts.append(f"{key} {o[key]:.3f} -> {r[key]:.3f} ({change:+.1f}%)")
+                if key == "p95_ms" and max_regression is not None and change > max_regression:
+                    regressed = True
+            print(f"  {target:10s} {name:15s} " + "  ".join(parts))
+
+    for template, r in new.get("email_templates", {}).items():
+        o = old.get("email_templates", {}).get(template)
+        if not o or "error" in r or "error" in o:
+            continue
+        parts = []
+        for key in ("render_p50_ms", "message_p50_ms", "message_bytes"):
+            change = (r[key] - o[key]) / o[key] * 100 if o[key] else 0.0
+            parts.append(f"{key} {o[key]} -> {r[key]} ({change:+.1f}%)")
+        print(f"  email      {template:25s} " + "  ".join(parts))
+    return regressed
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark prediction and auth endpoints.")
+    p.add_argument("--target", choices=["testclient", "gunicorn", "both"], default="testclient")
+    p.add_argument("--requests", type=int, default=500, help="measured requests per endpoint")
+    p.add_argument("--slow-requests", type=int, default=50, help="measured requests for /login")
+    p.add_argument("--warmup", type=int, default=50, help="unmeasured requests per endpoint (per worker)")
+    p.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    p.add_argument("--concurrency", type=int, default=4, help="client threads for the gunicorn target")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--skip-email", action="store_true", help="don't measure email template rendering")
+    p.add_argument("--preload", action="store_true", help="start gunicorn with --preload")
+    p.add_argument("--startup-timeout", type=float, default=60.0)
+    p.add_argument("--output", help="result file (default: benchmark_results/<time>-<commit>.json)")
+    p.add_argument("--compare", help="earlier result file to compare with")
+    p.add_argument("--max-regression", type=float,
+                   help="with --compare: exit 1 if any p95 got worse by more than this many percent")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="wq-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    # gunicorn workers must sign / check tokens with the same key
+    os.environ.setdefault("SECRET_KEY", secrets.token_hex(16))
+    # one JSON line per request would flood the terminal and measure stdout
+    os.environ.setdefault("REQUEST_LOG_LEVEL", "WARNING")
+    # every request comes from one IP / one account; measure the routes, not 429s
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "False")
+    os.chdir(BACKEND_DIR)
+
+    started = datetime.now(timezone.utc)
+    result = {
+        "timestamp": started.isoformat(timespec="seconds"),
+        "git": git_info(),
+        "environment": environment_info(),
+        "config": vars(args),
+        "targets": {},
+    }
+
+    try:
+        app = load_app()
+        seed_user(app)
+
+        if not args.skip_email:
+            print("Email templates")
+            result["email_templates"] = run_email_templates(app, args)
+
+        if args.target in ("testclient", "both"):
+            print("Flask test client")
+            result["targets"]["testclient"] = run_testclient(app, args)
+
+        if args.target in ("gunicorn", "both"):
+            print(f"gunicorn ({args.workers} workers, {args.concurrency} client threads)")
+            env = dict(os.environ)
+            if "METRICS_MULTIPROC_DIR" not in env:
+                env["METRICS_MULTIPROC_DIR"] = os.path.join(workdir, "metrics")
+            result["targets"]["gunicorn"] = run_gunicorn(args, env, os.path.join(workdir, "gunicorn.log"))
+
+        output = args.output
+        if not output:
+            commit = (result["git"]["commit"] or "nogit")[:10]
+            output = os.path.join(RESULTS_DIR, f"{started:%Y%m%d-%H%M%S}-{commit}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+        # keep the server log when something failed, it has the tracebacks
+        gunicorn_result = result["targets"].get("gunicorn")
+        if gunicorn_result and any(r["errors"] for r in gunicorn_result["endpoints"].values()):
+            log_copy = os.path.splitext(output)[0] + ".gunicorn.log"
+            shutil.copy(os.path.join(workdir, "gunicorn.log"), log_copy)
+            print(f"⚠ Some requests failed, server log saved to {log_copy}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n📄 Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, result, args.max_regression):
+            print(f"❌ p95 regression above {args.max_regression}%")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
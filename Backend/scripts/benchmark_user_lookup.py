@@ -0,0 +1,244 @@
+"""
+Benchmark for the auth user lookups at scale.
+
+Seeds a SQLite database with --users accounts (default 1,000,000) and
+times the queries behind /login, /register, /forgot-password and
+/reset-password:
+
+  orm_entity       User.query.filter_by(email=...).first() (the old lookup:
+                   exact match, loads the whole row into a User object)
+  lower_no_index   lower(email) = :email without ix_user_email_lower (full scan)
+  lower_entity     lower(email) = :email, whole User object
+  exists           User.email_exists()      (register / forgot-password)
+  credentials      User.credentials_for()   (login: id, name, password only)
+
+Each lookup ends with session.remove(), like the end of a request. 90% of
+the lookups hit an existing user, in random letter case for the
+case-insensitive ones. The SQLite query plan of every statement is
+printed, so it is visible which ones use an index.
+
+Run from the Backend folder:
+    python scripts/benchmark_user_lookup.py
+    python scripts/benchmark_user_lookup.py --users 100000 --lookups 500
+    python scripts/benchmark_user_lookup.py --db /tmp/users-1m.db   # keep the seeded file for the next run
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from scripts.benchmark import RESULTS_DIR, summarize  # noqa: E402
+from services.build_info import git_info  # noqa: E402
+
+SEED_BATCH = 50000
+# looks like a real werkzeug hash, so rows have the real width
+FAKE_HASH = "pbkdf2:sha256:600000$" + "s" * 16 + "$" + "0" * 64
+
+
+def make_app(db_path):
+    """Just the database part of create_app() (no models to load, no blueprints)."""
+    from flask import Flask
+    from extensions import db
+    from services.db_pool import engine_options, init_db_pool
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        init_db_pool(app, db)
+    return app
+
+
+def user_email(i):
+    return f"user{i:07d}@example.com"
+
+
+def seed(users):
+    from extensions import db
+    from models.user import User
+
+    db.create_all()
+    have = db.session.query(db.func.count(User.id)).scalar()
+    if have == users:
+        print(f"Using existing {have:,} users")
+        return
+    if have:
+        raise SystemExit(f"❌ Database already has {have:,} users (wanted {users:,}); use another --db")
+
+    print(f"Seeding {users:,} users ...", flush=True)
+    start = time.perf_counter()
+    # bulk load first, the lookup index is built afterwards in main()
+    drop_lower_index()
+    table = User.__table__
+    now = datetime.utcnow()
+    for first in range(0, users, SEED_BATCH):
+        rows = [{"name": f"User {i}", "email": user_email(i), "password": FAKE_HASH, "created_at": now}
+                for i in range(first, min(first + SEED_BATCH, users))]
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+    db.session.execute(db.text("ANALYZE"))
+    db.session.commit()
+    print(f"  done in {time.perf_counter() - start:.1f}s")
+
+
+def drop_lower_index():
+    from extensions import db
+
+    db.session.execute(db.text("DROP INDEX IF EXISTS ix_user_email_lower"))
+    db.session.commit()
+
+
+def lookup_emails(users, count, rng):
+    """90% existing users, 10% unknown addresses."""
+    emails = []
+    for _ in range(count):
+        if rng.random() < 0.9:
+            emails.append(user_email(rng.randrange(users)))
+        else:
+            emails.append(f"nobody{rng.randrange(10 ** 9)}@example.org")
+    return emails
+
+
+def random_case(email, rng):
+    return "".join(c.upper() if rng.random() < 0.3 else c for c in email)
+
+
+def scenarios():
+    from extensions import db
+    from models.user import User
+
+    return {
+        "orm_entity": (lambda e: User.query.filter_by(email=e).first(),
+                       lambda: User.query.filter_by(email="x")),
+        "lower_entity": (lambda e: User.query.filter(User.email_matches(e)).first(),
+                         lambda: User.query.filter(User.email_matches("x"))),
+        "exists": (User.email_exists,
+                   lambda: db.session.query(User.id).filter(User.email_matches("x"))),
+        "credentials": (User.credentials_for,
+                        lambda: db.session.query(User.id, User.name, User.password).filter(User.email_matches("x"))),
+    }
+
+
+def query_plan(query):
+    from extensions import db
+
+    stmt = query.statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+    rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {stmt}")).fetchall()
+    db.session.remove()
+    return "; ".join(row[-1] for row in rows)
+
+
+def measure(fn, emails):
+    from extensions import db
+
+    latencies = []
+    start = time.perf_counter()
+    for email in emails:
+        t0 = time.perf_counter()
+        fn(email)
+        db.session.remove()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start, {})
+
+
+def format_row(name, r):
+    return (f"  {name:15s} p50 {r['p50_ms']:8.3f} ms  p95 {r['p95_ms']:8.3f} ms  "
+            f"mean {r['mean_ms']:8.3f} ms  {r['throughput_rps']:9.1f} lookups/s")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark auth user lookups on a large users table.")
+    p.add_argument("--users", type=int, default=1_000_000)
+    p.add_argument("--lookups", type=int, default=2000, help="measured lookups per indexed query")
+    p.add_argument("--scan-lookups", type=int, default=20, help="measured lookups for lower_no_index")
+    p.add_argument("--db", help="SQLite file to use / reuse (default: throwaway temp file)")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--output", help="result file (default: benchmark_results/<time>-<commit>-user-lookup.json)")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(BACKEND_DIR)
+    workdir = None
+    db_path = args.db
+    if not db_path:
+        workdir = tempfile.mkdtemp(prefix="wq-lookup-")
+        db_path = os.path.join(workdir, "users.db")
+    db_path = os.path.abspath(db_path)
+
+    from extensions import db
+    from models.user import User
+
+    rng = random.Random(args.seed)
+    app = make_app(db_path)
+    started = datetime.now(timezone.utc)
+    result = {
+        "timestamp": started.isoformat(timespec="seconds"),
+        "git": git_info(),
+        "config": vars(args),
+        "lookups": {},
+        "query_plans": {},
+    }
+
+    try:
+        with app.app_context():
+            seed(args.users)
+            emails = lookup_emails(args.users, args.lookups, rng)
+            mixed_case = [random_case(e, rng) for e in emails]
+
+            # full scan first: the functional index is dropped for this one
+            index = next(i for i in User.__table__.indexes if i.name == "ix_user_email_lower")
+            drop_lower_index()
+            plan = query_plan(User.query.filter(User.email_matches("x")))
+            result["query_plans"]["lower_no_index"] = plan
+            result["lookups"]["lower_no_index"] = measure(
+                lambda e: User.query.filter(User.email_matches(e)).first(), mixed_case[:args.scan_lookups])
+            print(format_row("lower_no_index", result["lookups"]["lower_no_index"]) + f"   [{plan}]")
+
+            print("Creating ix_user_email_lower ...", flush=True)
+            index.create(db.engine)
+            db.session.execute(db.text("ANALYZE"))
+            db.session.commit()
+
+            for name, (fn, plan_query) in scenarios().items():
+                plan = query_plan(plan_query())
+                result["query_plans"][name] = plan
+                measure(fn, (mixed_case if name != "orm_entity" else emails)[:100])  # warm-up
+                r = measure(fn, emails if name == "orm_entity" else mixed_case)
+                result["lookups"][name] = r
+                print(format_row(name, r) + f"   [{plan}]")
+            db.session.remove()
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        if workdir:
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(db_path + suffix)
+                except OSError:
+                    pass
+            os.rmdir(workdir)
+
+    output = args.output
+    if not output:
+        commit = (result["git"]["commit"] or "nogit")[:10]
+        output = os.path.join(RESULTS_DIR, f"{started:%Y%m%d-%H%M%S}-{commit}-user-lookup.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n📄 Results saved to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
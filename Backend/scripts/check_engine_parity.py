@@ -0,0 +1,83 @@
+"""
+Parity check: compiled tree engine vs original estimator.predict.
+
+Runs both models over the rows of the two datasets and fails (exit code 1)
+if any predicted label differs.
+
+Run from the Backend folder:
+    python scripts/check_engine_parity.py
+"""
+import csv
+import os
+import sys
+import warnings
+
+import joblib
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+from services.tree_engine import compile_model  # noqa: E402
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+
+MODELS_DIR = os.path.join(BACKEND_DIR, 'ml_models')
+DATASET_DIR = os.path.join(BACKEND_DIR, '..', 'Dataset')
+
+TAP_COLUMNS = ["ph", "Hardness", "Chloramines", "Sulfate", "Turbidity"]
+
+
+def load_tap_rows():
+    """water_potability.csv -> (n, 5) float array (NaN for blanks, imputed by the pipeline)."""
+    path = os.path.join(DATASET_DIR, 'water_potability.csv')
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    return np.array(
+        [[float(r[c]) if r[c] else np.nan for c in TAP_COLUMNS] for r in rows],
+        dtype=np.float64,
+    )
+
+
+def load_river_rows():
+    """
+    Complete_Dataset.csv -> (n, 8) float array.
+    Each station gives two samples (its Min and its Max readings) for the
+    8 model parameters (columns 3..18). Rows with BDL / blank values are skipped.
+    """
+    path = os.path.join(DATASET_DIR, 'Complete_Dataset.csv')
+    samples = []
+    with open(path, newline='', encoding='cp1252') as f:
+        reader = csv.reader(f)
+        next(reader)  # parameter names
+        next(reader)  # Min / Max
+        for row in reader:
+            for offset in (0, 1):
+                try:
+                    samples.append([float(row[3 + 2 * i + offset]) for i in range(8)])
+                except ValueError:
+                    continue
+    return np.array(samples, dtype=np.float64)
+
+
+def check(name, estimator, X):
+    compiled = compile_model(estimator)
+    expected = estimator.predict(X)
+    actual = compiled.predict(X)
+    mismatches = int((expected != actual).sum())
+    print(f"{name}: {len(X)} rows, {mismatches} mismatches")
+    return mismatches
+
+
+if __name__ == '__main__':
+    model = joblib.load(os.path.join(MODELS_DIR, 'best_water_model.pkl'))
+    tap_model = joblib.load(os.path.join(MODELS_DIR, 'tap_water.pkl'))
+
+    failures = 0
+    failures += check('best_water_model.pkl / Complete_Dataset.csv', model, load_river_rows())
+    failures += check('tap_water.pkl / water_potability.csv', tap_model, load_tap_rows())
+
+    if failures:
+        print('❌ Compiled engine does not match estimator.predict')
+        sys.exit(1)
+    print('✅ Compiled engine matches estimator.predict')
@@ -0,0 +1,153 @@
+"""
+Import-time profile of the backend (what a new gunicorn worker pays before
+it can serve).
+
+Starts `python -X importtime -c "import app"` --runs times in a fresh
+process, against a throwaway SQLite database, and reports:
+  - wall time until create_app() returned (median over the runs)
+  - total import time of `app`
+  - the slowest top-level imports (cumulative) and modules (self time)
+
+Results are written as JSON next to the other benchmark results so boot
+time can be tracked across commits (--compare).
+
+Run from the Backend folder:
+    python scripts/profile_startup.py
+    python scripts/profile_startup.py --runs 5 --top 25
+    python scripts/profile_startup.py --env MODEL_LOADING=eager      # boot incl. model loading
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from scripts.benchmark import RESULTS_DIR  # noqa: E402
+from services.build_info import git_info  # noqa: E402
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)\s*$")
+# printed by the child once create_app() has returned
+PROBE = (
+    "import time; t0 = time.perf_counter(); import app; "
+    "print('BOOT_SECONDS', time.perf_counter() - t0, flush=True)"
+)
+
+
+def parse_importtime(stderr):
+    """-X importtime lines -> list of (module, self_us, cumulative_us, depth)."""
+    rows = []
+    for line in stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m:
+            depth = (len(m.group(3)) - 1) // 2
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), depth))
+    return rows
+
+
+def run_once(env):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, timeout=300)
+    boot = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("BOOT_SECONDS"):
+            boot = float(line.split()[1])
+    if proc.returncode != 0 or boot is None:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise SystemExit(f"❌ App import failed (exit code {proc.returncode})")
+    return boot, parse_importtime(proc.stderr)
+
+
+def summarize(runs, top):
+    boots = [b for b, _ in runs]
+    # module timings from the median run
+    _, rows = sorted(runs, key=lambda r: r[0])[len(runs) // 2]
+    app_row = next((r for r in rows if r[0] == "app"), None)
+    # top-level = imported directly by app.py (depth 1 below it), plus
+    # anything imported later by create_app() at depth 0
+    top_level = [r for r in rows if r[0] != "app" and r[3] <= 1]
+    return {
+        "boot_seconds_median": round(statistics.median(boots), 3),
+        "boot_seconds": [round(b, 3) for b in boots],
+        "app_import_ms": round(app_row[2] / 1000, 1) if app_row else None,
+        "modules_imported": len(rows),
+        "top_cumulative": [{"module": n, "cumulative_ms": round(c / 1000, 1)}
+                           for n, _, c, _ in sorted(top_level, key=lambda r: -r[2])[:top]],
+        "top_self": [{"module": n, "self_ms": round(s / 1000, 1)}
+                     for n, s, _, _ in sorted(rows, key=lambda r: -r[1])[:top]],
+    }
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Import-time / boot-time profile of app.py.")
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--top", type=int, default=15)
+    p.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                   help="extra environment for the app process (repeatable)")
+    p.add_argument("--output", help="result file (default: benchmark_results/<time>-<commit>-startup.json)")
+    p.add_argument("--compare", help="earlier startup result to compare with")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="wq-startup-")
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    env.setdefault("REQUEST_LOG_LEVEL", "WARNING")
+    # the background warm-up starts when create_app() is done; its imports
+    # would interleave with (and distort) the import profile of the boot
+    env.setdefault("MODEL_LOADING", "lazy")
+    for item in args.env:
+        name, _, value = item.partition("=")
+        env[name] = value
+
+    started = datetime.now(timezone.utc)
+    try:
+        runs = [run_once(env) for _ in range(args.runs)]
+    finally:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+    result = {
+        "timestamp": started.isoformat(timespec="seconds"),
+        "git": git_info(),
+        "config": vars(args),
+        "startup": summarize(runs, args.top),
+    }
+    s = result["startup"]
+    print(f"Boot (import app + create_app): median {s['boot_seconds_median']:.3f}s  runs {s['boot_seconds']}")
+    print(f"Import of app: {s['app_import_ms']} ms, {s['modules_imported']} modules")
+    print("\nSlowest top-level imports (cumulative):")
+    for r in s["top_cumulative"]:
+        print(f"  {r['cumulative_ms']:9.1f} ms  {r['module']}")
+    print("\nSlowest modules (self):")
+    for r in s["top_self"]:
+        print(f"  {r['self_ms']:9.1f} ms  {r['module']}")
+
+    output = args.output
+    if not output:
+        commit = (result["git"]["commit"] or "nogit")[:10]
+        output = os.path.join(RESULTS_DIR, f"{started:%Y%m%d-%H%M%S}-{commit}-startup.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n📄 Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)["startup"]
+        change = (s["boot_seconds_median"] - old["boot_seconds_median"]) / old["boot_seconds_median"] * 100
+        print(f"Boot median {old['boot_seconds_median']:.3f}s -> {s['boot_seconds_median']:.3f}s ({change:+.1f}%)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
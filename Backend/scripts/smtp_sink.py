@@ -0,0 +1,128 @@
+"""
+Local SMTP stand-in for testing the mail queue (same role as
+`python -m aiosmtpd -n`, without the extra dependency).
+
+Accepts EHLO / AUTH / MAIL / RCPT / DATA and prints one line per received
+message. --fail-rate makes it answer some DATA commands with a temporary
+error (451) so retries can be tested, --save-dir writes every message as
+a .eml file.
+
+Run from the Backend folder:
+    python scripts/smtp_sink.py --port 8025
+and start the app with
+    MAIL_SERVER=127.0.0.1 MAIL_PORT=8025 MAIL_USE_TLS=False
+"""
+import argparse
+import os
+import random
+import socketserver
+import threading
+import time
+
+received = []
+_lock = threading.Lock()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    fail_rate = 0.0
+    save_dir = None
+    delay = 0.0
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        self.reply("220 smtp-sink ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-smtp-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == "AUTH":
+                # accept any credentials; LOGIN needs two more lines
+                if command.upper().startswith("AUTH LOGIN"):
+                    self.reply("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                self.reply("235 Authentication successful")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                if self.delay:
+                    time.sleep(self.delay)
+                if random.random() < self.fail_rate:
+                    self.reply("451 Temporary failure, try again later")
+                    continue
+                self.store(sender, recipients, b"".join(data))
+                self.reply("250 OK queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def store(self, sender, recipients, data):
+        with _lock:
+            received.append((sender, recipients, data))
+            count = len(received)
+        subject = next((l[9:].strip() for l in data.decode("utf-8", "replace").splitlines()
+                        if l.lower().startswith("subject: ")), "")
+        print(f"📧 #{count} {sender} -> {', '.join(recipients)}  {subject}  ({len(data)} bytes)", flush=True)
+        if self.save_dir:
+            with open(os.path.join(self.save_dir, f"{count:05d}.eml"), "wb") as f:
+                f.write(data)
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(host="127.0.0.1", port=8025, fail_rate=0.0, save_dir=None, delay=0.0):
+    """Start the sink in a background thread (for scripts); returns the server."""
+    handler = type("Handler", (SMTPHandler,), {"fail_rate": fail_rate, "save_dir": save_dir, "delay": delay})
+    server = SMTPSink((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="smtp-sink", daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Local SMTP stand-in that accepts and prints mail.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8025)
+    p.add_argument("--fail-rate", type=float, default=0.0, help="fraction of messages answered with 451")
+    p.add_argument("--delay", type=float, default=0.0, help="seconds to wait before accepting each message")
+    p.add_argument("--save-dir", help="write received messages as .eml files here")
+    args = p.parse_args()
+
+    if args.save_dir:
+        os.makedirs(args.save_dir, exist_ok=True)
+    server = serve(args.host, args.port, args.fail_rate, args.save_dir, args.delay)
+    print(f"✅ SMTP sink listening on {args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,351 @@
+"""
+Offline training for the served models, straight from Dataset/.
+
+  river  best_water_model.pkl + label_encoder.pkl (8 features -> Clean / Moderate / Polluted)
+         from Dataset/Complete_Dataset.csv (read with services/river_dataset.py)
+  tap    tap_water.pkl (5 features -> Low / Average / High)
+         from Dataset/water_potability.csv
+
+Same steps as the notebooks in "ML Model/": median imputation of missing
+values (Dataset/Readme.md; BDL counts as missing, as in the notebook),
+rule-based labels, stratified 80/20 split, grid search with k-fold CV,
+and for the river model a stacking ensemble (tuned RF + tuned XGBoost +
+SVM) that is kept only if it beats the tuned RF on the test split.
+
+The grid search / CV / stacking fits run in a process pool (joblib's loky
+workers, --jobs, default all cores). Splits and estimators are all seeded
+with --seed and each estimator runs single-threaded, so the same data and
+seed give the same models whatever --jobs is.
+
+Output: one versioned bundle per model (services/model_bundle.py),
+ml_models/bundles/main/<version>/ and ml_models/bundles/tap/<version>/,
+each with the estimator(s) and a manifest.json: feature order and ranges,
+classes, file checksums, training data hash, library versions, best
+params, CV scores and test metrics. --promote points the bundles' CURRENT
+at the new version; the running app picks it up through
+MODEL_WATCH_INTERVAL or POST /admin/reload.
+
+Run from the Backend folder:
+    python scripts/train_models.py
+    python scripts/train_models.py --models tap --seed 7 --jobs 4
+    python scripts/train_models.py --quick            # small grids, for a smoke test
+    python scripts/train_models.py --promote
+    python scripts/train_models.py --promote-version 20261017-031500   # roll back / forward
+"""
+import argparse
+import importlib.metadata
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.build_info import git_info  # noqa: E402
+from services.model_bundle import (MODEL_BUNDLE_DIR, activate, feature_spec, sha256_file,  # noqa: E402
+                                   write_bundle)
+from services.river_dataset import MAX, MIN, RIVER_DATASET_PATH, as_float64, load_river_dataset  # noqa: E402
+
+TAP_DATASET_PATH = os.path.join(BACKEND_DIR, '..', 'Dataset', 'water_potability.csv')
+# CLI model name -> bundle (= model registry) name
+BUNDLE_NAMES = {"river": "main", "tap": "tap"}
+
+# river features: dataset keys -> training column names (what the served
+# model reports as feature_names_in_), in the API's order
+RIVER_FEATURES = [
+    ("temperature", "Temperature (°C)"),
+    ("dissolvedOxygen", "Dissolved Oxygen (mg/L)"),
+    ("ph", "pH"),
+    ("conductivity", "Conductivity (µmho/cm)"),
+    ("bod", "BOD (mg/L)"),
+    ("nitrate", "Nitrate N (mg/L)"),
+    ("fecalColiform", "Fecal Coliform (MPN/100ml)"),
+    ("totalColiform", "Total Coliform (MPN/100ml)"),
+]
+TAP_FEATURES = ["ph", "Hardness", "Chloramines", "Sulfate", "Turbidity"]
+# (low, high) per tap feature; below -> Low, above -> High
+TAP_RANGES = {
+    "ph": (5.11, 9.07),
+    "Hardness": (154.5, 235.8),
+    "Chloramines": (5.19, 9.14),
+    "Sulfate": (283.2, 384.8),
+    "Turbidity": (2.94, 4.96),
+}
+
+RIVER_RF_GRID = {"n_estimators": [100, 200], "max_depth": [None, 8, 12], "min_samples_split": [2, 5]}
+RIVER_XGB_GRID = {"n_estimators": [100, 200], "max_depth": [3, 5], "learning_rate": [0.05, 0.1]}
+TAP_GRID = {"clf__n_estimators": [100, 200], "clf__max_depth": [None, 10, 20]}
+QUICK_GRIDS = {
+    "river_rf": {"n_estimators": [50], "max_depth": [None, 8]},
+    "river_xgb": {"n_estimators": [50], "max_depth": [3]},
+    "tap": {"clf__n_estimators": [50], "clf__max_depth": [None, 10]},
+}
+
+TRAINING_PACKAGES = ("scikit-learn", "xgboost", "numpy", "pandas", "joblib")
+
+
+def library_versions():
+    versions = {"python": sys.version.split()[0]}
+    for dist in TRAINING_PACKAGES:
+        try:
+            versions[dist] = importlib.metadata.version(dist)
+        except importlib.metadata.PackageNotFoundError:
+            versions[dist] = None
+    return versions
+
+
+def label_counts(y):
+    values, counts = np.unique(y, return_counts=True)
+    return {str(v): int(c) for v, c in zip(values, counts)}
+
+
+def fill_median(values, axis=0):
+    """NaNs -> median of their column (median imputation, Dataset/Readme.md)."""
+    values = np.array(values, dtype=np.float64)
+    medians = np.nanmedian(values, axis=axis, keepdims=True)
+    return np.where(np.isnan(values), medians, values)
+
+
+# ------------------------------------------------------------
+# Data + labels
+# ------------------------------------------------------------
+def river_labels(X):
+    """The notebook's pollution_status() rules on a (rows, 8) feature array."""
+    t, do, ph, cond, bod, nitrate, fecal, total = X.T
+    with np.errstate(invalid="ignore"):
+        clean = ((t <= 25) & (do >= 6) & (ph >= 6.5) & (ph <= 8.5) & (cond <= 500) & (bod <= 3)
+                 & (nitrate <= 10) & (fecal <= 0) & (total <= 0))
+        moderate = ((t <= 35) & (do >= 5) & (ph >= 6.0) & (ph <= 9.0) & (cond <= 3000) & (bod <= 5)
+                    & (nitrate <= 45) & (fecal <= 2500) & (total <= 500))
+    return np.where(clean, "Clean", np.where(moderate, "Moderate", "Polluted"))
+
+
+def load_river(path):
+    """(X DataFrame, string labels, data info) for the river model."""
+    import pandas as pd
+
+    # BDL -> NaN, imputed like every other gap (what the notebook's to_numeric did)
+    dataset = load_river_dataset(path, bdl_value=np.nan)
+    idx = [dataset.parameters.index(key) for key, _ in RIVER_FEATURES]
+    # impute every Min / Max column, then average the two
+    lo = fill_median(as_float64(dataset.values[MIN, idx].T))
+    hi = fill_median(as_float64(dataset.values[MAX, idx].T))
+    X = (lo + hi) / 2
+    y = river_labels(X)
+    info = {"path": os.path.relpath(os.path.abspath(path), BACKEND_DIR), "sha256": sha256_file(path),
+            "rows": len(X), "stations": len(dataset.station_codes)}
+    return pd.DataFrame(X, columns=[name for _, name in RIVER_FEATURES]), y, info
+
+
+def tap_labels(X):
+    """The notebook's get_status() rules: any High -> High, else any Low -> Low, else Average."""
+    low = np.array([TAP_RANGES[f][0] for f in TAP_FEATURES])
+    high = np.array([TAP_RANGES[f][1] for f in TAP_FEATURES])
+    return np.where((X > high).any(axis=1), "High", np.where((X < low).any(axis=1), "Low", "Average"))
+
+
+def load_tap(path):
+    import pandas as pd
+
+    raw = pd.read_csv(path, usecols=TAP_FEATURES)[TAP_FEATURES]
+    X = fill_median(raw.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64))
+    y = tap_labels(X)
+    info = {"path": os.path.relpath(os.path.abspath(path), BACKEND_DIR), "sha256": sha256_file(path),
+            "rows": len(X)}
+    return pd.DataFrame(X, columns=TAP_FEATURES), y, info
+
+
+# ------------------------------------------------------------
+# Training
+# ------------------------------------------------------------
+def grid_search(estimator, grid, X, y, cv, jobs):
+    from sklearn.model_selection import GridSearchCV
+
+    search = GridSearchCV(estimator, grid, cv=cv, scoring="accuracy", n_jobs=jobs, refit=True)
+    search.fit(X, y)
+    results = search.cv_results_
+    candidates = [
+        {"params": results["params"][i], "mean_accuracy": round(float(results["mean_test_score"][i]), 6),
+         "std_accuracy": round(float(results["std_test_score"][i]), 6)}
+        for i in range(len(results["params"]))
+    ]
+    summary = {"best_params": search.best_params_, "best_cv_accuracy": round(float(search.best_score_), 6),
+               "candidates": candidates}
+    return search.best_estimator_, summary
+
+
+def evaluate(model, X_test, y_test, classes):
+    from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+
+    pred = model.predict(X_test)
+    labels = list(range(len(classes))) if np.issubdtype(np.asarray(y_test).dtype, np.integer) else list(classes)
+    report = classification_report(y_test, pred, labels=labels, target_names=[str(c) for c in classes],
+                                   output_dict=True, zero_division=0)
+    return {
+        "accuracy": round(float(accuracy_score(y_test, pred)), 6),
+        "per_class": {str(c): {k: round(float(v), 6) for k, v in report[str(c)].items()} for c in classes},
+        "confusion_matrix": {"labels": [str(c) for c in classes],
+                             "rows": confusion_matrix(y_test, pred, labels=labels).tolist()},
+    }
+
+
+def train_river(args, grids):
+    from sklearn.ensemble import RandomForestClassifier, StackingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import StratifiedKFold, train_test_split
+    from sklearn.preprocessing import LabelEncoder
+    from sklearn.svm import SVC
+    from xgboost import XGBClassifier
+
+    X, labels, data = load_river(args.river_data)
+    le = LabelEncoder()
+    y = le.fit_transform(labels)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=args.seed, stratify=y)
+    skf = StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=args.seed)
+
+    data["labels"] = label_counts(labels)
+    print(f"River: {len(X)} rows, labels {data['labels']}", flush=True)
+    best_rf, rf_search = grid_search(RandomForestClassifier(random_state=args.seed, n_jobs=1),
+                                     grids["river_rf"], X_train, y_train, skf, args.jobs)
+    print(f"  RF  best {rf_search['best_params']} cv {rf_search['best_cv_accuracy']:.4f}", flush=True)
+    best_xgb, xgb_search = grid_search(XGBClassifier(random_state=args.seed, n_jobs=1),
+                                       grids["river_xgb"], X_train, y_train, skf, args.jobs)
+    print(f"  XGB best {xgb_search['best_params']} cv {xgb_search['best_cv_accuracy']:.4f}", flush=True)
+
+    stacking = StackingClassifier(
+        estimators=[("rf", best_rf), ("xgb", best_xgb),
+                    ("svm", SVC(probability=True, kernel="rbf", C=1.0, gamma="scale", random_state=args.seed))],
+        final_estimator=LogisticRegression(max_iter=1000, random_state=args.seed),
+        cv=skf, stack_method="predict_proba", n_jobs=args.jobs,
+    )
+    stacking.fit(X_train, y_train)
+    # fitted; the worker count is not part of the model (keeps the pickle identical across --jobs)
+    stacking.set_params(n_jobs=None)
+
+    rf_test = evaluate(best_rf, X_test, y_test, le.classes_)
+    stacking_test = evaluate(stacking, X_test, y_test, le.classes_)
+    use_stacking = stacking_test["accuracy"] >= rf_test["accuracy"]
+    model = stacking if use_stacking else best_rf
+    print(f"  test accuracy: RF {rf_test['accuracy']:.4f}, stacking {stacking_test['accuracy']:.4f} "
+          f"-> {'Stacking' if use_stacking else 'RandomForest'}", flush=True)
+
+    return {"model": model, "label_encoder": le}, {
+        "estimator": type(model).__name__,
+        "features": [feature_spec(key, column, X[column]) for key, column in RIVER_FEATURES],
+        "classes": [str(c) for c in le.classes_],
+        "labels": "label_encoder",
+        "training_data": data,
+        "metrics": {
+            "split": {"test_size": 0.2, "train_rows": len(X_train), "test_rows": len(X_test), "folds": args.folds},
+            "search": {"random_forest": rf_search, "xgboost": xgb_search},
+            "test": {"selected": stacking_test if use_stacking else rf_test,
+                     "random_forest": rf_test, "stacking": stacking_test},
+        },
+    }
+
+
+def train_tap(args, grids):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.impute import SimpleImputer
+    from sklearn.model_selection import StratifiedKFold, train_test_split
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    X, y, data = load_tap(args.tap_data)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=args.seed, stratify=y)
+    data["labels"] = label_counts(y)
+    print(f"Tap: {len(X)} rows, labels {data['labels']}", flush=True)
+    pipeline = Pipeline([
+        ("imputer", SimpleImputer(strategy="median")),
+        ("scaler", StandardScaler()),
+        ("clf", RandomForestClassifier(random_state=args.seed, n_jobs=1)),
+    ])
+    # the notebook used cv=5, i.e. unshuffled stratified folds
+    model, search = grid_search(pipeline, grids["tap"], X_train, y_train,
+                                StratifiedKFold(n_splits=args.folds), args.jobs)
+    test = evaluate(model, X_test, y_test, model.classes_)
+    print(f"  best {search['best_params']} cv {search['best_cv_accuracy']:.4f} "
+          f"test {test['accuracy']:.4f}", flush=True)
+    return {"model": model}, {
+        "estimator": type(model).__name__,
+        "features": [feature_spec(f, f, X[f]) for f in TAP_FEATURES],
+        "classes": [str(c) for c in model.classes_],
+        "labels": "estimator",
+        "training_data": data,
+        "metrics": {
+            "split": {"test_size": 0.2, "train_rows": len(X_train), "test_rows": len(X_test), "folds": args.folds},
+            "search": {"random_forest": search},
+            "test": {"selected": test},
+        },
+    }
+
+
+TRAINERS = {"river": train_river, "tap": train_tap}
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Train the river and tap models from Dataset/.")
+    p.add_argument("--models", default="river,tap", help="comma separated: river, tap")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes for CV / search")
+    p.add_argument("--folds", type=int, default=5)
+    p.add_argument("--river-data", default=RIVER_DATASET_PATH)
+    p.add_argument("--tap-data", default=TAP_DATASET_PATH)
+    p.add_argument("--version", help="artifact version (default: UTC time, YYYYmmdd-HHMMSS)")
+    p.add_argument("--bundle-dir", default=MODEL_BUNDLE_DIR)
+    p.add_argument("--quick", action="store_true", help="tiny hyperparameter grids (smoke test)")
+    p.add_argument("--promote", action="store_true", help="serve the new bundles (update CURRENT)")
+    p.add_argument("--promote-version", metavar="VERSION",
+                   help="don't train; make an existing VERSION current for --models")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    unknown = [m for m in models if m not in TRAINERS]
+    if unknown:
+        raise SystemExit(f"❌ Unknown model(s): {', '.join(unknown)} (use river, tap)")
+
+    if args.promote_version:
+        for name in models:
+            activate(BUNDLE_NAMES[name], args.promote_version, root=args.bundle_dir)
+            print(f"✅ {BUNDLE_NAMES[name]} now serves {args.promote_version}")
+        return 0
+
+    started = datetime.now(timezone.utc)
+    version = args.version or f"{started:%Y%m%d-%H%M%S}"
+    for name in models:
+        if os.path.exists(os.path.join(args.bundle_dir, BUNDLE_NAMES[name], version)):
+            raise SystemExit(f"❌ Bundle {BUNDLE_NAMES[name]}/{version} already exists; pick another --version")
+
+    grids = QUICK_GRIDS if args.quick else {"river_rf": RIVER_RF_GRID, "river_xgb": RIVER_XGB_GRID, "tap": TAP_GRID}
+    common = {
+        "created_at": started.isoformat(timespec="seconds"),
+        "seed": args.seed,
+        "quick": args.quick,
+        "git": git_info(),
+        "libraries": library_versions(),
+    }
+    trained = {}
+    for name in models:
+        start = time.perf_counter()
+        objects, manifest = TRAINERS[name](args, grids)
+        manifest["metrics"]["train_seconds"] = round(time.perf_counter() - start, 2)
+        trained[name] = (objects, dict(common, **manifest))
+
+    # written only once everything trained, so a failed run leaves no partial bundles
+    for name, (objects, manifest) in trained.items():
+        bundle_dir = write_bundle(BUNDLE_NAMES[name], version, objects, manifest, root=args.bundle_dir)
+        print(f"📄 {name}: bundle written to {bundle_dir}")
+        if args.promote:
+            activate(BUNDLE_NAMES[name], version, root=args.bundle_dir)
+            print(f"✅ {BUNDLE_NAMES[name]} now serves {version}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""
+Which code produced a result: the git commit of the Backend checkout.
+
+Recorded in benchmark / profiling results and in the manifest of trained
+model bundles, so a number or a model can be traced back to its source.
+"""
+import os
+import subprocess
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def git_info(cwd=BACKEND_DIR):
+    """{"commit": HEAD sha, "dirty": uncommitted changes to tracked files}; None values outside git."""
+    def git(*cmd):
+        try:
+            return subprocess.check_output(["git", *cmd], cwd=cwd, stderr=subprocess.DEVNULL,
+                                           text=True).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
@@ -0,0 +1,156 @@
+"""
+Database engine options and connection pool metrics.
+
+engine_options(uri) builds SQLALCHEMY_ENGINE_OPTIONS from env so the
+MySQL pool can be sized per deployment (one pool per gunicorn worker, so
+total connections = workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW); keep that
+below the server's max_connections).
+
+Every pool checkout is timed into db_pool_checkout_seconds. Checkouts that
+found the pool at its limit count as db_pool_saturated_total, checkouts
+that gave up after DB_POOL_TIMEOUT as db_pool_timeouts_total. Gauges for
+connections in use / idle are exported on /metrics as well.
+
+The SQLite fallback gets WAL journaling and a busy timeout, so readers do
+not block the writer and parallel workers wait instead of failing with
+"database is locked".
+
+Config (env):
+  DB_POOL_SIZE            connections kept open per process (default 5)
+  DB_MAX_OVERFLOW         extra connections allowed under load (default 10)
+  DB_POOL_TIMEOUT         seconds to wait for a free connection (default 10)
+  DB_POOL_RECYCLE         reconnect connections older than this (default 280,
+                          below MySQL's usual wait_timeout on hosted plans)
+  DB_POOL_PRE_PING        test a connection before handing it out (default True)
+  DB_CONNECT_TIMEOUT      seconds to open a new connection (default 10)
+  DB_STATEMENT_TIMEOUT_MS MySQL MAX_EXECUTION_TIME for SELECTs (default 0 = off)
+  SQLITE_JOURNAL_MODE     default WAL
+  SQLITE_SYNCHRONOUS      default NORMAL (safe with WAL)
+  SQLITE_BUSY_TIMEOUT_MS  default 5000
+  SQLITE_CACHE_SIZE_KB    page cache per connection (default 16384)
+"""
+import os
+import time
+
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from services.metrics import describe, store
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 280))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 10))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 16384))
+
+describe("db_pool_checkout_seconds", "histogram", "Time to get a connection from the pool.")
+describe("db_pool_saturated_total", "counter", "Checkouts that found every pool connection in use.")
+describe("db_pool_timeouts_total", "counter", "Checkouts that timed out waiting for a connection.")
+describe("db_pool_checked_out", "gauge", "Connections currently in use.")
+describe("db_pool_idle", "gauge", "Open connections waiting in the pool.")
+describe("db_pool_overflow", "gauge", "Connections open beyond DB_POOL_SIZE.")
+
+
+def _is_sqlite(url):
+    return url.get_backend_name() == "sqlite"
+
+
+def _is_sqlite_memory(url):
+    return _is_sqlite(url) and url.database in (None, "", ":memory:")
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports checkout latency, saturation and timeouts."""
+
+    def _do_get(self):
+        limit = self.size() + self._max_overflow
+        saturated = self._max_overflow > -1 and self.checkedout() >= limit
+        if saturated:
+            store.inc("db_pool_saturated_total", ())
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            store.inc("db_pool_timeouts_total", ())
+            raise
+        finally:
+            store.observe("db_pool_checkout_seconds", (), time.perf_counter() - start)
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for `uri`."""
+    url = make_url(uri)
+
+    if _is_sqlite_memory(url):
+        # Flask-SQLAlchemy uses a single shared connection (StaticPool) here
+        return {}
+
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+    if _is_sqlite(url):
+        # a local file can't drop the connection, so no pre-ping round trip
+        options["pool_pre_ping"] = False
+        # sqlite3's own lock wait; the busy_timeout pragma below is the same in ms
+        options["connect_args"] = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+        return options
+
+    options["pool_recycle"] = DB_POOL_RECYCLE
+    connect_args = {"connect_timeout": DB_CONNECT_TIMEOUT}
+    if url.get_backend_name() == "mysql" and DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["init_command"] = f"SET SESSION MAX_EXECUTION_TIME={DB_STATEMENT_TIMEOUT_MS}"
+    options["connect_args"] = connect_args
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, _record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def _update_gauges(pool):
+    store.set("db_pool_checked_out", (), pool.checkedout())
+    store.set("db_pool_idle", (), pool.checkedin())
+    store.set("db_pool_overflow", (), max(pool.overflow(), 0))
+
+
+def init_db_pool(app, db):
+    """Hook pool gauges and SQLite pragmas onto the app's engine. Needs an app context."""
+    engine = db.engine
+
+    if _is_sqlite(engine.url) and not _is_sqlite_memory(engine.url):
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+
+    if isinstance(engine.pool, QueuePool):
+        @event.listens_for(engine, "checkout")
+        def _on_checkout(_dbapi_connection, _record, _proxy):
+            _update_gauges(engine.pool)
+
+        @event.listens_for(engine, "checkin")
+        def _on_checkin(_dbapi_connection, _record):
+            _update_gauges(engine.pool)
+
+        pool = engine.pool
+        print(f"✅ DB pool: size={pool.size()} max_overflow={pool._max_overflow} "
+              f"timeout={pool._timeout}s ({engine.url.get_backend_name()})")
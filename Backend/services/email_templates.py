@@ -0,0 +1,139 @@
+"""
+Email templates.
+
+Every `templates/emails/<name>.html` (except base.html and files starting
+with "_") is an email. They are compiled once by init_email_templates()
+at startup and rendered from that cache; adding an email means dropping a
+new template in the folder and calling build_message("<name>", recipients, **context).
+
+A template sets its subject at the top:
+    {% extends "base.html" %}
+    {% set subject = "Hello " ~ name %}
+
+The plain-text part comes from `<name>.txt` when it exists, otherwise it
+is generated from the rendered HTML.
+"""
+import html
+import os
+import re
+import threading
+from html.parser import HTMLParser
+
+from flask_mail import Message
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "templates", "emails")
+LAYOUT_TEMPLATES = {"base.html"}
+
+
+class _TextExtractor(HTMLParser):
+    """HTML -> readable plain text (block tags become line breaks, links keep their URL)."""
+
+    BLOCK_TAGS = {"p", "div", "h1", "h2", "h3", "h4", "tr", "li", "hr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._href = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "br":
+            self.parts.append("\n")
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n\n")
+        elif tag == "a":
+            self._href = dict(attrs).get("href")
+
+    def handle_endtag(self, tag):
+        if tag in self.BLOCK_TAGS:
+            self.parts.append("\n\n")
+        elif tag == "a" and self._href:
+            self.parts.append(f" ({self._href})")
+            self._href = None
+
+    def handle_data(self, data):
+        self.parts.append(re.sub(r"\s+", " ", data))
+
+    def text(self):
+        text = "".join(self.parts)
+        lines = [line.strip() for line in text.split("\n")]
+        text = "\n".join(lines)
+        return re.sub(r"\n{3,}", "\n\n", text).strip() + "\n"
+
+
+def html_to_text(markup):
+    parser = _TextExtractor()
+    parser.feed(markup)
+    parser.close()
+    return html.unescape(parser.text())
+
+
+class EmailTemplates:
+    """
+    load()                      -- compile every template in the folder
+    names()                     -- available email names
+    render(template, **context) -- (subject, html, text)
+    """
+
+    def __init__(self, folder=TEMPLATES_DIR):
+        self.folder = folder
+        self.env = Environment(
+            loader=FileSystemLoader(folder),
+            autoescape=select_autoescape(["html"]),
+            # missing context values should fail loudly, not send "Hello ,"
+            undefined=StrictUndefined,
+            auto_reload=False,
+            cache_size=-1,
+        )
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        templates = {}
+        for filename in sorted(os.listdir(self.folder)):
+            name, ext = os.path.splitext(filename)
+            if ext != ".html" or filename in LAYOUT_TEMPLATES or filename.startswith("_"):
+                continue
+            text_file = f"{name}.txt"
+            templates[name] = (
+                self.env.get_template(filename),
+                self.env.get_template(text_file) if os.path.exists(os.path.join(self.folder, text_file)) else None,
+            )
+        with self._lock:
+            self._templates = templates
+        return list(templates)
+
+    def names(self):
+        return list(self._templates)
+
+    def render(self, template, **context):
+        if not self._templates:
+            self.load()
+        try:
+            html_template, text_template = self._templates[template]
+        except KeyError:
+            raise ValueError(f"Unknown email template '{template}' (have: {', '.join(self._templates)})")
+
+        module = html_template.make_module(context)
+        body_html = str(module)
+        subject = getattr(module, "subject", "")
+        if text_template is not None:
+            body_text = text_template.render(context)
+        else:
+            body_text = html_to_text(body_html)
+        return subject, body_html, body_text
+
+
+email_templates = EmailTemplates()
+
+
+def init_email_templates(app):
+    """Compile all email templates once at startup."""
+    names = email_templates.load()
+    print(f"✅ Email templates loaded: {', '.join(names)}")
+
+
+def build_message(template, recipients, **context):
+    """Flask-Mail Message with HTML + plain-text parts from email `template`."""
+    subject, body_html, body_text = email_templates.render(template, **context)
+    return Message(subject=subject, recipients=recipients, html=body_html, body=body_text)
@@ -0,0 +1,72 @@
+"""
+Liveness / readiness probes for the load balancer.
+
+GET /healthz  -- the process is up and answering. No database, no models:
+                 always 200 while the worker can serve a request.
+GET /readyz   -- 200 once every readiness check passes, 503 (with the
+                 failing check's details) until then. create_app() adds
+                 "database" (pool hands out a working connection) and
+                 "models" (every model loaded and warmed up).
+
+Config (env):
+  READYZ_DB_CHECK_TTL  seconds a successful database check is reused (default 5)
+"""
+import os
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import text
+
+READYZ_DB_CHECK_TTL = float(os.getenv("READYZ_DB_CHECK_TTL", 5))
+
+# name -> fn() returning (ok, details)
+readiness_checks = {}
+
+
+def add_readiness_check(name, fn):
+    readiness_checks[name] = fn
+
+
+class DatabaseCheck:
+    """SELECT 1 through the pool; a success is reused for READYZ_DB_CHECK_TTL seconds."""
+
+    def __init__(self, db, ttl=READYZ_DB_CHECK_TTL):
+        self.db = db
+        self.ttl = float(ttl)
+        self._ok_until = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if time.monotonic() < self._ok_until:
+            return True, {"cached": True}
+        start = time.perf_counter()
+        try:
+            with self.db.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception as e:
+            return False, {"error": str(e)}
+        with self._lock:
+            self._ok_until = time.monotonic() + self.ttl
+        return True, {"seconds": round(time.perf_counter() - start, 4)}
+
+
+def init_health(app):
+    """Register /healthz and /readyz on `app`."""
+
+    @app.route("/healthz", methods=["GET"])
+    def healthz():
+        return jsonify({"status": "ok"})
+
+    @app.route("/readyz", methods=["GET"])
+    def readyz():
+        checks = {}
+        ready = True
+        for name, fn in readiness_checks.items():
+            try:
+                ok, details = fn()
+            except Exception as e:
+                ok, details = False, {"error": str(e)}
+            checks[name] = {"ok": ok, **details}
+            ready = ready and ok
+        return jsonify({"status": "ready" if ready else "not_ready", "checks": checks}), (200 if ready else 503)
@@ -0,0 +1,523 @@
+"""
+Background mail delivery.
+
+Routes call mail_queue.send(msg) with a Flask-Mail Message. The message is
+rendered to bytes right away (inside the request's app context) and put on
+an in-memory queue, so the request returns without waiting for the SMTP
+server.
+
+Sender threads each keep one authenticated SMTP session open (connect +
+STARTTLS + login once, reused for every message while the session stays
+healthy) and send queued messages in batches. A failed message is retried
+with exponential backoff. Permanent errors (5xx, all recipients refused)
+and messages that use up MAIL_MAX_ATTEMPTS are recorded in <spool>/failed/
+-- envelope, subject and error only: the body (a reset mail carries its
+OTP) is dropped. Records older than MAIL_FAILED_RETENTION_HOURS are
+deleted by the retry thread.
+
+Every accepted message is first written to <spool>/pending/<pid>/ (write
+ahead) and removed from there once it is delivered or failed, so a crash,
+SIGKILL or OOM of the process loses nothing. Pending mail of processes
+that are gone is taken over by init_mail_queue() when a process starts,
+and by the retry thread every MAIL_SPOOL_SCAN seconds (a worker that died
+while the others keep running).
+
+Config (env):
+  MAIL_ASYNC          1 (default) / 0 -> old behaviour, mail.send() in the request
+  MAIL_QUEUE_SIZE     messages waiting in memory (default 1000)
+  MAIL_POOL_SIZE      SMTP sessions = sender threads per process (default 2)
+  MAIL_BATCH_SIZE     messages taken from the queue per session turn (default 20)
+  MAIL_MAX_ATTEMPTS   delivery attempts per message (default 5)
+  MAIL_RETRY_BASE     first retry delay in seconds, doubled every attempt (default 2)
+  MAIL_RETRY_MAX      max retry delay in seconds (default 300)
+  MAIL_SESSION_IDLE   close a session unused for this many seconds (default 60)
+  MAIL_TIMEOUT        SMTP socket timeout in seconds (default 10)
+  MAIL_SPOOL_DIR      undelivered messages (default <instance>/mail_spool)
+  MAIL_SPOOL_SCAN     seconds between checks for pending mail of dead processes (default 60)
+  MAIL_FAILED_RETENTION_HOURS  how long failure records are kept (default 72)
+
+For local testing point MAIL_SERVER / MAIL_PORT at an SMTP stand-in, e.g.
+    python scripts/smtp_sink.py --port 8025      (or: python -m aiosmtpd -n -l 127.0.0.1:8025)
+with MAIL_USE_TLS=False.
+"""
+import atexit
+import base64
+import glob
+import heapq
+import json
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+import uuid
+
+from flask import current_app
+from flask_mail import sanitize_address, sanitize_addresses
+
+from extensions import mail
+
+MAIL_ASYNC = os.getenv("MAIL_ASYNC", "1").lower() not in ("0", "false", "no")
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", 1000))
+MAIL_POOL_SIZE = int(os.getenv("MAIL_POOL_SIZE", 2))
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 20))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+MAIL_RETRY_BASE = float(os.getenv("MAIL_RETRY_BASE", 2))
+MAIL_RETRY_MAX = float(os.getenv("MAIL_RETRY_MAX", 300))
+MAIL_SESSION_IDLE = float(os.getenv("MAIL_SESSION_IDLE", 60))
+MAIL_SPOOL_SCAN = float(os.getenv("MAIL_SPOOL_SCAN", 60))
+MAIL_FAILED_RETENTION_HOURS = float(os.getenv("MAIL_FAILED_RETENTION_HOURS", 72))
+
+SENDER_THREAD_NAME = "mail-sender"
+RETRY_THREAD_NAME = "mail-retry"
+
+
+class MailQueueFull(Exception):
+    """The in-memory queue is full; the message was not accepted."""
+
+
+class QueuedMail:
+    """One rendered message: envelope + raw bytes + delivery bookkeeping."""
+
+    def __init__(self, sender, recipients, data, subject="", id=None, attempts=0, last_error=None):
+        self.id = id or uuid.uuid4().hex
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.data = data
+        self.subject = subject
+        self.attempts = attempts
+        self.last_error = last_error
+        # write-ahead copy in pending/<pid>/ (None if it could not be written)
+        self.spool_path = None
+
+    def to_dict(self, body=True):
+        d = {
+            "id": self.id,
+            "sender": self.sender,
+            "recipients": self.recipients,
+            "subject": self.subject,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+        }
+        if body:
+            d["data"] = base64.b64encode(self.data).decode("ascii")
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["sender"], d["recipients"], base64.b64decode(d["data"]), d.get("subject", ""),
+                   d.get("id"), d.get("attempts", 0), d.get("last_error"))
+
+
+class SMTPSession:
+    """An authenticated SMTP connection that is opened once and reused."""
+
+    def __init__(self, config):
+        self.config = config
+        self.conn = None
+        self.last_used = 0.0
+        self.opened = 0
+
+    def _connect(self):
+        c = self.config
+        if c["use_ssl"]:
+            conn = smtplib.SMTP_SSL(c["host"], c["port"], timeout=c["timeout"])
+        else:
+            conn = smtplib.SMTP(c["host"], c["port"], timeout=c["timeout"])
+        conn.ehlo()
+        if c["use_tls"] and not c["use_ssl"]:
+            conn.starttls()
+            conn.ehlo()
+        if c["username"] and c["password"]:
+            conn.login(c["username"], c["password"])
+        self.conn = conn
+        self.opened += 1
+
+    def send(self, item):
+        if self.conn is None:
+            self._connect()
+            self.conn.sendmail(item.sender, item.recipients, item.data)
+        else:
+            try:
+                self.conn.sendmail(item.sender, item.recipients, item.data)
+            except smtplib.SMTPServerDisconnected:
+                # server dropped the idle session -> one fresh session, same message
+                self.conn = None
+                self._connect()
+                self.conn.sendmail(item.sender, item.recipients, item.data)
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self, idle_seconds):
+        if self.conn is not None and time.monotonic() - self.last_used > idle_seconds:
+            self.close()
+
+    def close(self):
+        if self.conn is None:
+            return
+        try:
+            self.conn.quit()
+        except Exception:
+            pass
+        self.conn = None
+
+
+def _is_permanent(error):
+    """5xx replies and 'every recipient refused' won't get better by retrying."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    code = getattr(error, "smtp_code", None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MailDispatcher:
+    """
+    send(msg)        -- render + enqueue a Flask-Mail Message (raises MailQueueFull)
+    flush(timeout)   -- wait until the queue is drained (tests / shutdown)
+    shutdown()       -- stop the threads and spool what is left
+    stats()          -- counters for diagnostics
+    """
+
+    def __init__(self):
+        self.config = None
+        self.spool_dir = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._next_scan = 0.0
+        self._queue = queue.Queue(maxsize=MAIL_QUEUE_SIZE)
+        self._retry_heap = []
+        self._retry_cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._sessions = []
+        self._stats_lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def configure(self, app):
+        """Take SMTP settings from the app config (called by init_mail_queue)."""
+        cfg = app.config
+        self.config = {
+            "host": cfg.get("MAIL_SERVER", "localhost"),
+            "port": int(cfg.get("MAIL_PORT", 25)),
+            "use_tls": bool(cfg.get("MAIL_USE_TLS")),
+            "use_ssl": bool(cfg.get("MAIL_USE_SSL")),
+            "username": cfg.get("MAIL_USERNAME"),
+            "password": cfg.get("MAIL_PASSWORD"),
+            "timeout": float(os.getenv("MAIL_TIMEOUT", 10)),
+        }
+        self.spool_dir = os.getenv("MAIL_SPOOL_DIR") or os.path.join(app.instance_path, "mail_spool")
+
+    # ------------------------------------------------------------
+    # Threads
+    # ------------------------------------------------------------
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # forked worker: parent's threads, queue and locks are not ours
+                self._reset()
+            self._pid = os.getpid()
+            for i in range(max(MAIL_POOL_SIZE, 1)):
+                session = SMTPSession(self.config)
+                self._sessions.append(session)
+                t = threading.Thread(target=self._sender_loop, args=(session,),
+                                     name=f"{SENDER_THREAD_NAME}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._load_spool(starting=True)
+            self._next_scan = time.monotonic() + MAIL_SPOOL_SCAN
+            t = threading.Thread(target=self._retry_loop, name=RETRY_THREAD_NAME, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def start(self):
+        """Start the sender threads now and take over mail left by dead processes."""
+        if MAIL_ASYNC and self.config is not None:
+            self._ensure_started()
+
+    def _next_batch(self):
+        """Block for the first message, then take whatever else is already queued."""
+        try:
+            batch = [self._queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        while len(batch) < MAIL_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _sender_loop(self, session):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                session.close_if_idle(MAIL_SESSION_IDLE)
+                continue
+            for item in batch:
+                try:
+                    session.send(item)
+                    with self._stats_lock:
+                        self.sent += 1
+                    self._unspool(item)
+                except Exception as e:
+                    # an SMTP error reply leaves the session usable (sendmail sends
+                    # RSET); anything else -> reconnect for the next message
+                    if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                        session.close()
+                    self._delivery_failed(item, e)
+                finally:
+                    self._queue.task_done()
+
+    def _delivery_failed(self, item, error):
+        item.attempts += 1
+        item.last_error = f"{type(error).__name__}: {error}"
+        if _is_permanent(error) or item.attempts >= MAIL_MAX_ATTEMPTS:
+            print(f"❌ Mail '{item.subject}' to {item.recipients} failed after "
+                  f"{item.attempts} attempt(s): {item.last_error}")
+            with self._stats_lock:
+                self.failed += 1
+            # no body: undeliverable OTPs must not pile up on disk
+            self._write(item, os.path.join(self.spool_dir, "failed"), body=False)
+            self._unspool(item)
+            return
+
+        delay = min(MAIL_RETRY_BASE * 2 ** (item.attempts - 1), MAIL_RETRY_MAX)
+        delay *= random.uniform(0.8, 1.2)  # don't retry a whole batch in lockstep
+        print(f"⚠️ Mail '{item.subject}' to {item.recipients} failed ({item.last_error}), "
+              f"retry {item.attempts}/{MAIL_MAX_ATTEMPTS - 1} in {delay:.1f}s")
+        with self._stats_lock:
+            self.retried += 1
+        # keep the attempt count if this process dies before the retry
+        if item.spool_path:
+            self._write(item, os.path.dirname(item.spool_path))
+        with self._retry_cond:
+            heapq.heappush(self._retry_heap, (time.monotonic() + delay, item.id, item))
+            self._retry_cond.notify()
+
+    def _retry_loop(self):
+        while not self._stop.is_set():
+            if time.monotonic() >= self._next_scan:
+                self._next_scan = time.monotonic() + MAIL_SPOOL_SCAN
+                self._load_spool()
+                self._purge_failed()
+            with self._retry_cond:
+                if not self._retry_heap:
+                    self._retry_cond.wait(1.0)
+                    continue
+                due, _, item = self._retry_heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._retry_cond.wait(min(wait, 1.0))
+                    continue
+                heapq.heappop(self._retry_heap)
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                with self._retry_cond:
+                    heapq.heappush(self._retry_heap, (time.monotonic() + MAIL_RETRY_BASE, item.id, item))
+
+    # ------------------------------------------------------------
+    # Spool (persisted undelivered mail)
+    # ------------------------------------------------------------
+    def _pending_dir(self, pid=None):
+        return os.path.join(self.spool_dir, "pending", str(pid or os.getpid()))
+
+    def _write(self, item, folder, body=True):
+        """Write item to folder/<id>.json (atomically); returns the path or None."""
+        try:
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"{item.id}.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump(item.to_dict(body), f)
+            os.replace(path + ".tmp", path)
+            return path
+        except OSError as e:
+            print(f"❌ Could not persist mail {item.id} to {folder}: {e}")
+            return None
+
+    def _unspool(self, item):
+        if item.spool_path:
+            try:
+                os.remove(item.spool_path)
+            except OSError:
+                pass
+            item.spool_path = None
+
+    def _purge_failed(self, retention_hours=MAIL_FAILED_RETENTION_HOURS):
+        """Delete failure records older than the retention period."""
+        cutoff = time.time() - retention_hours * 3600
+        removed = 0
+        for path in glob.glob(os.path.join(self.spool_dir, "failed", "*.json")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def _orphaned_files(self, starting):
+        """Pending mail of processes that are gone (plus flat files of older versions)."""
+        root = os.path.join(self.spool_dir, "pending")
+        files = glob.glob(os.path.join(root, "*.json"))
+        for name in os.listdir(root) if os.path.isdir(root) else ():
+            if not name.isdigit():
+                continue
+            pid = int(name)
+            # our own pid at start: a previous process that had the same pid
+            if pid == os.getpid() and not starting:
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            files.extend(glob.glob(os.path.join(root, name, "*.json")))
+        return files
+
+    def _load_spool(self, starting=False):
+        """Take over and queue the pending mail of dead processes."""
+        mine = self._pending_dir()
+        loaded = 0
+        for path in self._orphaned_files(starting):
+            # claim the file by moving it into our folder: other workers scan too
+            claimed = os.path.join(mine, os.path.basename(path))
+            if path != claimed:
+                try:
+                    os.makedirs(mine, exist_ok=True)
+                    os.rename(path, claimed)
+                except OSError:
+                    continue
+            try:
+                with open(claimed) as f:
+                    item = QueuedMail.from_dict(json.load(f))
+                item.spool_path = claimed
+                self._queue.put_nowait(item)
+                loaded += 1
+            except queue.Full:
+                # leave it for a later scan / another worker
+                if path != claimed:
+                    os.rename(claimed, path)
+                break
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Could not load spooled mail {path}: {e}")
+        root = os.path.join(self.spool_dir, "pending")
+        for folder in glob.glob(os.path.join(root, "*", "")):
+            if folder.rstrip(os.sep) != mine:
+                try:
+                    os.rmdir(folder)  # only succeeds once empty
+                except OSError:
+                    pass
+        if loaded:
+            print(f"📧 Re-queued {loaded} undelivered mail(s) from {root}")
+
+    # ------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------
+    def send(self, msg):
+        """
+        Queue a Flask-Mail Message. Must be called inside an app context.
+        Returns the queued id (None when sent synchronously / suppressed).
+        """
+        if not MAIL_ASYNC or current_app.extensions["mail"].suppress or self.config is None:
+            mail.send(msg)
+            return None
+
+        assert msg.send_to, "No recipients have been added"
+        assert msg.sender, "The message does not specify a sender and a default sender has not been configured"
+        if msg.date is None:
+            msg.date = time.time()
+        item = QueuedMail(
+            sanitize_address(msg.sender),
+            list(sanitize_addresses(msg.send_to)),
+            msg.as_bytes(),
+            subject=msg.subject or "",
+        )
+
+        self._ensure_started()
+        if self._queue.full():
+            with self._stats_lock:
+                self.rejected += 1
+            raise MailQueueFull(f"Mail queue is full ({MAIL_QUEUE_SIZE} messages)")
+        # on disk before it is accepted: a crash after this can't lose it
+        item.spool_path = self._write(item, self._pending_dir())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._unspool(item)
+            with self._stats_lock:
+                self.rejected += 1
+            raise MailQueueFull(f"Mail queue is full ({MAIL_QUEUE_SIZE} messages)")
+        return item.id
+
+    def flush(self, timeout=30.0):
+        """Wait until every queued (and retrying) message is delivered or failed."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._retry_cond:
+                retrying = len(self._retry_heap)
+            if self._queue.unfinished_tasks == 0 and not retrying:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=2.0)
+        leftover = self._queue.qsize() + len(self._retry_heap)
+        for item in [item for _, _, item in self._retry_heap] + list(self._queue.queue):
+            # spooled when accepted; only write what couldn't be then
+            if item.spool_path is None:
+                item.spool_path = self._write(item, self._pending_dir())
+        if leftover:
+            print(f"📧 {leftover} undelivered mail(s) left in {self._pending_dir()} for the next process")
+        for session in self._sessions:
+            session.close()
+        self._pid = None
+
+    def stats(self):
+        with self._retry_cond:
+            retrying = len(self._retry_heap)
+        return {
+            "async": MAIL_ASYNC,
+            "queued": self._queue.qsize(),
+            "retrying": retrying,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "sessions_opened": sum(s.opened for s in self._sessions),
+        }
+
+
+mail_queue = MailDispatcher()
+atexit.register(mail_queue.shutdown)
+
+
+def init_mail_queue(app):
+    """Hook the dispatcher to the app's MAIL_* settings and resend spooled mail."""
+    mail_queue.configure(app)
+    if not app.extensions["mail"].suppress:
+        mail_queue.start()
@@ -0,0 +1,310 @@
+"""
+Low-overhead request metrics with a Prometheus text endpoint.
+
+init_metrics(app) installs before/after request hooks on the app factory:
+  http_requests_total{route, method, status}          counter
+  http_request_duration_seconds{route, method}         histogram (whole request)
+  http_request_phase_seconds{route, phase}             histogram (parse / validation /
+                                                        inference / serialization ...)
+and exposes GET /metrics.
+
+Handlers mark phases with phase("parse"), phase("inference") ... -- each call
+records the time since the previous mark (or request start).
+
+Multi-worker (gunicorn): set METRICS_MULTIPROC_DIR (or PROMETHEUS_MULTIPROC_DIR)
+to a directory shared by the workers. Each worker writes its snapshot there
+(at most every METRICS_FLUSH_INTERVAL seconds) and /metrics sums all of them,
+so every worker answers with the totals of the whole server.
+gunicorn.conf.py empties the directory when the master starts
+(clear_multiproc_dir) and folds the counters / histograms of an exited
+worker into metrics_archive.json (mark_process_dead), so totals survive
+worker restarts but never include an earlier run. Gauges are current
+values: only snapshots of live workers contribute to them.
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR") or os.getenv("PROMETHEUS_MULTIPROC_DIR")
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 1.0))
+
+# name -> (type, help)
+# Gauges are summed over workers in multi-process mode (e.g. connections in
+# use across the whole server).
+METRIC_INFO = {
+    "http_requests_total": ("counter", "HTTP requests by route, method and status."),
+    "http_request_duration_seconds": ("histogram", "Request latency by route."),
+    "http_request_phase_seconds": ("histogram", "Time spent per request phase."),
+}
+
+
+def describe(name, mtype, help_text):
+    """Register HELP / TYPE for a metric defined outside this module."""
+    METRIC_INFO[name] = (mtype, help_text)
+
+
+class MetricsStore:
+    """
+    Counters, gauges and fixed-bucket histograms keyed by (name, labels).
+    labels is a tuple of (key, value) pairs.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        # key -> [bucket counts..., +Inf count, sum]
+        self.histograms = {}
+        self._last_flush = 0.0
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self.gauges[(name, labels)] = value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            # first bucket with value <= bound (len(buckets) -> +Inf)
+            h[bisect.bisect_left(self.buckets, value)] += 1
+            h[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "buckets": list(self.buckets),
+                "counters": [[n, list(map(list, l)), v] for (n, l), v in self.counters.items()],
+                "gauges": [[n, list(map(list, l)), v] for (n, l), v in self.gauges.items()],
+                "histograms": [[n, list(map(list, l)), list(h)] for (n, l), h in self.histograms.items()],
+            }
+
+    # ------------------------------------------------------------
+    # multi-worker files
+    # ------------------------------------------------------------
+    def flush(self, force=False):
+        """Write this worker's snapshot to MULTIPROC_DIR (rate limited)."""
+        if not MULTIPROC_DIR:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        path = os.path.join(MULTIPROC_DIR, f"metrics_{os.getpid()}.json")
+        try:
+            os.makedirs(MULTIPROC_DIR, exist_ok=True)
+            _write_json(path, self.snapshot())
+        except OSError as e:
+            print(f"⚠ Could not write metrics snapshot: {e}")
+
+
+ARCHIVE_NAME = "metrics_archive.json"
+
+
+def _snapshot_pid(path):
+    """Worker pid from a metrics_<pid>.json name (None for the archive)."""
+    name = os.path.basename(path)[len("metrics_"):-len(".json")]
+    return int(name) if name.isdigit() else None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def clear_multiproc_dir(directory=MULTIPROC_DIR):
+    """Remove every snapshot (gunicorn master start: nothing of an earlier run counts)."""
+    if not directory:
+        return
+    for path in glob.glob(os.path.join(directory, "metrics_*.json*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def mark_process_dead(pid, directory=MULTIPROC_DIR):
+    """
+    Worker `pid` exited (gunicorn child_exit, runs in the master): add its
+    counters and histograms to the archive, drop its gauges and its file.
+    """
+    if not directory:
+        return
+    path = os.path.join(directory, f"metrics_{pid}.json")
+    if not os.path.exists(path):
+        return
+    archive = os.path.join(directory, ARCHIVE_NAME)
+    snapshots = []
+    for p in (archive, path):
+        try:
+            with open(p) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    for snap in snapshots:
+        snap["gauges"] = []
+    buckets, counters, histograms = merge_snapshots(snapshots)
+    try:
+        _write_json(archive, {
+            "buckets": list(buckets),
+            "counters": [[n, list(map(list, l)), v] for (n, l), v in counters.items()],
+            "gauges": [],
+            "histograms": [[n, list(map(list, l)), h] for (n, l), h in histograms.items()],
+        })
+        os.remove(path)
+    except OSError as e:
+        print(f"⚠ Could not archive metrics of worker {pid}: {e}")
+
+
+def read_snapshots(directory=MULTIPROC_DIR):
+    """All snapshots in `directory`; gauges only from workers that are still running."""
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "metrics_*.json")):
+        try:
+            with open(path) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        pid = _snapshot_pid(path)
+        if pid is None or not _pid_alive(pid):
+            snap["gauges"] = []
+        snapshots.append(snap)
+    return snapshots
+
+
+def merge_snapshots(snapshots):
+    """Sum counters, gauges and histograms of several worker snapshots."""
+    counters, histograms = {}, {}
+    buckets = None
+    for snap in snapshots:
+        buckets = buckets or snap["buckets"]
+        for name, labels, value in snap["counters"] + snap.get("gauges", []):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, h in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], h)]
+            else:
+                histograms[key] = list(h)
+    return buckets or list(LATENCY_BUCKETS), counters, histograms
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    parts = []
+    for k, v in items:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def render_prometheus(buckets, counters, histograms):
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    names = sorted({n for n, _ in counters} | {n for n, _ in histograms})
+    for name in names:
+        mtype, help_text = METRIC_INFO.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {mtype}")
+        if mtype == "histogram":
+            for (n, labels), h in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, h):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {cumulative}")
+                cumulative += h[len(buckets)]
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {cumulative}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-1]}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+        else:
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+store = MetricsStore()
+
+
+def phase(name):
+    """Record the time since the previous phase mark (or request start) as `name`."""
+    now = time.perf_counter()
+    marks = getattr(g, "_metrics_phases", None)
+    if marks is None:
+        return
+    last = getattr(g, "_metrics_last_mark", now)
+    marks.append((name, now - last))
+    g._metrics_last_mark = now
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+
+def init_metrics(app):
+    """Install the request hooks and the /metrics endpoint on `app`."""
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = g._metrics_last_mark = time.perf_counter()
+        g._metrics_phases = []
+
+    @app.after_request
+    def _metrics_record(response):
+        start = getattr(g, "_metrics_start", None)
+        if start is None:
+            return response
+        route = _route_label()
+        if route == "/metrics":
+            return response
+        elapsed = time.perf_counter() - start
+        method = request.method
+        store.inc("http_requests_total", (("route", route), ("method", method), ("status", response.status_code)))
+        store.observe("http_request_duration_seconds", (("route", route), ("method", method)), elapsed)
+        for name, seconds in g._metrics_phases:
+            store.observe("http_request_phase_seconds", (("route", route), ("phase", name)), seconds)
+        store.flush()
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        if MULTIPROC_DIR:
+            store.flush(force=True)
+            snapshots = read_snapshots()
+        else:
+            snapshots = [store.snapshot()]
+        buckets, counters, histograms = merge_snapshots(snapshots)
+        body = render_prometheus(buckets, counters, histograms)
+        return Response(body, mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,166 @@
+"""
+Versioned model artifact bundles.
+
+Layout (one directory per model version, written by scripts/train_models.py):
+    ml_models/bundles/<name>/CURRENT              -> version being served
+    ml_models/bundles/<name>/<version>/manifest.json
+    ml_models/bundles/<name>/<version>/model.joblib
+    ml_models/bundles/<name>/<version>/label_encoder.joblib   (main model only)
+
+manifest.json describes everything serving would otherwise guess from the
+pickle: feature order (API key + training column, dtype, range seen in
+the training data), class labels and whether they come from a label
+encoder, sha256 + size of every file, the training data hash and the
+library versions the estimator was fitted with.
+
+load_bundle() checks a bundle once, before the registry swaps it in:
+manifest format, checksums, and that scikit-learn / xgboost match the
+installed versions (pickles are not portable across their minor
+versions). Anything off raises BundleError and the current model keeps
+serving. The files are joblib dumps, so they are memory-mapped directly
+(no .mmap copy as for the legacy pickles).
+
+Switching versions is one atomic write of CURRENT (activate()), which the
+model watcher sees like any other model file change.
+
+Config (env):
+  MODEL_BUNDLE_DIR   default ml_models/bundles
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from services.startup import lazy_module
+
+joblib = lazy_module("joblib")
+
+MODEL_BUNDLE_DIR = os.getenv("MODEL_BUNDLE_DIR") or os.path.join(
+    os.path.dirname(__file__), '..', 'ml_models', 'bundles')
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+CURRENT_NAME = "CURRENT"
+# package -> leading version parts that must match the installed one
+COMPATIBLE_VERSIONS = {"scikit-learn": 2, "xgboost": 1}
+
+
+class BundleError(ValueError):
+    """A bundle that must not be served (missing, corrupt or incompatible)."""
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def current_path(name, root=MODEL_BUNDLE_DIR):
+    return os.path.join(root, name, CURRENT_NAME)
+
+
+def current_bundle_dir(name, root=MODEL_BUNDLE_DIR):
+    """Directory of the active version of `name`, or None if there is no bundle."""
+    try:
+        with open(current_path(name, root)) as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(root, name, version) if version else None
+
+
+def feature_spec(name, column, values=None):
+    """One manifest feature entry; `values` (training column) gives its range."""
+    spec = {"name": name, "column": column, "dtype": "float64"}
+    if values is not None:
+        spec["min"] = float(values.min())
+        spec["max"] = float(values.max())
+    return spec
+
+
+# ------------------------------------------------------------
+# Writing
+# ------------------------------------------------------------
+def write_bundle(name, version, objects, manifest, root=MODEL_BUNDLE_DIR):
+    """
+    Dump objects ({role: estimator}, e.g. {"model": ..., "label_encoder": ...})
+    into <root>/<name>/<version>/ and write manifest.json (with file hashes)
+    last. Returns the bundle directory.
+    """
+    bundle_dir = os.path.join(root, name, version)
+    os.makedirs(bundle_dir)
+    files = {}
+    for role, obj in objects.items():
+        filename = f"{role}.joblib"
+        path = os.path.join(bundle_dir, filename)
+        joblib.dump(obj, path)
+        files[role] = {"path": filename, "sha256": sha256_file(path), "bytes": os.path.getsize(path)}
+    manifest = dict(manifest, format=FORMAT_VERSION, name=name, version=version, files=files)
+    manifest.setdefault("created_at", datetime.now(timezone.utc).isoformat(timespec="seconds"))
+    tmp_path = os.path.join(bundle_dir, f"{MANIFEST_NAME}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(bundle_dir, MANIFEST_NAME))
+    return bundle_dir
+
+
+def activate(name, version, root=MODEL_BUNDLE_DIR):
+    """Point CURRENT at `version` (one atomic rename)."""
+    read_manifest(os.path.join(root, name, version))
+    target = current_path(name, root)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, target)
+
+
+# ------------------------------------------------------------
+# Loading
+# ------------------------------------------------------------
+def read_manifest(bundle_dir):
+    try:
+        with open(os.path.join(bundle_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"Unreadable bundle manifest in {bundle_dir}: {e}")
+    if manifest.get("format") != FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format')!r} (expected {FORMAT_VERSION})")
+    return manifest
+
+
+def check_libraries(manifest, installed):
+    """Raise BundleError if the bundle was fitted with incompatible library versions."""
+    for package, parts in COMPATIBLE_VERSIONS.items():
+        wanted = (manifest.get("libraries") or {}).get(package)
+        if not wanted:
+            continue
+        have = installed.get(package)
+        if not have or have.split(".")[:parts] != wanted.split(".")[:parts]:
+            raise BundleError(f"Bundle {manifest['name']} {manifest['version']} needs {package} {wanted}, "
+                              f"installed: {have or 'none'}")
+
+
+def verify_files(bundle_dir, manifest):
+    for role, info in manifest["files"].items():
+        path = os.path.join(bundle_dir, info["path"])
+        if not os.path.exists(path):
+            raise BundleError(f"Bundle file missing: {info['path']}")
+        if os.path.getsize(path) != info["bytes"] or sha256_file(path) != info["sha256"]:
+            raise BundleError(f"Checksum mismatch for {info['path']} in bundle {manifest['version']}")
+
+
+def load_bundle(bundle_dir, installed, mmap=True):
+    """
+    (manifest, {role: object}, mmap_used) for a verified bundle.
+    `installed` = {package: version} of this process.
+    """
+    manifest = read_manifest(bundle_dir)
+    check_libraries(manifest, installed)
+    verify_files(bundle_dir, manifest)
+    objects = {}
+    for role, info in manifest["files"].items():
+        path = os.path.join(bundle_dir, info["path"])
+        objects[role] = joblib.load(path, mmap_mode="c" if mmap else None)
+    return manifest, objects, mmap
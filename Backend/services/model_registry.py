@@ -0,0 +1,336 @@
+"""
+Lazy model registry with hot reload.
+
+Models are no longer unpickled at import time. Each registered model is
+loaded on first use (get) or by a background warm-up thread, whichever
+comes first.
+
+reload(name) loads a new artifact off the request path, validates it and
+then swaps the reference in one assignment. Requests that already called
+get() keep their old object until they finish. watch(interval) polls the
+model files and triggers reload() when one changes.
+
+Large NumPy arrays are served through joblib mmap_mode so that forked
+gunicorn workers share the same pages instead of each keeping a private
+copy.
+
+The pickles in ml_models/ were written with plain pickle, which joblib
+cannot memory-map. On first load we re-dump them once (joblib format) into
+MODEL_MMAP_DIR and load that copy with mmap_mode="c" (copy-on-write:
+shared pages, and libsvm still gets the writable buffers it asks for).
+"""
+import os
+import resource
+import threading
+import time
+
+from services.startup import lazy_module
+
+# imported on first load (keeps ~0.25s off app import)
+joblib = lazy_module("joblib")
+
+# Thread names so they show up clearly in thread dumps
+WARMUP_THREAD_NAME = "model-warmup"
+RELOAD_THREAD_NAME = "model-reload"
+WATCH_THREAD_NAME = "model-watch"
+
+
+def joblib_load(path, mmap=True, mmap_dir=None):
+    """
+    Load a joblib/pickle artifact. With mmap=True the artifact is loaded
+    from a memory-mappable joblib copy (created next to it on first use).
+    Returns (obj, mmap_used).
+    """
+    if not mmap:
+        return joblib.load(path), False
+
+    st = os.stat(path)
+    mmap_dir = mmap_dir or os.path.join(os.path.dirname(path), ".mmap")
+    base = os.path.basename(path)
+    mmap_path = os.path.join(mmap_dir, f"{base}.{st.st_mtime_ns}-{st.st_size}.joblib")
+
+    try:
+        if not os.path.exists(mmap_path):
+            obj = joblib.load(path)
+            os.makedirs(mmap_dir, exist_ok=True)
+            # write under a private name, then publish atomically (workers may race here)
+            tmp_path = f"{mmap_path}.{os.getpid()}.tmp"
+            joblib.dump(obj, tmp_path)
+            os.replace(tmp_path, mmap_path)
+            _remove_stale_copies(mmap_dir, base, keep=mmap_path)
+        return joblib.load(mmap_path, mmap_mode="c"), True
+    except OSError as e:
+        # read-only deployment dir etc. -> plain in-memory load
+        print(f"⚠ Could not use memory-mapped copy of {base}: {e}")
+        return joblib.load(path), False
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _remove_stale_copies(mmap_dir, base, keep):
+    for name in os.listdir(mmap_dir):
+        path = os.path.join(mmap_dir, name)
+        if name.startswith(base + ".") and path != keep and not name.endswith(".tmp"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def process_memory():
+    """Current and peak resident set size of this worker (MB)."""
+    info = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/statm") as f:
+            fields = f.read().split()
+        page = os.sysconf("SC_PAGE_SIZE")
+        info["rss_mb"] = round(int(fields[1]) * page / 1024 / 1024, 2)
+        # file-backed pages (mmap'd models) that other workers can share
+        info["shared_mb"] = round(int(fields[2]) * page / 1024 / 1024, 2)
+    except (OSError, ValueError, IndexError):
+        info["rss_mb"] = None
+    # ru_maxrss is KB on Linux
+    info["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+    return info
+
+
+class _Entry:
+    def __init__(self, name, loader, paths, validator, on_swap):
+        self.name = name
+        self.loader = loader
+        self.paths = paths
+        self.validator = validator
+        self.on_swap = on_swap
+        self.obj = None
+        self.error = None
+        self.state = "not_loaded"  # not_loaded / loading / ok / error
+        self.load_seconds = None
+        self.loaded_at = None
+        self.version = 0
+        self.signatures = None
+        self.last_reload = None
+        self.lock = threading.Lock()
+        # only one reload per model at a time
+        self.reload_lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Named, lazily loaded models.
+
+    register(name, loader, paths, validator, on_swap)
+                                  -- loader() returns the loaded object,
+                                     validator(obj) raises if it is unusable,
+                                     on_swap(obj) runs after a successful reload
+    get(name)                     -- loaded object (loads on first call), None on failure
+    warm_up(background=True)      -- load everything, optionally in a thread
+    reload(name, background=True) -- load + validate + swap a new version
+    watch(interval)               -- reload automatically when model files change
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._created = time.monotonic()
+        self.cold_start_seconds = None
+        self._warmup_thread = None
+        self._watch_thread = None
+        self._watch_interval = 0
+        self._watch_stop = threading.Event()
+        self._restart_watch = False
+        # Unpickling imports the model's packages (sklearn, xgboost ...). Two
+        # threads importing the same packages at once can get a half-initialised
+        # module ("partially initialized module"), so loaders run one at a time.
+        self._loader_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+    def register(self, name, loader, paths=(), validator=None, on_swap=None):
+        self._entries[name] = _Entry(name, loader, list(paths), validator, on_swap)
+
+    def names(self):
+        return list(self._entries)
+
+    def get(self, name):
+        if self._restart_watch:
+            self._restart_watch = False
+            self.watch(self._watch_interval)
+        entry = self._entries[name]
+        if entry.state in ("ok", "error"):
+            return entry.obj
+        with entry.lock:
+            if entry.state not in ("ok", "error"):
+                self._load(entry)
+        return entry.obj
+
+    def _signatures(self, entry):
+        return [file_signature(p) for p in entry.paths]
+
+    def _load(self, entry):
+        entry.state = "loading"
+        start = time.perf_counter()
+        try:
+            entry.signatures = self._signatures(entry)
+            with self._loader_lock:
+                obj = entry.loader()
+            if entry.validator:
+                entry.validator(obj)
+            entry.obj, entry.error, entry.state = obj, None, "ok"
+            entry.version += 1
+            print(f" Loaded {entry.name} in {time.perf_counter() - start:.3f}s")
+        except Exception as e:
+            entry.obj, entry.error, entry.state = None, str(e), "error"
+            print(f" Error loading {entry.name}: {str(e)}")
+            for path in entry.paths:
+                print(f"   {entry.name} path:", path)
+        entry.load_seconds = round(time.perf_counter() - start, 4)
+        entry.loaded_at = time.time()
+
+        if self.cold_start_seconds is None and all(
+            e.state in ("ok", "error") for e in self._entries.values()
+        ):
+            self.cold_start_seconds = round(time.monotonic() - self._created, 4)
+
+    def warm_up(self, background=True, before=None):
+        """
+        Load every registered model (in a daemon thread if background=True).
+        `before` runs first in the same thread (e.g. importing deferred modules).
+        """
+        def run():
+            if before is not None:
+                try:
+                    before()
+                except Exception as e:
+                    print(f"⚠ Warm-up step failed: {e}")
+            for name in self.names():
+                self.get(name)
+
+        if not background:
+            run()
+            return None
+        if self._warmup_thread is None or not self._warmup_thread.is_alive():
+            self._warmup_thread = threading.Thread(target=run, name=WARMUP_THREAD_NAME, daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    # ------------------------------------------------------------
+    # Hot reload
+    # ------------------------------------------------------------
+    def reload(self, name, background=True):
+        """
+        Load a fresh copy of `name`, validate it and swap it in.
+        The current object keeps serving until the swap (and for any request
+        that already holds it). Returns the reload thread, or the
+        last_reload record when background=False.
+        """
+        entry = self._entries[name]
+        if not background:
+            self._reload(entry)
+            return entry.last_reload
+        thread = threading.Thread(target=self._reload, args=(entry,),
+                                  name=f"{RELOAD_THREAD_NAME}-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def _reload(self, entry):
+        if not entry.reload_lock.acquire(blocking=False):
+            print(f" Reload of {entry.name} already in progress")
+            return
+        start = time.perf_counter()
+        record = {"started_at": time.time(), "ok": False, "error": None}
+        try:
+            signatures = self._signatures(entry)
+            with self._loader_lock:
+                new_obj = entry.loader()
+            if entry.validator:
+                entry.validator(new_obj)
+
+            # single reference swap; readers never see a half-built object
+            with entry.lock:
+                entry.obj = new_obj
+                entry.error = None
+                entry.state = "ok"
+                entry.version += 1
+                entry.signatures = signatures
+                entry.loaded_at = time.time()
+                entry.load_seconds = round(time.perf_counter() - start, 4)
+            if entry.on_swap:
+                entry.on_swap(new_obj)
+            record["ok"] = True
+            print(f" Reloaded {entry.name} (version {entry.version})")
+        except Exception as e:
+            # keep serving the old object
+            record["error"] = str(e)
+            # don't retry the same broken files on every watch tick
+            entry.signatures = self._signatures(entry)
+            print(f" Reload of {entry.name} failed, keeping current version: {str(e)}")
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            entry.last_reload = record
+            entry.reload_lock.release()
+
+    def watch(self, interval):
+        """Poll model files every `interval` seconds and reload changed ones (0 disables)."""
+        self._watch_interval = float(interval or 0)
+        if self._watch_interval <= 0:
+            return None
+        if self._watch_thread is not None and self._watch_thread.is_alive():
+            return self._watch_thread
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch_loop, name=WATCH_THREAD_NAME, daemon=True)
+        self._watch_thread.start()
+        return self._watch_thread
+
+    def stop_watch(self):
+        self._watch_stop.set()
+
+    def _watch_loop(self):
+        while not self._watch_stop.wait(self._watch_interval):
+            for entry in self._entries.values():
+                # never loaded yet -> first get() will pick up the new files anyway
+                if entry.signatures is None or entry.state == "loading":
+                    continue
+                if self._signatures(entry) != entry.signatures:
+                    print(f" Detected change in {entry.name} model files, reloading")
+                    self._reload(entry)
+
+    def _after_fork_in_child(self):
+        # Locks (and a half-finished load) held by a parent thread don't
+        # survive fork: reset them so the worker can load on its own.
+        for entry in self._entries.values():
+            entry.lock = threading.Lock()
+            entry.reload_lock = threading.Lock()
+            if entry.state == "loading":
+                entry.state = "not_loaded"
+        self._loader_lock = threading.Lock()
+        self._warmup_thread = None
+        # watcher thread is gone too; restart it on the first get() in the worker
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+        self._restart_watch = self._watch_interval > 0
+
+    def status(self, name):
+        entry = self._entries[name]
+        return {
+            "state": entry.state,
+            "error": entry.error,
+            "load_seconds": entry.load_seconds,
+            "loaded_at": entry.loaded_at,
+            "version": entry.version,
+            "last_reload": entry.last_reload,
+            "paths": entry.paths,
+        }
+
+    def diagnostics(self):
+        return {
+            "models": {name: self.status(name) for name in self._entries},
+            "cold_start_seconds": self.cold_start_seconds,
+            "watch_interval_seconds": self._watch_interval,
+            "uptime_seconds": round(time.monotonic() - self._created, 2),
+            "memory": process_memory(),
+        }
@@ -0,0 +1,298 @@
+"""
+Where password reset OTPs live.
+
+Routes only talk to `otp_store`:
+    issue(email)     -- new code for email (replaces any earlier one), returns it
+    get(email)       -- record with is_expired() / verify(code), or None
+    save(record)     -- persist record.is_verified after verify()
+    discard(email)   -- drop the code (the SQL backend leaves the commit to the caller,
+                        so the reset is one transaction with the password update)
+
+Backends (OTP_BACKEND):
+  sql     the `otp` table (default). issue() is one INSERT .. ON DUPLICATE KEY
+          UPDATE (MySQL) / ON CONFLICT DO UPDATE (SQLite, PostgreSQL). Expired
+          rows are deleted by a background sweeper in batches of OTP_SWEEP_BATCH.
+  redis   keys "otp:<email>" in Redis with the OTP lifetime as TTL, so nothing
+          has to be swept. Needs the `redis` package and OTP_REDIS_URL.
+  memory  same code path as redis against LocalKeyValue, an in-process stand-in.
+          Codes are not shared between processes -> single worker / tests only.
+
+Config (env):
+  OTP_BACKEND         sql | redis | memory (default sql)
+  OTP_REDIS_URL       default redis://localhost:6379/0
+  OTP_SWEEP_INTERVAL  seconds between sweeps (default 300, 0 disables the sweeper)
+  OTP_SWEEP_BATCH     rows deleted per statement (default 500)
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from extensions import db
+from models.otp import OTP, OTP_VALID_MINUTES, OTPChecks
+from models.user import normalize_email
+
+try:
+    import redis
+except ImportError:  # optional, only needed for OTP_BACKEND=redis
+    redis = None
+
+OTP_BACKEND = os.getenv("OTP_BACKEND", "sql").lower()
+OTP_REDIS_URL = os.getenv("OTP_REDIS_URL", "redis://localhost:6379/0")
+OTP_SWEEP_INTERVAL = float(os.getenv("OTP_SWEEP_INTERVAL", 300))
+OTP_SWEEP_BATCH = int(os.getenv("OTP_SWEEP_BATCH", 500))
+
+SWEEPER_THREAD_NAME = "otp-sweeper"
+# OTP times are naive UTC (datetime.utcnow), stored as seconds since this
+EPOCH = datetime(1970, 1, 1)
+
+
+# ------------------------------------------------------------
+# SQL backend
+# ------------------------------------------------------------
+def _upsert_statement(dialect, values):
+    """Single-statement insert-or-replace for `values`, None if the dialect has none."""
+    update = ("otp_code", "created_at", "expires_at", "is_verified")
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(OTP.__table__).values(**values)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update})
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(OTP.__table__).values(**values)
+        return stmt.on_conflict_do_update(index_elements=["email"], set_={c: stmt.excluded[c] for c in update})
+    return None
+
+
+class SQLOTPStore:
+    backend = "sql"
+
+    def issue(self, email):
+        key = normalize_email(email)
+        now = datetime.utcnow()
+        values = {
+            "email": key,
+            "otp_code": OTP.generate_otp(),
+            "created_at": now,
+            "expires_at": now + timedelta(minutes=OTP_VALID_MINUTES),
+            "is_verified": False,
+        }
+        try:
+            stmt = _upsert_statement(db.session.get_bind().dialect.name, values)
+            if stmt is None:
+                # no upsert in this dialect: delete + insert, still one transaction
+                db.session.query(OTP).filter(OTP.email == key).delete(synchronize_session=False)
+                stmt = OTP.__table__.insert().values(**values)
+            db.session.execute(stmt)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return values["otp_code"]
+
+    def get(self, email):
+        return OTP.query.filter_by(email=normalize_email(email)).first()
+
+    def save(self, record):
+        db.session.commit()
+
+    def discard(self, email):
+        db.session.query(OTP).filter(OTP.email == normalize_email(email)).delete(synchronize_session=False)
+
+
+def sweep_expired(batch_size=OTP_SWEEP_BATCH, now=None):
+    """
+    Delete expired OTP rows, `batch_size` per statement and transaction so a
+    large backlog never holds locks for long. Returns the number deleted.
+    """
+    now = now or datetime.utcnow()
+    deleted = 0
+    while True:
+        # ids first: MySQL doesn't allow LIMIT inside an IN (...) subquery
+        ids = [row[0] for row in db.session.query(OTP.id).filter(OTP.expires_at < now).limit(batch_size)]
+        if not ids:
+            break
+        db.session.query(OTP).filter(OTP.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+class OTPSweeper:
+    """Background thread that runs sweep_expired() every OTP_SWEEP_INTERVAL seconds."""
+
+    def __init__(self, interval=OTP_SWEEP_INTERVAL, batch_size=OTP_SWEEP_BATCH):
+        self.interval = float(interval)
+        self.batch_size = int(batch_size)
+        self.app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.runs = 0
+        self.deleted = 0
+        self.last_error = None
+
+    def ensure_started(self, app):
+        # started lazily (first request) so every gunicorn worker gets its own thread
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.app = app
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, name=SWEEPER_THREAD_NAME, daemon=True).start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                deleted = sweep_expired(self.batch_size)
+                self.runs += 1
+                self.deleted += deleted
+                if deleted:
+                    print(f"🧹 Removed {deleted} expired OTP(s)")
+            except Exception as e:
+                db.session.rollback()
+                self.last_error = str(e)
+                print(f"⚠️ OTP sweep failed: {e}")
+            finally:
+                db.session.remove()
+
+    def stop(self):
+        self._stop.set()
+        self._pid = None
+
+    def stats(self):
+        return {"interval_seconds": self.interval, "runs": self.runs,
+                "deleted": self.deleted, "last_error": self.last_error}
+
+
+# ------------------------------------------------------------
+# Key-value backends (Redis / in-process)
+# ------------------------------------------------------------
+class LocalKeyValue:
+    """
+    In-process stand-in for the few Redis commands the OTP store uses
+    (get, set with ex, delete). Expired keys are dropped when touched.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and time.monotonic() >= expires:
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+            # keep memory bounded when nobody reads old codes again
+            if len(self._data) % 1024 == 0:
+                now = time.monotonic()
+                for k in [k for k, (_, e) in self._data.items() if e is not None and now >= e]:
+                    del self._data[k]
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(k, None) is not None for k in keys)
+
+
+class OTPRecord(OTPChecks):
+    def __init__(self, email, otp_code, expires_at, is_verified=False):
+        self.email = email
+        self.otp_code = otp_code
+        self.expires_at = expires_at
+        self.is_verified = is_verified
+
+
+class KeyValueOTPStore:
+    """OTPs as "otp:<email>" keys that expire on their own."""
+
+    def __init__(self, client, backend):
+        self.client = client
+        self.backend = backend
+
+    @staticmethod
+    def _key(email):
+        return f"otp:{normalize_email(email)}"
+
+    def _put(self, record):
+        ttl = int((record.expires_at - datetime.utcnow()).total_seconds())
+        if ttl <= 0:
+            self.client.delete(self._key(record.email))
+            return
+        value = json.dumps({"code": record.otp_code, "expires_at": (record.expires_at - EPOCH).total_seconds(),
+                            "verified": record.is_verified})
+        self.client.set(self._key(record.email), value, ex=ttl)
+
+    def issue(self, email):
+        record = OTPRecord(normalize_email(email), OTP.generate_otp(),
+                           datetime.utcnow() + timedelta(minutes=OTP_VALID_MINUTES))
+        self._put(record)
+        return record.otp_code
+
+    def get(self, email):
+        raw = self.client.get(self._key(email))
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        return OTPRecord(normalize_email(email), data["code"],
+                         EPOCH + timedelta(seconds=data["expires_at"]), data["verified"])
+
+    def save(self, record):
+        self._put(record)
+
+    def discard(self, email):
+        self.client.delete(self._key(email))
+
+
+# ------------------------------------------------------------
+# Setup
+# ------------------------------------------------------------
+def make_store(backend=OTP_BACKEND):
+    if backend == "sql":
+        return SQLOTPStore()
+    if backend == "memory":
+        return KeyValueOTPStore(LocalKeyValue(), "memory")
+    if backend == "redis":
+        if redis is None:
+            raise RuntimeError("OTP_BACKEND=redis needs the 'redis' package (pip install redis)")
+        return KeyValueOTPStore(redis.Redis.from_url(OTP_REDIS_URL), "redis")
+    raise ValueError(f"Unknown OTP_BACKEND '{backend}' (use sql, redis or memory)")
+
+
+otp_store = make_store()
+otp_sweeper = OTPSweeper()
+
+
+def init_otp_store(app):
+    """Start the expiry sweeper (SQL backend) in every worker on its first request."""
+    print(f"✅ OTP store: {otp_store.backend}")
+    if otp_store.backend != "sql" or otp_sweeper.interval <= 0:
+        return
+
+    @app.before_request
+    def _start_otp_sweeper():
+        otp_sweeper.ensure_started(app)
@@ -0,0 +1,181 @@
+"""
+Password hashing off the request thread.
+
+generate_password_hash / check_password_hash are deliberately slow
+(pbkdf2 / scrypt). They run here in a small, size-limited process pool so
+that a burst of logins can't eat every gunicorn worker: when all pool
+slots (workers + PASSWORD_HASH_QUEUE waiting jobs) are taken, or a job
+waits longer than PASSWORD_HASH_TIMEOUT, HashPoolBusy is raised at once
+and the route answers 503.
+
+Config (env):
+  PASSWORD_HASH_METHOD   werkzeug method string (default "pbkdf2:sha256:600000",
+                         e.g. "scrypt:32768:8:1")
+  PASSWORD_SALT_LENGTH   salt length (default 16)
+  PASSWORD_HASH_WORKERS  pool processes per app process (default 2, 0 = hash inline)
+  PASSWORD_HASH_QUEUE    jobs allowed to wait for a free process (default 4 x workers)
+  PASSWORD_HASH_TIMEOUT  max seconds to wait for a result (default 10)
+
+Hashes made with other parameters still verify; needs_rehash() tells
+login to store a fresh hash with the current ones.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}")
+PASSWORD_SALT_LENGTH = int(os.getenv("PASSWORD_SALT_LENGTH", 16))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", PASSWORD_HASH_WORKERS * 4))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+
+
+class HashPoolBusy(Exception):
+    """All hashing slots are taken (or the job timed out) -> answer 503."""
+
+
+def canonical_method(method):
+    """
+    Full werkzeug method string with defaults filled in, as it appears in a
+    stored hash ("scrypt" -> "scrypt:32768:8:1", "pbkdf2" -> "pbkdf2:sha256:600000").
+    """
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Unsupported PASSWORD_HASH_METHOD '{method}' (use scrypt or pbkdf2)")
+
+
+def _pool_context():
+    # Gunicorn workers have background threads (model warm-up, log listener),
+    # so don't fork them directly; forkserver children start from a clean
+    # process that only imports this module.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+class PasswordHasher:
+    """
+    hash(password)           -- new hash with the configured parameters
+    verify(pwhash, password) -- check_password_hash
+    needs_rehash(pwhash)     -- True if pwhash uses other parameters
+    All three raise HashPoolBusy instead of queueing without limit.
+    """
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH,
+                 workers=PASSWORD_HASH_WORKERS, queue_size=PASSWORD_HASH_QUEUE,
+                 timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = canonical_method(method)
+        self.salt_length = int(salt_length)
+        self.workers = max(int(workers), 0)
+        self.queue_size = max(int(queue_size), 0)
+        self.timeout = float(timeout)
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size or 1)
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    # ------------------------------------------------------------
+    # Pool
+    # ------------------------------------------------------------
+    def _get_executor(self):
+        # one pool per process: a gunicorn worker must not reuse its parent's
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _run(self, fn, *args):
+        if self.workers == 0:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolBusy("Password hashing pool is saturated")
+        with self._lock:
+            self.in_flight += 1
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError) as e:
+            self._release()
+            self._executor = None
+            raise HashPoolBusy(f"Password hashing pool unavailable: {e}")
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise HashPoolBusy(f"Password hashing took longer than {self.timeout}s")
+        except BrokenProcessPool as e:
+            # a pool process died (e.g. OOM kill) -> start a fresh pool next time
+            self._executor = None
+            raise HashPoolBusy(f"Password hashing pool unavailable: {e}")
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    # ------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if pwhash was made with another method / cost / salt length."""
+        method, _, rest = (pwhash or "").partition("$")
+        salt, _, _ = rest.partition("$")
+        try:
+            method = canonical_method(method)
+        except ValueError:
+            return True
+        return method != self.method or len(salt) != self.salt_length
+
+    def stats(self):
+        return {
+            "method": self.method,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+hasher = PasswordHasher()
+atexit.register(hasher.shutdown)
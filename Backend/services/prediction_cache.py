@@ -0,0 +1,165 @@
+"""
+Bounded LRU + TTL cache for single-row predictions.
+
+Key = (model identity, quantized feature vector). The model identity is a
+generation number, bumped by every invalidate(), plus the signature (mtime
++ size) of the files the model is loaded from; when one of them changes on
+disk the cache is cleared. A label computed under an older identity is not
+stored, so a request that raced a model swap cannot refill the cache with
+the previous model's answer.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def parse_rounding(spec):
+    """
+    Parse a rounding spec like "temperature=1,ph=2,Hardness=0" into a dict
+    {feature name: decimals}. Empty / None -> {} (exact values).
+    """
+    rounding = {}
+    if not spec:
+        return rounding
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, decimals = part.partition("=")
+        try:
+            rounding[name.strip()] = int(decimals)
+        except ValueError:
+            raise ValueError(f"Invalid rounding entry '{part}' (expected name=decimals)")
+    return rounding
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def files_signature(paths):
+    """file_signature of every path (None when nothing is watched)."""
+    return tuple(file_signature(path) for path in paths) if paths else None
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with per-entry TTL.
+
+    `fields` is the feature order of the rows passed to make_key();
+    `rounding` maps some of those fields to a number of decimals.
+    `source_paths` are the files the model is loaded from -- a bundle's
+    CURRENT pointer and / or the plain pickles -- watched for changes
+    (checked at most every `check_interval` seconds).
+    """
+
+    def __init__(self, name, fields, max_size=4096, ttl=300.0, rounding=None,
+                 source_paths=(), check_interval=2.0):
+        self.name = name
+        self.max_size = int(max_size)
+        self.ttl = float(ttl)
+        self.source_paths = tuple(source_paths)
+        self.check_interval = float(check_interval)
+
+        rounding = rounding or {}
+        self.rounding = [(i, rounding[f]) for i, f in enumerate(fields) if f in rounding]
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._signature = files_signature(self.source_paths)
+        self._next_check = time.monotonic() + self.check_interval
+        self.model_id = self._model_id()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _model_id(self):
+        return f"{self.name}:{self._generation}:{self._signature}"
+
+    def make_key(self, row):
+        """Quantize one feature row (sequence of floats) into a hashable key."""
+        values = [float(v) for v in row]
+        for i, decimals in self.rounding:
+            values[i] = round(values[i], decimals)
+        return (self.model_id, tuple(values))
+
+    def _check_source(self, now):
+        """Clear the cache if a watched model file changed (caller holds the lock)."""
+        if not self.source_paths or now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        if files_signature(self.source_paths) != self._signature:
+            self._clear_locked()
+
+    def _clear_locked(self):
+        self._generation += 1
+        self._signature = files_signature(self.source_paths)
+        self.model_id = self._model_id()
+        self._entries.clear()
+        self.invalidations += 1
+
+    def get(self, key):
+        """Return (hit, value)."""
+        now = time.monotonic()
+        with self._lock:
+            self._check_source(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, expires_at = entry
+            if now >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            if key[0] != self.model_id:
+                # key built before a model change -> don't store it
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every entry and retire keys made so far (e.g. after a model reload)."""
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
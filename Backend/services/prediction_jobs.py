@@ -0,0 +1,413 @@
+"""
+Bulk prediction jobs for uploaded dataset CSVs (a station history shaped
+like Dataset/Complete_Dataset.csv).
+
+The request that uploads the file only stores it and inserts a
+`prediction_job` row (status "queued"); it answers with the job id at
+once. A few runner threads per process take queued jobs from the table
+(claimed with one conditional UPDATE, so gunicorn workers never run the
+same job twice) and stream the file through services/river_dataset.py
+BULK_JOB_CHUNK_ROWS rows at a time: one score_chunk() call (one model
+predict) per chunk, results appended to a CSV or NDJSON file, progress
+and a heartbeat written to the row after every chunk. No broker: the
+table is the queue, the runners poll it.
+
+  queued -> running -> done / failed / cancelled
+
+Cancelling a queued job finishes it at once; a running job stops after
+its current chunk. A running job whose heartbeat is older than
+BULK_JOB_STALE_SECONDS (its worker died) is claimed again and restarted.
+Progress and the final status are only written while the row still names
+this runner as its worker: a runner that was only slow (its job reclaimed
+meanwhile) stops at its next chunk and leaves the upload to the new owner.
+Each run writes its own result file, so the two never share one.
+Uploads are deleted when their job finishes, results (and job rows)
+after BULK_JOB_RETENTION_HOURS.
+
+Config (env):
+  BULK_JOB_DIR              uploads + results (default .cache/jobs)
+  BULK_JOB_WORKERS          runner threads per process (default 1, 0 = jobs are never run here)
+  BULK_JOB_CHUNK_ROWS       rows per model call (default 1000)
+  BULK_JOB_MAX_BYTES        largest upload accepted (default 50 MB); also sets the app's
+                            MAX_CONTENT_LENGTH (plus multipart overhead) unless configured,
+                            so werkzeug stops oversized / chunked bodies while reading them
+  BULK_JOB_BDL_VALUE        value used for "BDL" cells (default 0)
+  BULK_JOB_POLL_INTERVAL    seconds between checks for jobs queued by other workers (default 2)
+  BULK_JOB_STALE_SECONDS    heartbeat age after which a running job is restarted (default 300)
+  BULK_JOB_RETENTION_HOURS  how long finished jobs and their results are kept (default 24)
+"""
+import csv
+import json
+import math
+import os
+import secrets
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from extensions import db
+from models.prediction_job import FINISHED_STATES, PredictionJob
+from services.metrics import describe, store
+from services.river_dataset import check_header, iter_chunks
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BULK_JOB_DIR = os.getenv("BULK_JOB_DIR") or os.path.join(BACKEND_DIR, '.cache', 'jobs')
+BULK_JOB_WORKERS = int(os.getenv("BULK_JOB_WORKERS", 1))
+BULK_JOB_CHUNK_ROWS = int(os.getenv("BULK_JOB_CHUNK_ROWS", 1000))
+BULK_JOB_MAX_BYTES = int(os.getenv("BULK_JOB_MAX_BYTES", 50 * 1024 * 1024))
+BULK_JOB_BDL_VALUE = float(os.getenv("BULK_JOB_BDL_VALUE", 0.0))
+BULK_JOB_POLL_INTERVAL = float(os.getenv("BULK_JOB_POLL_INTERVAL", 2))
+BULK_JOB_STALE_SECONDS = float(os.getenv("BULK_JOB_STALE_SECONDS", 300))
+BULK_JOB_RETENTION_HOURS = float(os.getenv("BULK_JOB_RETENTION_HOURS", 24))
+
+RUNNER_THREAD_NAME = "bulk-job"
+# multipart boundaries + the form fields around the file
+MULTIPART_OVERHEAD = 64 * 1024
+COPY_CHUNK_BYTES = 1024 * 1024
+OUTPUT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+# seconds between purges of expired jobs
+CLEANUP_INTERVAL = 600
+
+describe("bulk_jobs_total", "counter", "Bulk prediction jobs finished, by status.")
+describe("bulk_job_rows_total", "counter", "Rows processed by bulk prediction jobs, by outcome.")
+
+
+class UploadTooLarge(ValueError):
+    """The upload is bigger than BULK_JOB_MAX_BYTES (-> 413)."""
+
+
+def _save_upload(upload, path, max_bytes=BULK_JOB_MAX_BYTES):
+    """Copy upload.stream to path, at most max_bytes; returns the size."""
+    size = 0
+    with open(path, "wb") as out:
+        while True:
+            chunk = upload.stream.read(COPY_CHUNK_BYTES)
+            if not chunk:
+                return size
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"File too large (max {max_bytes} bytes).")
+            out.write(chunk)
+
+
+def _remove(path):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ------------------------------------------------------------
+# Job store (request side)
+# ------------------------------------------------------------
+def create_job(upload, output_format="csv", job_dir=BULK_JOB_DIR):
+    """
+    Store an uploaded file (werkzeug FileStorage) and queue a job for it.
+    ValueError (-> 400) if the format is unknown or the file is not a
+    dataset CSV, UploadTooLarge (-> 413) past BULK_JOB_MAX_BYTES.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}' (use {' or '.join(OUTPUT_FORMATS)})")
+    os.makedirs(job_dir, exist_ok=True)
+    filename = os.path.basename(upload.filename or "upload.csv")[:255]
+    job = PredictionJob(filename, input_path="", bytes_total=0, output_format=output_format)
+    job.input_path = os.path.join(job_dir, f"{job.id}.input.csv")
+    try:
+        job.bytes_total = _save_upload(upload, job.input_path)
+        check_header(job.input_path)
+        db.session.add(job)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _remove(job.input_path)
+        raise
+    return job
+
+
+def get_job(job_id):
+    return db.session.get(PredictionJob, job_id)
+
+
+def cancel_job(job_id):
+    """
+    Cancel a job: queued -> cancelled now, running -> stops after its
+    current chunk. Returns the job (None if unknown).
+    """
+    now = datetime.utcnow()
+    queued = db.session.query(PredictionJob).filter(
+        PredictionJob.id == job_id, PredictionJob.status == "queued"
+    ).update({"status": "cancelled", "cancel_requested": True, "finished_at": now}, synchronize_session=False)
+    if not queued:
+        db.session.query(PredictionJob).filter(
+            PredictionJob.id == job_id, PredictionJob.status == "running"
+        ).update({"cancel_requested": True}, synchronize_session=False)
+    db.session.commit()
+    job = get_job(job_id)
+    if job is not None:
+        db.session.refresh(job)
+        if queued:
+            _remove(job.input_path)
+            store.inc("bulk_jobs_total", (("status", "cancelled"),))
+    return job
+
+
+def purge_expired(retention_hours=BULK_JOB_RETENTION_HOURS, now=None):
+    """Delete finished jobs older than the retention period and their files."""
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=retention_hours)
+    jobs = PredictionJob.query.filter(PredictionJob.status.in_(FINISHED_STATES),
+                                      PredictionJob.finished_at < cutoff).limit(500).all()
+    for job in jobs:
+        _remove(job.input_path)
+        _remove(job.output_path)
+        db.session.delete(job)
+    db.session.commit()
+    return len(jobs)
+
+
+# ------------------------------------------------------------
+# Result files
+# ------------------------------------------------------------
+class ResultWriter:
+    """
+    Appends scored rows to a CSV or NDJSON file: row number, station,
+    the feature values the model saw, prediction or error.
+    """
+
+    def __init__(self, path, output_format, fields):
+        self.fields = list(fields)
+        self.output_format = output_format
+        self.f = open(path, "w", encoding="utf-8", newline="")
+        self.writer = None
+        if output_format == "csv":
+            self.writer = csv.writer(self.f)
+            self.writer.writerow(["row", "station_code", "location", "state", *self.fields, "prediction", "error"])
+
+    def write_chunk(self, first_row, chunk, features, labels, errors):
+        codes = chunk.codes.tolist()
+        values = features.tolist()
+        for r in range(len(chunk)):
+            code = codes[r] if codes[r] >= 0 else None
+            if self.writer is not None:
+                self.writer.writerow([first_row + r, "" if code is None else code, chunk.names[r], chunk.states[r],
+                                      *("" if math.isnan(v) else v for v in values[r]),
+                                      labels[r] or "", errors.get(r, "")])
+            else:
+                record = {"row": first_row + r, "station_code": code, "location": chunk.names[r],
+                          "state": chunk.states[r]}
+                record.update((f, None if math.isnan(v) else v) for f, v in zip(self.fields, values[r]))
+                record["prediction"] = labels[r]
+                if r in errors:
+                    record["error"] = errors[r]
+                self.f.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.f.close()
+
+
+# ------------------------------------------------------------
+# Runners
+# ------------------------------------------------------------
+class JobCancelled(Exception):
+    pass
+
+
+class JobLost(Exception):
+    """The job was claimed by another runner (this one missed its heartbeat)."""
+
+
+class JobRunner:
+    """
+    Runner threads for one process (started on its first request).
+
+    score_chunk(chunk) -> (features, labels, errors) for one RiverChunk:
+    features (rows, len(fields)) as given to the model, labels (None for
+    rejected rows) and {row in chunk: error message}.
+    """
+
+    def __init__(self, score_chunk, fields, workers=BULK_JOB_WORKERS, job_dir=BULK_JOB_DIR,
+                 chunk_rows=BULK_JOB_CHUNK_ROWS, poll_interval=BULK_JOB_POLL_INTERVAL,
+                 stale_seconds=BULK_JOB_STALE_SECONDS):
+        self.score_chunk = score_chunk
+        self.fields = list(fields)
+        self.workers = max(int(workers), 0)
+        self.job_dir = job_dir
+        self.chunk_rows = max(int(chunk_rows), 1)
+        self.poll_interval = float(poll_interval)
+        self.stale_seconds = float(stale_seconds)
+        self.app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._next_cleanup = 0.0
+        self.active = 0
+        self.finished = {status: 0 for status in FINISHED_STATES}
+        self.last_error = None
+
+    def ensure_started(self, app):
+        # one set of threads per gunicorn worker
+        if self.workers == 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.app = app
+            self._stop = threading.Event()
+            self._wake = threading.Event()
+            self._pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._loop, name=f"{RUNNER_THREAD_NAME}-{i}", daemon=True).start()
+
+    def notify(self):
+        """A job was queued in this process: don't wait for the next poll."""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._pid = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    job_id = self.claim()
+                    if job_id:
+                        self.run(job_id)
+                        continue
+                    if time.monotonic() >= self._next_cleanup:
+                        self._next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+                        purge_expired()
+                except Exception as e:
+                    db.session.rollback()
+                    self.last_error = str(e)
+                    print(f"⚠️ Bulk job runner error: {e}")
+                finally:
+                    db.session.remove()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _worker_name(self):
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"[:64]
+
+    def claim(self):
+        """Id of a job this thread now owns (oldest queued or stale running one), or None."""
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.stale_seconds)
+        claimable = or_(PredictionJob.status == "queued",
+                        and_(PredictionJob.status == "running", PredictionJob.heartbeat_at < stale))
+        ids = [row[0] for row in db.session.query(PredictionJob.id).filter(claimable)
+               .order_by(PredictionJob.created_at).limit(5)]
+        for job_id in ids:
+            claimed = db.session.query(PredictionJob).filter(PredictionJob.id == job_id, claimable).update({
+                "status": "running", "worker": self._worker_name(), "started_at": now, "heartbeat_at": now,
+                "bytes_done": 0, "rows_done": 0, "rows_failed": 0,
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return job_id
+        return None
+
+    def _owned(self, job_id):
+        """Filter for job_id while this runner still owns it."""
+        return and_(PredictionJob.id == job_id, PredictionJob.status == "running",
+                    PredictionJob.worker == self._worker_name())
+
+    def _finish(self, job_id, status, **values):
+        """Write the final status; False (nothing written) if the job is no longer ours."""
+        values.update(status=status, finished_at=datetime.utcnow())
+        updated = db.session.query(PredictionJob).filter(self._owned(job_id)).update(
+            values, synchronize_session=False)
+        db.session.commit()
+        if not updated:
+            return False
+        with self._lock:
+            self.finished[status] += 1
+        store.inc("bulk_jobs_total", (("status", status),))
+        return True
+
+    def run(self, job_id):
+        job = get_job(job_id)
+        # plain values: the row is re-read after every commit otherwise
+        input_path, bytes_total, output_format = job.input_path, job.bytes_total, job.output_format
+        # per run: a reclaimed job's previous runner may still be writing
+        output_path = os.path.join(self.job_dir, f"{job_id}.{secrets.token_hex(4)}.result.{output_format}")
+        part_path = f"{output_path}.part"
+        start = time.perf_counter()
+        rows = failed = 0
+        finished = False
+        with self._lock:
+            self.active += 1
+        try:
+            writer = ResultWriter(part_path, output_format, self.fields)
+            try:
+                for chunk in iter_chunks(input_path, self.chunk_rows, BULK_JOB_BDL_VALUE):
+                    features, labels, errors = self.score_chunk(chunk)
+                    writer.write_chunk(rows, chunk, features, labels, errors)
+                    rows += len(chunk)
+                    failed += len(errors)
+                    store.inc("bulk_job_rows_total", (("outcome", "predicted"),), len(chunk) - len(errors))
+                    store.inc("bulk_job_rows_total", (("outcome", "rejected"),), len(errors))
+                    self._progress(job_id, chunk.offset, rows, failed)
+            finally:
+                writer.close()
+            os.replace(part_path, output_path)
+            finished = self._finish(job_id, "done", output_path=output_path, bytes_done=bytes_total,
+                                    rows_done=rows, rows_failed=failed)
+            if not finished:
+                raise JobLost()
+            print(f"✅ Bulk job {job_id}: {rows} rows ({failed} rejected) in {time.perf_counter() - start:.2f}s")
+        except JobLost:
+            _remove(part_path)
+            _remove(output_path)
+            print(f"⚠️ Bulk job {job_id} was taken over by another runner, stopped after {rows} rows")
+        except JobCancelled:
+            _remove(part_path)
+            finished = self._finish(job_id, "cancelled")
+            print(f"🛑 Bulk job {job_id} cancelled after {rows} rows")
+        except Exception as e:
+            db.session.rollback()
+            _remove(part_path)
+            finished = self._finish(job_id, "failed", error=str(e)[:2000])
+            print(f"⚠️ Bulk job {job_id} failed: {e}")
+        finally:
+            # the upload belongs to whoever owns the job now
+            if finished:
+                _remove(input_path)
+            with self._lock:
+                self.active -= 1
+
+    def _progress(self, job_id, offset, rows, failed):
+        """
+        Record progress + heartbeat; raise JobCancelled if a cancel was
+        requested, JobLost if another runner has claimed the job.
+        """
+        updated = db.session.query(PredictionJob).filter(self._owned(job_id)).update({
+            "bytes_done": offset, "rows_done": rows, "rows_failed": failed, "heartbeat_at": datetime.utcnow(),
+        }, synchronize_session=False)
+        db.session.commit()
+        if not updated:
+            raise JobLost()
+        if db.session.query(PredictionJob.cancel_requested).filter(PredictionJob.id == job_id).scalar():
+            raise JobCancelled()
+
+    def stats(self):
+        return {"workers": self.workers, "running": self._pid == os.getpid(), "active": self.active,
+                "finished": dict(self.finished), "last_error": self.last_error}
+
+
+def init_prediction_jobs(app, runner):
+    """Cap request bodies and start the runner threads in every worker on its first request."""
+    if app.config.get("MAX_CONTENT_LENGTH") is None:
+        app.config["MAX_CONTENT_LENGTH"] = BULK_JOB_MAX_BYTES + MULTIPART_OVERHEAD
+    if runner.workers <= 0:
+        print("⚠ Bulk prediction jobs are queued but not run here (BULK_JOB_WORKERS=0)")
+        return
+
+    @app.before_request
+    def _start_job_runner():
+        runner.ensure_started(app)
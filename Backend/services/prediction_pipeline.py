@@ -0,0 +1,153 @@
+"""
+One prediction pipeline per model, shared by every endpoint that serves it.
+
+A request goes through the same stages on every endpoint:
+    decode      request -> payload                  (default: JSON body)
+    vectorize   (payload, model) -> model input     (validates; ValueError -> 400)
+    infer       (model, X) -> raw predictions       (default: model.predictor.predict)
+    labels      raw predictions -> labels, through model.labels: an array
+                indexed by class number, precomputed when the model is loaded
+                (replaces le.inverse_transform per request). Models that
+                predict labels directly have labels = None.
+
+Caching (single readings), batching (predict_rows), phase timings, the
+predictions_total counter and the per-request log record all live here,
+so /predict, /tap, /river, /river/batch and /tap-status behave the same.
+So does shadow evaluation: with a ShadowEvaluator (services/shadow_eval.py)
+a sample of the predictions served to endpoints is also run through a
+candidate model, off the request thread.
+"""
+import time
+
+import numpy as np
+from flask import jsonify, request
+
+from services.metrics import describe, phase, store
+from services.structured_log import get_logger, log_event
+
+log = get_logger("prediction")
+
+describe("predictions_total", "counter", "Readings predicted, by model.")
+
+
+def label_table(classes):
+    """Class index -> label lookup array (plain Python values, so jsonify needs no conversion)."""
+    return np.array(np.asarray(classes).tolist(), dtype=object)
+
+
+def decode_json(req):
+    return req.get_json(force=True)
+
+
+def predictor_infer(model, X):
+    return model.predictor.predict(X)
+
+
+def _row_values(X):
+    """First (only) row of a model input as plain floats."""
+    if isinstance(X, np.ndarray):
+        return X[0]
+    return X.to_numpy(dtype=np.float64)[0]
+
+
+class PredictionPipeline:
+    """
+    name        -- model name (registry name, metric label)
+    get_model   -- returns the loaded model object or None
+    vectorize   -- (payload, model) -> model input
+    cache       -- PredictionCache for single readings, or None
+    shadow      -- ShadowEvaluator comparing a candidate model, or None
+    decode / infer -- override the default stages
+    """
+
+    def __init__(self, name, get_model, vectorize, cache=None, shadow=None, decode=decode_json,
+                 infer=predictor_infer):
+        self.name = name
+        self.get_model = get_model
+        self.vectorize = vectorize
+        self.cache = cache
+        self.shadow = shadow
+        self.decode = decode
+        self.infer = infer
+
+    # -------------------- stages --------------------
+    def decode_labels(self, model, raw):
+        labels = getattr(model, "labels", None)
+        if labels is None:
+            return np.asarray(raw)
+        return labels.take(np.asarray(raw, dtype=np.intp))
+
+    def predict_rows(self, model, X, endpoint=None):
+        """
+        Labels for every row of X in one infer call (batch endpoints, validation).
+        Served predictions (endpoint given) may be shadowed by the candidate.
+        """
+        start = time.perf_counter()
+        labels = self.decode_labels(model, self.infer(model, X))
+        store.inc("predictions_total", (("model", self.name),), len(labels))
+        if endpoint is not None and self.shadow is not None:
+            self.shadow.submit(self, X, labels, time.perf_counter() - start, endpoint)
+        return labels
+
+    def predict_one(self, model, X, use_cache=True, endpoint=None):
+        """Label for a single-row input, through the cache when enabled."""
+        cache = self.cache if use_cache else None
+        if cache is None or not cache.enabled:
+            return self.predict_rows(model, X, endpoint)[0]
+        key = cache.make_key(_row_values(X))
+        hit, label = cache.get(key)
+        if hit:
+            store.inc("predictions_total", (("model", self.name),))
+            return label
+        label = self.predict_rows(model, X, endpoint)[0]
+        # a swap between fetching `model` and make_key would file the old
+        # model's label under the new generation
+        if self.get_model() is model:
+            cache.put(key, label)
+        return label
+
+    def warm_up(self, model, samples):
+        """
+        Run `samples` through vectorize + predict_one (cache bypassed), so the
+        first real request doesn't pay for first-call setup.
+        """
+        start = time.perf_counter()
+        for sample in samples:
+            self.predict_one(model, self.vectorize(sample, model), use_cache=False)
+        model.warmup_seconds = round(time.perf_counter() - start, 4)
+
+    # -------------------- HTTP --------------------
+    def _single(self, model, endpoint, started):
+        payload = self.decode(request)
+        phase("parse")
+        X = self.vectorize(payload, model)
+        phase("validation")
+        label = self.predict_one(model, X, endpoint=endpoint)
+        phase("inference")
+        log_event(log, "prediction", started, endpoint=endpoint, label=label)
+
+        response = jsonify({"success": True, "prediction": label})
+        phase("serialization")
+        return response
+
+    def serve(self, endpoint, unavailable, run):
+        """
+        Shared endpoint frame: model lookup, then run(model, endpoint, started)
+        -> response. ValueError -> 400 with its message, anything else -> 500.
+        """
+        model = self.get_model()
+        if model is None:
+            return jsonify({"success": False, "error": unavailable}), 500
+        started = time.perf_counter()
+        try:
+            return run(model, endpoint, started)
+        except ValueError as ve:
+            log_event(log, "validation_error", started, status=400, endpoint=endpoint, error=str(ve))
+            return jsonify({"success": False, "error": str(ve)}), 400
+        except Exception as e:
+            log_event(log, "prediction_error", started, status=500, exc_info=True, endpoint=endpoint, error=str(e))
+            return jsonify({"success": False, "error": "Internal server error"}), 500
+
+    def handle(self, endpoint, unavailable="Model not loaded properly."):
+        """Single-reading endpoint: JSON body in, {"success", "prediction"} out."""
+        return self.serve(endpoint, unavailable, self._single)
@@ -0,0 +1,331 @@
+"""
+Token-bucket rate limiting for the auth and prediction blueprints.
+
+Checked in a before_request hook, so a throttled request gets its 429
+(with Retry-After) before the route touches the database, the hashing
+pool, SMTP or a model. A request takes one token from every bucket that
+applies to it, or from none: a request rejected by one bucket does not
+use up the others. CORS preflights (OPTIONS) are never limited.
+
+Limits are set per blueprint with one env var each, RATE_LIMIT_<NAME>
+(NAME = blueprint name without "_bp", upper case). The value is a comma
+separated list of scope=rate:
+    ip=120/minute                    every endpoint of the blueprint, per client IP
+    login.ip=20/minute               one endpoint, per client IP
+    login.account=5/minute           one endpoint, per account (the "email" in the body)
+                                     and client IP
+    forgot_password.account=3/15minutes
+    river_job_status.ip=off          exempt one endpoint
+A rate is N/[M]unit (second, minute, hour, day); N is also the burst size.
+An endpoint rule replaces the blueprint-wide rule of the same key for that
+endpoint (job status polling gets its own budget instead of eating into
+ip=120/minute). "off" alone disables the blueprint's limits. Setting the
+variable replaces that blueprint's defaults (DEFAULT_LIMITS below).
+
+Account buckets are keyed on (account, client IP): they slow down guessing
+one account's password from one address, but a request naming someone
+else's email cannot use up that user's own login / reset budget.
+
+Behind a reverse proxy every request comes from the proxy's address, so
+all clients would share one IP bucket. Set RATE_LIMIT_PROXY_HOPS to the
+number of proxies that append to X-Forwarded-For (1 on Render, which sets
+RENDER=true -- the default there). A request with X-Forwarded-For while
+the setting is 0 logs a warning once.
+
+Config (env):
+  RATE_LIMIT_ENABLED     True (default) / False
+  RATE_LIMIT_BACKEND     memory (default, per process) | redis (shared by all workers)
+  RATE_LIMIT_REDIS_URL   default: OTP_REDIS_URL or redis://localhost:6379/0
+  RATE_LIMIT_PROXY_HOPS  reverse proxies in front of the app; the client IP is taken
+                         from X-Forwarded-For that many hops back (default 1 when
+                         RENDER is set, else 0 = peer IP)
+  RATE_LIMIT_MAX_KEYS    buckets kept per process by the memory backend (default 100000)
+
+With the memory backend every gunicorn worker has its own buckets, so a
+client can get up to (workers x limit) through; use redis when that matters.
+If Redis is unreachable requests are let through (and counted in
+rate_limit_backend_errors_total) rather than failing the whole API.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify, request
+
+from models.user import normalize_email
+from services.metrics import describe, store
+
+try:
+    import redis
+except ImportError:  # optional, only needed for RATE_LIMIT_BACKEND=redis
+    redis = None
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("OTP_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", 1 if os.getenv("RENDER") else 0))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+
+# blueprint name -> limit spec (same format as the env vars)
+DEFAULT_LIMITS = {
+    "auth_bp": (
+        "login.ip=20/minute,login.account=5/minute,"
+        "forgot_password.ip=5/minute,forgot_password.account=3/15minutes,"
+        "verify_otp.ip=10/minute,verify_otp.account=5/minute,"
+        "reset_password.ip=10/minute,reset_password.account=5/minute"
+    ),
+    "prediction_bp": (
+        "ip=120/minute,create_river_job.ip=10/minute,"
+        "river_job_status.ip=600/minute,river_job_result.ip=60/minute"
+    ),
+}
+
+UNIT_SECONDS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+RATE_RE = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+SCOPE_KEYS = ("ip", "account")
+
+describe("rate_limited_total", "counter", "Requests answered 429 by the rate limiter.")
+describe("rate_limit_backend_errors_total", "counter", "Rate limit checks skipped because the backend failed.")
+
+
+def parse_rate(spec):
+    """'5/minute' -> (burst 5, refill 5/60 tokens per second)."""
+    m = RATE_RE.match(spec)
+    if not m:
+        raise ValueError(f"Invalid rate '{spec}' (expected e.g. 20/minute or 3/15minutes)")
+    count, multiplier, unit = int(m.group(1)), int(m.group(2) or 1), m.group(3)
+    if count <= 0:
+        raise ValueError(f"Invalid rate '{spec}' (count must be > 0)")
+    return count, count / (multiplier * UNIT_SECONDS[unit])
+
+
+def parse_limits(spec):
+    """
+    "ip=120/minute,login.account=5/minute" -> {(endpoint or None, key): (burst, rate)}
+    "off" / empty -> {}; "endpoint.key=off" -> {(endpoint, key): None}
+    """
+    limits = {}
+    if not spec or spec.strip().lower() == "off":
+        return limits
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        scope, _, rate = part.partition("=")
+        endpoint, _, key = scope.strip().rpartition(".")
+        if key not in SCOPE_KEYS:
+            raise ValueError(f"Invalid rate limit scope '{scope.strip()}' (expected [endpoint.]ip or [endpoint.]account)")
+        if endpoint and rate.strip().lower() == "off":
+            limits[(endpoint, key)] = None
+        else:
+            limits[(endpoint or None, key)] = parse_rate(rate)
+    return limits
+
+
+# ------------------------------------------------------------
+# Bucket stores
+# ------------------------------------------------------------
+class LocalBucketStore:
+    """Token buckets in this process (LRU-bounded; an evicted bucket starts full again)."""
+
+    name = "memory"
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = int(max_keys)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        """
+        Take one token from each (key, burst, rate) bucket, or from none if
+        any of them is empty. Returns the seconds to wait per bucket (all
+        0.0 if the request may go ahead).
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = []
+            for key, burst, rate in buckets:
+                tokens, last = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                state.append((key, tokens, 0.0 if tokens >= 1 else (1 - tokens) / rate))
+            allowed = not any(wait for _, _, wait in state)
+            for key, tokens, _ in state:
+                self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return [wait for _, _, wait in state]
+
+
+# tokens + timestamp in a hash per bucket; Redis' own clock so all workers
+# agree. ARGV = burst, rate for each key in KEYS; every bucket is checked
+# before any is taken from.
+_REDIS_TAKE = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local tokens = {}
+local waits = {}
+local allowed = true
+for i, key in ipairs(KEYS) do
+  local burst = tonumber(ARGV[2 * i - 1])
+  local rate = tonumber(ARGV[2 * i])
+  local state = redis.call('HMGET', key, 't', 'ts')
+  local t = tonumber(state[1]) or burst
+  local last = tonumber(state[2]) or now
+  t = math.min(burst, t + math.max(0, now - last) * rate)
+  waits[i] = 0
+  if t < 1 then
+    waits[i] = (1 - t) / rate
+    allowed = false
+  end
+  tokens[i] = t
+end
+for i, key in ipairs(KEYS) do
+  local burst = tonumber(ARGV[2 * i - 1])
+  local rate = tonumber(ARGV[2 * i])
+  local t = tokens[i]
+  if allowed then
+    t = t - 1
+  end
+  redis.call('HSET', key, 't', tostring(t), 'ts', tostring(now))
+  redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+  waits[i] = tostring(waits[i])
+end
+return waits
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker, updated atomically by a Lua script."""
+
+    name = "redis"
+
+    def __init__(self, url=RATE_LIMIT_REDIS_URL):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the 'redis' package (pip install redis)")
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._take = self.client.register_script(_REDIS_TAKE)
+
+    def take(self, buckets):
+        keys, args = [], []
+        for key, burst, rate in buckets:
+            keys.append(f"ratelimit:{key}")
+            args.extend((burst, rate))
+        return [float(wait) for wait in self._take(keys=keys, args=args)]
+
+
+# ------------------------------------------------------------
+# Limiter
+# ------------------------------------------------------------
+_proxy_warned = False
+
+
+def client_ip():
+    global _proxy_warned
+    if RATE_LIMIT_PROXY_HOPS > 0:
+        forwarded = [p.strip() for p in request.headers.get("X-Forwarded-For", "").split(",") if p.strip()]
+        if len(forwarded) >= RATE_LIMIT_PROXY_HOPS:
+            return forwarded[-RATE_LIMIT_PROXY_HOPS]
+    elif not _proxy_warned and "X-Forwarded-For" in request.headers:
+        _proxy_warned = True
+        print("⚠ Requests carry X-Forwarded-For but RATE_LIMIT_PROXY_HOPS=0: behind a proxy all "
+              "clients share one rate limit bucket (set RATE_LIMIT_PROXY_HOPS)")
+    return request.remote_addr or "unknown"
+
+
+def request_account():
+    """Account the request is about (email in the JSON / form body), or None."""
+    payload = request.get_json(silent=True)
+    email = payload.get("email") if isinstance(payload, dict) else request.form.get("email")
+    return normalize_email(email) if isinstance(email, str) and email else None
+
+
+class RateLimiter:
+    """
+    limits           -- blueprint -> {(endpoint or None, "ip"/"account"): (burst, rate) or None}
+    check()          -- 429 response for the current request, or None
+    """
+
+    def __init__(self, backend=None, limits=None):
+        self.backend = backend
+        self.limits = limits or {}
+        self.limited = 0
+
+    def rules_for(self, blueprint, endpoint):
+        rules = self.limits.get(blueprint)
+        if not rules:
+            return ()
+        view = endpoint.rpartition(".")[2] if endpoint else None
+        # an endpoint rule (or "off") replaces the blueprint-wide one for its key
+        selected = {}
+        for (scope, key), limit in rules.items():
+            if scope == view or (scope is None and key not in selected):
+                selected[key] = (scope or blueprint, limit)
+        return [(scope, key, limit) for key, (scope, limit) in selected.items() if limit is not None]
+
+    def check(self):
+        if request.method == "OPTIONS":
+            return None
+        rules = self.rules_for(request.blueprint, request.endpoint)
+        if not rules:
+            return None
+        scopes, buckets = [], []
+        ip = client_ip()
+        for scope, key, (burst, rate) in rules:
+            value = ip
+            if key == "account":
+                account = request_account()
+                value = f"{account}:{ip}" if account else None
+            if value is not None:
+                scopes.append((scope, key))
+                buckets.append((f"{scope}:{key}:{value}", burst, rate))
+        if not buckets:
+            return None
+        try:
+            waits = self.backend.take(buckets)
+        except Exception as e:
+            # fail open: a broken limiter must not take the API down
+            store.inc("rate_limit_backend_errors_total", ())
+            print(f"⚠️ Rate limit check skipped ({self.backend.name}): {e}")
+            return None
+        wait, (scope, key) = max(zip(waits, scopes))
+        if wait <= 0:
+            return None
+        self.limited += 1
+        store.inc("rate_limited_total", (("scope", scope), ("key", key)))
+        response = jsonify({"success": False, "message": "Too many requests. Please try again later."})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+        return response
+
+
+def make_backend(name=RATE_LIMIT_BACKEND):
+    if name == "memory":
+        return LocalBucketStore()
+    if name == "redis":
+        return RedisBucketStore()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{name}' (use memory or redis)")
+
+
+limiter = RateLimiter()
+
+
+def init_rate_limit(app):
+    """Read RATE_LIMIT_* and install the before_request check."""
+    if not RATE_LIMIT_ENABLED:
+        print("⚠ Rate limiting disabled (RATE_LIMIT_ENABLED=False)")
+        return
+    limits = {}
+    for blueprint, default in DEFAULT_LIMITS.items():
+        env_name = "RATE_LIMIT_" + blueprint.rsplit("_bp", 1)[0].upper()
+        limits[blueprint] = parse_limits(os.getenv(env_name, default))
+    limiter.limits = limits
+    limiter.backend = make_backend()
+    print(f"✅ Rate limiting ({limiter.backend.name}, proxy hops {RATE_LIMIT_PROXY_HOPS}): "
+          + ", ".join(f"{bp} {len(rules)} rule(s)" for bp, rules in limits.items()))
+
+    @app.before_request
+    def _rate_limit():
+        return limiter.check()
@@ -0,0 +1,337 @@
+"""
+Loader for the CPCB river monitoring export (Dataset/Complete_Dataset.csv).
+
+The file as extracted from the CPCB PDFs:
+  - two header rows: parameter names (with embedded newlines), then Min/Max
+    under every parameter
+  - quoted location / state names with embedded newlines
+  - cp1252 bytes (µ, en dash) rather than UTF-8
+  - "BDL" (below detection limit), "-" and blanks instead of numbers, and
+    the odd number split over two lines ("540000\\n00")
+
+iter_chunks() streams the rows chunk_rows at a time without pandas (each
+chunk knows how far into the file it ends, for progress reporting);
+load_river_dataset() collects them into a RiverDataset:
+
+  values[MIN or MAX, p]   float32 column per parameter and statistic
+  bdl[...]                True where the cell said BDL (value = bdl_value)
+  missing[...]            True where the cell was blank / "-" / not a number (value NaN)
+  station_ids             row -> index into station_codes / names / states
+
+The parsed arrays are cached as .npz (keyed by the CSV's size + mtime and
+the loader settings), so loading the eight years of data again skips the
+CSV parsing entirely.
+
+Config (env):
+  RIVER_DATASET_PATH       default ../Dataset/Complete_Dataset.csv
+  RIVER_DATASET_CACHE_DIR  where the .npz copies go (default .cache/datasets)
+"""
+import csv
+import hashlib
+import os
+import re
+import time
+
+import numpy as np
+
+from services.prediction_cache import file_signature
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RIVER_DATASET_PATH = os.getenv("RIVER_DATASET_PATH") or os.path.join(
+    BACKEND_DIR, '..', 'Dataset', 'Complete_Dataset.csv')
+RIVER_DATASET_CACHE_DIR = os.getenv("RIVER_DATASET_CACHE_DIR") or os.path.join(BACKEND_DIR, '.cache', 'datasets')
+
+# bump when the parsing rules change, so old .npz caches are not reused
+FORMAT_VERSION = 1
+ENCODING = "cp1252"
+
+MIN, MAX = 0, 1
+
+# Parameter columns in file order: (key, header prefix). The keys of the
+# main model's eight features are the same as the API's JSON keys.
+PARAMETERS = [
+    ("temperature", "temperature"),
+    ("dissolvedOxygen", "dissolved oxygen"),
+    ("ph", "ph"),
+    ("conductivity", "conductivity"),
+    ("bod", "bod"),
+    ("nitrate", "nitrate"),
+    ("fecalColiform", "fecal coliform"),
+    ("totalColiform", "total coliform"),
+    ("fecalStreptococci", "fecal streptococci"),
+]
+PARAMETER_KEYS = [key for key, _ in PARAMETERS]
+
+BDL = "BDL"
+MISSING_TOKENS = {"", "-", "--", "NA", "N/A", "NIL"}
+_SPACE_RE = re.compile(r"\s+")
+
+
+def clean_text(value):
+    """Collapse the PDF line breaks / runs of spaces in a name."""
+    return _SPACE_RE.sub(" ", value).strip()
+
+
+def parse_cell(text):
+    """
+    One measurement cell -> (value, is_bdl, is_missing). BDL gives value
+    None (the caller fills in bdl_value); missing / unparseable gives NaN.
+    """
+    token = _SPACE_RE.sub("", text)  # "540000\n00" -> "54000000"
+    if token.upper() == BDL:
+        return None, True, False
+    if token.upper() in MISSING_TOKENS:
+        return np.nan, False, True
+    try:
+        return float(token), False, False
+    except ValueError:
+        return np.nan, False, True
+
+
+def as_float64(values):
+    """float32 -> float64 through the shortest decimal, i.e. 0.1 stays 0.1 (as written in the CSV)."""
+    return np.asarray(values, dtype=np.float32).astype(str).astype(np.float64)
+
+
+def midpoint_values(lo, hi):
+    """Mean of Min and Max, or whichever of the two is present (NaN if neither)."""
+    with np.errstate(invalid="ignore"):
+        return np.where(np.isnan(lo), hi, np.where(np.isnan(hi), lo, (lo + hi) / 2))
+
+
+def _check_header(names, stats):
+    """Column index of every parameter's Min (its Max is the next column)."""
+    columns = {}
+    for i, raw in enumerate(names):
+        name = clean_text(raw).lower().replace("faecal", "fecal")
+        for key, prefix in PARAMETERS:
+            if key not in columns and name.startswith(prefix):
+                columns[key] = i
+    missing = [key for key in PARAMETER_KEYS if key not in columns]
+    if missing:
+        raise ValueError(f"Dataset header has no column for: {', '.join(missing)}")
+    for key, i in columns.items():
+        if [s.strip().lower() for s in stats[i:i + 2]] != ["min", "max"]:
+            raise ValueError(f"Expected Min/Max under '{key}' in the second header row")
+    return [columns[key] for key in PARAMETER_KEYS]
+
+
+class RiverChunk:
+    """
+    Parsed rows of one chunk (same layout as RiverDataset, no station index).
+    offset = bytes of the file read up to the end of this chunk.
+    """
+
+    def __init__(self, codes, names, states, values, bdl, missing, offset=None):
+        self.codes = codes
+        self.names = names
+        self.states = states
+        self.values = values
+        self.bdl = bdl
+        self.missing = missing
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.codes)
+
+    def midpoints(self, parameters=None):
+        """(rows, len(parameters)) float64 midpoints, values exactly as written in the CSV."""
+        idx = [PARAMETER_KEYS.index(p) for p in (parameters or PARAMETER_KEYS)]
+        lo, hi = as_float64(self.values[MIN, idx]), as_float64(self.values[MAX, idx])
+        return np.ascontiguousarray(midpoint_values(lo, hi).T)
+
+
+def _read_header(reader, path):
+    try:
+        names, stats = next(reader), next(reader)
+    except StopIteration:
+        raise ValueError(f"{path}: missing the two header rows")
+    return _check_header(names, stats)
+
+
+def check_header(path):
+    """Raise ValueError unless `path` starts with the dataset's two header rows."""
+    with open(path, encoding=ENCODING, errors="replace", newline="") as f:
+        _read_header(csv.reader(f), os.path.basename(path))
+
+
+def iter_chunks(path=RIVER_DATASET_PATH, chunk_rows=1024, bdl_value=0.0):
+    """Yield RiverChunk objects of up to chunk_rows rows while reading the CSV."""
+    with open(path, encoding=ENCODING, errors="replace", newline="") as f:
+        # cp1252 is one byte per character, so characters read = file offset
+        consumed = 0
+
+        def lines():
+            nonlocal consumed
+            for line in f:
+                consumed += len(line)
+                yield line
+
+        reader = csv.reader(lines())
+        starts = _read_header(reader, path)
+        width = len(PARAMETERS)
+
+        def flush(rows):
+            n = len(rows)
+            values = np.empty((2, width, n), dtype=np.float32)
+            bdl = np.zeros((2, width, n), dtype=bool)
+            missing = np.zeros((2, width, n), dtype=bool)
+            codes = np.empty(n, dtype=np.int32)
+            for r, row in enumerate(rows):
+                code = _SPACE_RE.sub("", row[0])
+                codes[r] = int(code) if code.isdigit() else -1
+                for p, start in enumerate(starts):
+                    for stat in (MIN, MAX):
+                        value, is_bdl, is_missing = parse_cell(row[start + stat] if start + stat < len(row) else "")
+                        values[stat, p, r] = bdl_value if is_bdl else value
+                        bdl[stat, p, r] = is_bdl
+                        missing[stat, p, r] = is_missing
+            return RiverChunk(codes, [clean_text(row[1]) for row in rows],
+                              [clean_text(row[2]) for row in rows], values, bdl, missing, offset=consumed)
+
+        rows = []
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            rows.append(row)
+            if len(rows) >= chunk_rows:
+                yield flush(rows)
+                rows = []
+        if rows:
+            yield flush(rows)
+
+
+class RiverDataset:
+    """
+    Columnar, float32 view of the river dataset.
+    values / bdl / missing have shape (2, parameters, rows); values[MIN, p]
+    and values[MAX, p] are contiguous columns.
+    """
+
+    def __init__(self, values, bdl, missing, station_ids, station_codes, station_names, station_states,
+                 source=None):
+        self.parameters = list(PARAMETER_KEYS)
+        self.values = values
+        self.bdl = bdl
+        self.missing = missing
+        self.station_ids = station_ids
+        self.station_codes = station_codes
+        self.station_names = station_names
+        self.station_states = station_states
+        self.source = source
+        # station -> its rows, CSR style: rows_by_station[offsets[s]:offsets[s + 1]]
+        self.rows_by_station = np.argsort(station_ids, kind="stable").astype(np.int32)
+        self.station_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(station_ids, minlength=len(station_codes))))).astype(np.int32)
+        self._station_lookup = {int(c): s for s, c in enumerate(station_codes)}
+
+    def __len__(self):
+        return self.values.shape[2]
+
+    def column(self, parameter, stat=MIN):
+        return self.values[stat, self.parameters.index(parameter)]
+
+    def midpoints(self, parameters=None):
+        """
+        (rows, len(parameters)) float32: mean of Min and Max, or whichever of
+        the two is present (NaN if neither) -- the notebook's row averaging.
+        """
+        idx = [self.parameters.index(p) for p in (parameters or self.parameters)]
+        mid = midpoint_values(self.values[MIN, idx], self.values[MAX, idx])
+        return np.ascontiguousarray(mid.T, dtype=np.float32)
+
+    def station_rows(self, code):
+        """Row indices measured at station `code` (empty if unknown)."""
+        s = self._station_lookup.get(int(code))
+        if s is None:
+            return np.empty(0, dtype=np.int32)
+        return self.rows_by_station[self.station_offsets[s]:self.station_offsets[s + 1]]
+
+    def summary(self):
+        return {
+            "rows": len(self),
+            "stations": len(self.station_codes),
+            "bdl_cells": int(self.bdl.sum()),
+            "missing_cells": int(self.missing.sum()),
+            "bytes": int(self.values.nbytes + self.bdl.nbytes + self.missing.nbytes),
+            "source": self.source,
+        }
+
+
+def _build(chunks, source):
+    chunks = list(chunks)
+    if not chunks:
+        raise ValueError("Dataset has no data rows")
+    codes = np.concatenate([c.codes for c in chunks])
+    names = [n for c in chunks for n in c.names]
+    states = [s for c in chunks for s in c.states]
+    # stations in order of first appearance; name / state from that first row
+    station_codes, first_row, station_ids = np.unique(codes, return_index=True, return_inverse=True)
+    order = np.argsort(first_row, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return RiverDataset(
+        values=np.concatenate([c.values for c in chunks], axis=2),
+        bdl=np.concatenate([c.bdl for c in chunks], axis=2),
+        missing=np.concatenate([c.missing for c in chunks], axis=2),
+        station_ids=rank[station_ids.ravel()].astype(np.int32),
+        station_codes=station_codes[order].astype(np.int32),
+        station_names=np.array([names[i] for i in first_row[order]], dtype=str),
+        station_states=np.array([states[i] for i in first_row[order]], dtype=str),
+        source=source,
+    )
+
+
+def cache_path(path, bdl_value, cache_dir=RIVER_DATASET_CACHE_DIR):
+    """.npz location for `path` parsed with these settings (changes when the CSV does)."""
+    key = repr((os.path.abspath(path), file_signature(path), FORMAT_VERSION, float(bdl_value)))
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    base = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{base}.{digest}.npz")
+
+
+def _save(dataset, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, values=dataset.values, bdl=dataset.bdl, missing=dataset.missing,
+             station_ids=dataset.station_ids, station_codes=dataset.station_codes,
+             station_names=dataset.station_names, station_states=dataset.station_states)
+    os.replace(tmp_path, target)
+    # drop caches of older versions of the same file
+    prefix = os.path.basename(target).rsplit(".", 2)[0] + "."
+    for name in os.listdir(os.path.dirname(target)):
+        if name.startswith(prefix) and name.endswith(".npz") and name != os.path.basename(target) \
+                and ".tmp" not in name:
+            try:
+                os.remove(os.path.join(os.path.dirname(target), name))
+            except OSError:
+                pass
+
+
+def load_river_dataset(path=RIVER_DATASET_PATH, cache=True, cache_dir=RIVER_DATASET_CACHE_DIR,
+                       chunk_rows=1024, bdl_value=0.0):
+    """
+    Parsed dataset; from the .npz cache when it matches the CSV, otherwise
+    streamed from the CSV (and the cache written for next time).
+    """
+    path = os.path.abspath(path)
+    target = cache_path(path, bdl_value, cache_dir) if cache else None
+    if target and os.path.exists(target):
+        try:
+            with np.load(target, allow_pickle=False) as data:
+                return RiverDataset(data["values"], data["bdl"], data["missing"], data["station_ids"],
+                                    data["station_codes"], data["station_names"], data["station_states"],
+                                    source=target)
+        except Exception as e:
+            print(f"⚠ Ignoring unreadable dataset cache {target}: {e}")
+
+    start = time.perf_counter()
+    dataset = _build(iter_chunks(path, chunk_rows, bdl_value), path)
+    print(f"✅ Parsed {len(dataset)} rows / {len(dataset.station_codes)} stations "
+          f"from {os.path.basename(path)} in {time.perf_counter() - start:.2f}s")
+    if target:
+        try:
+            _save(dataset, target)
+        except OSError as e:
+            print(f"⚠ Could not write dataset cache {target}: {e}")
+    return dataset
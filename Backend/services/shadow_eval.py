@@ -0,0 +1,213 @@
+"""
+Shadow (A/B) evaluation of a candidate model against the one being served.
+
+A PredictionPipeline with a ShadowEvaluator hands a sample of its served
+predictions (SHADOW_SAMPLE_RATE of the requests that reach the model;
+cache hits are not sampled) to a small thread pool, which runs the same
+input through the candidate model. The user always gets the primary's
+label: the request thread only copies the input and queues the job, and
+when every slot (workers + SHADOW_QUEUE waiting jobs) is taken the sample
+is dropped instead of waiting.
+
+Recorded per comparison:
+  - agreement: rows where both models gave the same label
+  - confusion: (primary label, candidate label) -> rows
+  - latency: primary vs candidate inference time for the same input
+    (the candidate's is measured in the pool thread, so it includes any
+    wait for the GIL under load)
+
+Counters / histograms go to /metrics (summed over gunicorn workers):
+  shadow_requests_total{model, result}          completed / dropped / error / unavailable
+  shadow_predictions_total{model, outcome}      agree / disagree (rows)
+  shadow_confusion_total{model, primary, candidate}
+  shadow_inference_seconds{model, role}         primary / candidate
+stats() has the same numbers for this worker plus latency percentiles,
+and every disagreement is logged as a "shadow_disagreement" record.
+
+Config (env):
+  SHADOW_SAMPLE_RATE  fraction of requests also sent to the candidate (default 0.1)
+  SHADOW_WORKERS      pool threads per process (default 1)
+  SHADOW_QUEUE        jobs allowed to wait for a thread (default 16)
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from services.metrics import describe, store
+from services.structured_log import get_logger, log_event
+
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", 0.1))
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", 1))
+SHADOW_QUEUE = int(os.getenv("SHADOW_QUEUE", 16))
+
+SHADOW_THREAD_PREFIX = "shadow-eval"
+# latency deltas kept for the percentiles in stats()
+LATENCY_WINDOW = 1024
+
+log = get_logger("prediction")
+
+describe("shadow_requests_total", "counter", "Sampled requests sent to the candidate model, by result.")
+describe("shadow_predictions_total", "counter", "Rows compared with the candidate model, by outcome.")
+describe("shadow_confusion_total", "counter", "Compared rows by primary and candidate label.")
+describe("shadow_inference_seconds", "histogram", "Inference time of sampled requests, primary vs candidate.")
+
+
+def _candidate_input(X, candidate):
+    """The primary's input with the candidate's column names (DataFrame path)."""
+    if isinstance(X, np.ndarray):
+        return X
+    columns = getattr(candidate, "features", None)
+    if columns and list(X.columns) != list(columns):
+        return X.set_axis(columns, axis=1)
+    return X
+
+
+class ShadowEvaluator:
+    """
+    name           -- primary model name (metric label)
+    get_candidate  -- returns the loaded candidate model or None
+    submit(pipeline, X, labels, seconds, endpoint) is called by the
+    pipeline after the primary predicted `labels` for X in `seconds`.
+    """
+
+    def __init__(self, name, get_candidate, sample_rate=SHADOW_SAMPLE_RATE,
+                 workers=SHADOW_WORKERS, queue_size=SHADOW_QUEUE):
+        self.name = name
+        self.get_candidate = get_candidate
+        self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        self.workers = max(int(workers), 1)
+        self.queue_size = max(int(queue_size), 0)
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self.reset()
+
+    def reset(self):
+        """Start a new comparison (after either model was swapped)."""
+        with self._lock:
+            self.results = {"completed": 0, "dropped": 0, "error": 0, "unavailable": 0}
+            self.rows = 0
+            self.agree = 0
+            self.confusion = {}
+            self.primary_seconds = 0.0
+            self.candidate_seconds = 0.0
+            self.deltas = deque(maxlen=LATENCY_WINDOW)
+            self.since = time.time()
+
+    # ------------------------------------------------------------
+    # Pool
+    # ------------------------------------------------------------
+    def _get_executor(self):
+        # one pool per process: a forked gunicorn worker has no pool threads
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix=f"{SHADOW_THREAD_PREFIX}-{self.name}")
+                    self._pid = os.getpid()
+                    self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        return self._executor
+
+    def _count(self, result):
+        with self._lock:
+            self.results[result] += 1
+        store.inc("shadow_requests_total", (("model", self.name), ("result", result)))
+
+    def submit(self, pipeline, X, labels, seconds, endpoint):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        executor = self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            self._count("dropped")
+            return
+        # single readings live in a reused per-thread row buffer
+        if isinstance(X, np.ndarray):
+            X = X.copy()
+        try:
+            future = executor.submit(self._run, pipeline, X, labels, seconds, endpoint)
+        except RuntimeError:
+            # interpreter shutting down
+            self._slots.release()
+            return
+        future.add_done_callback(lambda _: self._slots.release())
+
+    # ------------------------------------------------------------
+    # Comparison (pool thread)
+    # ------------------------------------------------------------
+    def _run(self, pipeline, X, labels, primary_seconds, endpoint):
+        try:
+            candidate = self.get_candidate()
+            if candidate is None:
+                self._count("unavailable")
+                return
+            start = time.perf_counter()
+            shadow = pipeline.decode_labels(candidate, pipeline.infer(candidate, _candidate_input(X, candidate)))
+            candidate_seconds = time.perf_counter() - start
+        except Exception as e:
+            self._count("error")
+            log_event(log, "shadow_error", status=500, model=self.name, endpoint=endpoint, error=str(e))
+            return
+        self._record(X, labels, shadow, primary_seconds, candidate_seconds, endpoint)
+
+    def _record(self, X, labels, shadow, primary_seconds, candidate_seconds, endpoint):
+        pairs = {}
+        for p, c in zip(labels.tolist(), shadow.tolist()):
+            pairs[(p, c)] = pairs.get((p, c), 0) + 1
+        agree = sum(n for (p, c), n in pairs.items() if p == c)
+        rows = len(labels)
+
+        with self._lock:
+            self.results["completed"] += 1
+            self.rows += rows
+            self.agree += agree
+            for pair, n in pairs.items():
+                self.confusion[pair] = self.confusion.get(pair, 0) + n
+            self.primary_seconds += primary_seconds
+            self.candidate_seconds += candidate_seconds
+            self.deltas.append(candidate_seconds - primary_seconds)
+
+        model = ("model", self.name)
+        store.inc("shadow_requests_total", (model, ("result", "completed")))
+        store.inc("shadow_predictions_total", (model, ("outcome", "agree")), agree)
+        store.inc("shadow_predictions_total", (model, ("outcome", "disagree")), rows - agree)
+        for (p, c), n in pairs.items():
+            store.inc("shadow_confusion_total", (model, ("primary", p), ("candidate", c)), n)
+        store.observe("shadow_inference_seconds", (model, ("role", "primary")), primary_seconds)
+        store.observe("shadow_inference_seconds", (model, ("role", "candidate")), candidate_seconds)
+
+        if agree < rows:
+            fields = {"rows": rows, "disagree": rows - agree,
+                      "confusion": [[p, c, n] for (p, c), n in pairs.items() if p != c]}
+            if rows == 1 and isinstance(X, np.ndarray):
+                fields["input"] = X[0].tolist()
+            log_event(log, "shadow_disagreement", model=self.name, endpoint=endpoint, **fields)
+
+    def stats(self):
+        """This worker's comparison so far (for /diagnostics)."""
+        with self._lock:
+            completed = self.results["completed"]
+            deltas = np.fromiter(self.deltas, dtype=np.float64)
+            confusion = [{"primary": p, "candidate": c, "rows": n} for (p, c), n in sorted(
+                self.confusion.items(), key=lambda item: -item[1])]
+            stats = {
+                "sample_rate": self.sample_rate,
+                "since": self.since,
+                "requests": dict(self.results),
+                "rows": self.rows,
+                "agreement_rate": round(self.agree / self.rows, 4) if self.rows else None,
+                "confusion": confusion,
+                "primary_ms_mean": round(self.primary_seconds / completed * 1000, 3) if completed else None,
+                "candidate_ms_mean": round(self.candidate_seconds / completed * 1000, 3) if completed else None,
+            }
+        if len(deltas):
+            p50, p95 = np.percentile(deltas, [50, 95]) * 1000
+            stats["delta_ms_p50"] = round(float(p50), 3)
+            stats["delta_ms_p95"] = round(float(p95), 3)
+        return stats
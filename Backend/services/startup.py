@@ -0,0 +1,84 @@
+"""
+Startup helpers: lazily imported modules and the create_all switch.
+
+lazy_module("pandas") returns a stand-in that imports the real module on
+first attribute access (pd.DataFrame ...), so importing app.py no longer
+pays for pandas / joblib. The prediction warm-up thread loads them right
+after boot (MODEL_LOADING=background), or the first request that needs
+them does (MODEL_LOADING=lazy).
+
+Config (env):
+  DB_CREATE_ALL   auto (default) -> run db.create_all() only when the database
+                  is not managed by Flask-Migrate (no alembic_version table)
+                  always / never
+"""
+import importlib
+import os
+import threading
+import time
+
+from sqlalchemy import inspect
+
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "auto").lower()
+
+
+class LazyModule:
+    """
+    Module proxy; the import happens once, on first use, under a lock.
+    Its own attributes all start with "_" so they never hide the module's.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+        self._import_seconds = None
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    self._import_seconds = time.perf_counter() - start
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def preload(*modules):
+    """Import lazy modules now (warm-up thread); returns {name: import seconds}."""
+    for module in modules:
+        module._load()
+    return {module._name: module._import_seconds for module in modules}
+
+
+def is_loaded(module):
+    return not isinstance(module, LazyModule) or module._module is not None
+
+
+def should_create_all(db):
+    """
+    True if create_app() should call db.create_all(). In "auto" mode the
+    schema is left to migrations (flask db upgrade) once the database has
+    an alembic_version table.
+    """
+    if DB_CREATE_ALL == "always":
+        return True
+    if DB_CREATE_ALL == "never":
+        return False
+    try:
+        return not inspect(db.engine).has_table("alembic_version")
+    except Exception as e:
+        print(f"⚠ Could not inspect database for migrations: {e}")
+        return True
@@ -0,0 +1,127 @@
+"""
+Structured, sampled request logging.
+
+Handlers call log_event(...) with a few compact fields (endpoint, latency,
+label, validation error ...). Records are put on an in-memory queue by a
+QueueHandler and written as one JSON line each by a QueueListener thread,
+so the request thread never formats tables or blocks on stdout.
+
+Config (env):
+  REQUEST_LOG_LEVEL        INFO (default) / WARNING / ...
+  REQUEST_LOG_SAMPLE_RATE  fraction of successful / 4xx events to keep (default 1.0);
+                           5xx events are always logged
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+LOG_LEVEL = os.getenv("REQUEST_LOG_LEVEL", "INFO").upper()
+SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", 1.0))
+
+_queue = queue.SimpleQueue()
+_handlers = []
+_listener = None
+
+
+class JsonLineFormatter(logging.Formatter):
+    """One compact JSON object per record: ts, level, logger, event + fields."""
+
+    def format(self, record):
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        out.update(getattr(record, "fields", {}))
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+class _FieldsQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler.prepare() would render the message (and traceback) with the
+    default text formatter; keep the record structured instead and only
+    turn exc_info into text (it can't be pickled / outlive the frame).
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.fields = dict(getattr(record, "fields", {}))
+            record.fields["exc"] = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+            record.exc_text = None
+        return record
+
+
+def _start_listener():
+    global _listener
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonLineFormatter())
+    _listener = logging.handlers.QueueListener(_queue, stream)
+    _listener.start()
+
+
+def get_logger(name):
+    """Logger that writes JSON lines through the shared background queue."""
+    logger = logging.getLogger(name)
+    if not any(h in _handlers for h in logger.handlers):
+        if _listener is None:
+            _start_listener()
+        handler = _FieldsQueueHandler(_queue)
+        _handlers.append(handler)
+        logger.addHandler(handler)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+    return logger
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_listener_in_child():
+    # The listener thread doesn't survive fork (gunicorn --preload):
+    # give the worker a fresh queue and its own listener.
+    global _queue, _listener
+    if _listener is None:
+        return
+    _queue = queue.SimpleQueue()
+    for handler in _handlers:
+        handler.queue = _queue
+    _start_listener()
+
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_restart_listener_in_child)
+
+
+def log_event(logger, event, started=None, status=200, exc_info=False, **fields):
+    """
+    Log one request event.
+    started -> time.perf_counter() at request start (adds latency_ms)
+    status  -> HTTP status; >= 500 is always logged, the rest is sampled
+    """
+    if status < 500 and SAMPLE_RATE < 1.0 and random.random() >= SAMPLE_RATE:
+        return
+    if started is not None:
+        fields["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    fields["status"] = status
+    if status >= 500:
+        level = logging.ERROR
+    elif status >= 400:
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields}, exc_info=exc_info)
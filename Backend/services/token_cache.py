@@ -0,0 +1,181 @@
+"""
+Bounded TTL cache of validated auth tokens.
+
+/validate-token is polled by the frontend. A cached entry holds what the
+endpoint returns (user_id, user_name) plus the token's own expiry, so a
+repeat poll skips the signature check and the database lookup.
+
+An entry lives at most TOKEN_CACHE_TTL seconds and never past the token's
+expiry. revoke_user(user_id) (password reset) drops every cached token of
+the user in this process and publishes a revocation marker
+"token_revoked:<user_id>" (the reset time, kept TOKEN_CACHE_TTL seconds) in
+Redis. A cache hit in any other worker checks for the marker -- one Redis
+GET, no database -- and entries cached before the reset are dropped, so the
+next full validation rejects the old token.
+
+Without Redis (TOKEN_REVOCATION_BACKEND=local) other workers keep trusting
+their entries for at most TOKEN_CACHE_TTL seconds after a reset. If Redis is
+unreachable a hit is not trusted and the token is validated in full.
+
+Config (env):
+  TOKEN_CACHE_SIZE              max cached tokens per process (default 10000, 0 disables)
+  TOKEN_CACHE_TTL               seconds an entry is trusted (default 60)
+  TOKEN_REVOCATION_BACKEND      redis | local (default redis when OTP_BACKEND or
+                                RATE_LIMIT_BACKEND is redis, else local)
+  TOKEN_REVOCATION_REDIS_URL    default: OTP_REDIS_URL or redis://localhost:6379/0
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # optional, only needed for TOKEN_REVOCATION_BACKEND=redis
+    redis = None
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 60))
+_SHARED_STORE = "redis" in (os.getenv("OTP_BACKEND", "").lower(), os.getenv("RATE_LIMIT_BACKEND", "").lower())
+TOKEN_REVOCATION_BACKEND = os.getenv("TOKEN_REVOCATION_BACKEND", "redis" if _SHARED_STORE else "local").lower()
+TOKEN_REVOCATION_REDIS_URL = (os.getenv("TOKEN_REVOCATION_REDIS_URL")
+                              or os.getenv("OTP_REDIS_URL", "redis://localhost:6379/0"))
+
+# entries cached up to this many seconds after a reset elsewhere are dropped
+# too (clock skew between hosts)
+REVOCATION_SKEW = 2.0
+
+
+class TokenCache:
+    """
+    Thread-safe LRU of token -> (user_id, user_name, cached_at, valid_until).
+    `revocations` is a Redis client shared by the workers, or None.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL, revocations=None):
+        self.max_size = int(max_size)
+        self.ttl = float(ttl)
+        self.revocations = revocations
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # user_id -> tokens cached for that user (for revoke_user)
+        self._by_user = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.revoked = 0
+        self.revocation_errors = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, token):
+        """(user_id, user_name) for a cached, still valid token, else None."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            user_id, user_name, cached_at, valid_until = entry
+            if now >= valid_until:
+                self._remove_locked(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+        if self.revocations is not None and self._revoked_since(user_id, cached_at):
+            with self._lock:
+                if token in self._entries:
+                    self._remove_locked(token)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return user_id, user_name
+
+    def _revoked_since(self, user_id, cached_at):
+        """True if the user's tokens were revoked (anywhere) after `cached_at`, or Redis failed."""
+        try:
+            stamp = self.revocations.get(self._marker(user_id))
+        except Exception:
+            with self._lock:
+                self.revocation_errors += 1
+            return True
+        return stamp is not None and float(stamp) + REVOCATION_SKEW >= cached_at
+
+    @staticmethod
+    def _marker(user_id):
+        return f"token_revoked:{user_id}"
+
+    def put(self, token, user_id, user_name, token_expires_at):
+        if not self.enabled:
+            return
+        now = time.time()
+        valid_until = min(now + self.ttl, token_expires_at)
+        with self._lock:
+            if token in self._entries:
+                self._remove_locked(token)
+            self._entries[token] = (user_id, user_name, now, valid_until)
+            self._by_user.setdefault(user_id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+
+    def _remove_locked(self, token):
+        user_id = self._entries.pop(token)[0]
+        tokens = self._by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[user_id]
+
+    def revoke_user(self, user_id):
+        """
+        Forget every cached token of `user_id` (e.g. after a password reset),
+        here and -- through the revocation marker -- in the other workers.
+        """
+        with self._lock:
+            for token in list(self._by_user.get(user_id, ())):
+                self._remove_locked(token)
+                self.revoked += 1
+        if self.revocations is None or not self.enabled:
+            return
+        try:
+            # an entry cached before now lives at most ttl more seconds
+            self.revocations.set(self._marker(user_id), repr(time.time()), ex=int(self.ttl) + 1)
+        except Exception as e:
+            with self._lock:
+                self.revocation_errors += 1
+            print(f"⚠️ Token revocation not shared with other workers: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "revoked": self.revoked,
+                "revocation_backend": "redis" if self.revocations is not None else "local",
+                "revocation_errors": self.revocation_errors,
+            }
+
+
+def make_revocations(backend=TOKEN_REVOCATION_BACKEND):
+    if backend == "local":
+        return None
+    if backend == "redis":
+        if redis is None:
+            raise RuntimeError("TOKEN_REVOCATION_BACKEND=redis needs the 'redis' package (pip install redis)")
+        return redis.Redis.from_url(TOKEN_REVOCATION_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    raise ValueError(f"Unknown TOKEN_REVOCATION_BACKEND '{backend}' (use redis or local)")
+
+
+token_cache = TokenCache(revocations=make_revocations())
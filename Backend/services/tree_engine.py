@@ -0,0 +1,392 @@
+"""
+Compiled tree-ensemble evaluator.
+
+Reads the fitted trees of the pickled models once and flattens them into
+array-backed node tables (feature index, threshold, left/right child, leaf
+value). Rows are then evaluated with vectorized NumPy traversal: every row
+walks every tree at the same time, one tree level per step.
+
+Supported models:
+  - sklearn RandomForest / ExtraTrees classifiers
+  - xgboost XGBClassifier (gbtree, multi:softprob / binary:logistic)
+  - sklearn Pipeline (SimpleImputer / StandardScaler are compiled,
+    any other transformer is delegated to its own .transform)
+  - sklearn StackingClassifier (tree members compiled, other members
+    such as SVC delegated to their own predict_proba)
+
+Use compile_model(estimator) -> object with predict / predict_proba that
+matches the original estimator.
+"""
+import json
+import warnings
+
+import numpy as np
+
+# Compiled models are fed plain arrays (same column order as training)
+warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+
+# Rows evaluated per traversal step (bounds the rows x trees index matrix)
+CHUNK_ROWS = 2048
+
+
+class TreeTable:
+    """
+    All trees of one ensemble flattened into shared node arrays.
+
+    Leaves point to themselves (left == right == own index) so the traversal
+    loop needs no leaf check: after `depth` steps every row sits on a leaf.
+    Rows x trees are walked together as one flat index vector.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, depth, strict):
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.right = np.ascontiguousarray(right, dtype=np.intp)
+        self.missing_left = np.ascontiguousarray(missing_left, dtype=bool)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.depth = int(depth)
+        # xgboost goes left on x < threshold, sklearn on x <= threshold
+        self.compare = np.less if strict else np.less_equal
+
+        # Interleaved children: children[2 * node + go_left]
+        self.children = np.column_stack([self.right, self.left]).ravel()
+        # One contiguous value column per output (cheaper to gather than rows)
+        self.value_columns = [np.ascontiguousarray(col) for col in self.value.T]
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def leaves(self, X):
+        """Leaf node index reached in every tree -> (n_rows, n_trees)."""
+        n, n_features = X.shape
+        flat_x = np.ascontiguousarray(X).ravel()
+        row_base = np.repeat(np.arange(n, dtype=np.intp) * n_features, self.n_trees)
+        node = np.tile(self.roots, n)
+        has_nan = np.isnan(flat_x).any()
+        for _ in range(self.depth):
+            xv = flat_x.take(row_base + self.feature.take(node))
+            go_left = self.compare(xv, self.threshold.take(node))
+            if has_nan:
+                go_left |= np.isnan(xv) & self.missing_left.take(node)
+            node = self.children.take(2 * node + go_left)
+        return node.reshape(n, self.n_trees)
+
+    def accumulate(self, X):
+        """Sum of leaf values over all trees -> (n_rows, n_outputs)."""
+        out = np.empty((X.shape[0], len(self.value_columns)), dtype=np.float64)
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            leaves = self.leaves(X[start:start + CHUNK_ROWS])
+            for k, col in enumerate(self.value_columns):
+                out[start:start + CHUNK_ROWS, k] = col.take(leaves).sum(axis=1)
+        return out
+
+
+def _depth(left, right, root):
+    """Max depth of one tree given child arrays (-1 for leaves)."""
+    depth = 0
+    stack = [(root, 0)]
+    while stack:
+        node, d = stack.pop()
+        if left[node] < 0:
+            depth = max(depth, d)
+        else:
+            stack.append((left[node], d + 1))
+            stack.append((right[node], d + 1))
+    return depth
+
+
+def _stack_tables(trees, strict):
+    """
+    Concatenate per-tree arrays into one TreeTable.
+    `trees` is a list of dicts with feature, threshold, left, right,
+    missing_left, value (child indices local to the tree, -1 for leaves).
+    """
+    feature, threshold, left, right, missing_left, value, roots = [], [], [], [], [], [], []
+    depth = 0
+    offset = 0
+    for t in trees:
+        n = len(t["left"])
+        local = np.arange(n)
+        is_leaf = t["left"] < 0
+        feature.append(np.where(is_leaf, 0, t["feature"]))
+        threshold.append(t["threshold"])
+        left.append(np.where(is_leaf, local, t["left"]) + offset)
+        right.append(np.where(is_leaf, local, t["right"]) + offset)
+        missing_left.append(t["missing_left"])
+        value.append(t["value"])
+        roots.append(offset)
+        depth = max(depth, _depth(t["left"], t["right"], 0))
+        offset += n
+
+    return TreeTable(
+        feature=np.concatenate(feature),
+        threshold=np.concatenate(threshold),
+        left=np.concatenate(left),
+        right=np.concatenate(right),
+        missing_left=np.concatenate(missing_left),
+        value=np.concatenate(value),
+        roots=np.array(roots),
+        depth=depth,
+        strict=strict,
+    )
+
+
+# ------------------------------------------------------------
+# sklearn forests
+# ------------------------------------------------------------
+class CompiledForestClassifier:
+    """RandomForestClassifier / ExtraTreesClassifier as a TreeTable."""
+
+    def __init__(self, forest):
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("Multi-output forests are not supported")
+        trees = []
+        for est in forest.estimators_:
+            tree = est.tree_
+            proba = tree.value[:, 0, :].astype(np.float64)
+            normalizer = proba.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            missing_left = getattr(tree, "missing_go_to_left", None)
+            if missing_left is None:
+                missing_left = np.zeros(tree.node_count, dtype=bool)
+            trees.append({
+                "feature": tree.feature,
+                "threshold": tree.threshold.astype(np.float64),
+                "left": tree.children_left,
+                "right": tree.children_right,
+                "missing_left": np.asarray(missing_left, dtype=bool),
+                "value": proba / normalizer,
+            })
+        self.table = _stack_tables(trees, strict=False)
+        self.classes_ = forest.classes_
+        self.n_estimators = len(forest.estimators_)
+
+    def predict_proba(self, X):
+        # sklearn trees evaluate on float32 inputs
+        X32 = np.asarray(X, dtype=np.float32)
+        return self.table.accumulate(X32) / self.n_estimators
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+# ------------------------------------------------------------
+# xgboost
+# ------------------------------------------------------------
+class CompiledXGBClassifier:
+    """XGBClassifier (gbtree booster) as a TreeTable of margins."""
+
+    def __init__(self, xgb):
+        booster = xgb.get_booster()
+        learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+        gbm = learner["gradient_booster"]
+        if gbm["name"] != "gbtree":
+            raise ValueError(f"Unsupported xgboost booster: {gbm['name']}")
+
+        self.objective = learner["objective"]["name"]
+        if self.objective not in ("multi:softprob", "multi:softmax", "binary:logistic"):
+            raise ValueError(f"Unsupported xgboost objective: {self.objective}")
+
+        params = learner["learner_model_param"]
+        n_class = int(params["num_class"])
+        n_out = max(n_class, 1)
+
+        model = gbm["model"]
+        trees_json = model["trees"]
+        tree_info = model["tree_info"]
+
+        # predict() honours early stopping -> only use trees up to best_iteration
+        try:
+            best = xgb.best_iteration
+        except AttributeError:
+            best = None
+        if best is not None:
+            end = int(model["iteration_indptr"][best + 1])
+            trees_json = trees_json[:end]
+            tree_info = tree_info[:end]
+
+        trees = []
+        for t, cls in zip(trees_json, tree_info):
+            if any(t.get("split_type", [])):
+                raise ValueError("Categorical xgboost splits are not supported")
+            left = np.asarray(t["left_children"], dtype=np.intp)
+            cond = np.asarray(t["split_conditions"], dtype=np.float32)
+            value = np.zeros((len(left), n_out), dtype=np.float64)
+            leaf = left < 0
+            # for leaves split_conditions holds the leaf weight
+            value[leaf, cls] = cond[leaf]
+            trees.append({
+                "feature": np.asarray(t["split_indices"], dtype=np.intp),
+                "threshold": cond,
+                "left": left,
+                "right": np.asarray(t["right_children"], dtype=np.intp),
+                "missing_left": np.asarray(t["default_left"], dtype=bool),
+                "value": value,
+            })
+        self.table = _stack_tables(trees, strict=True)
+
+        # binary:logistic keeps base_score as a probability; the multi-class
+        # objectives store it as the per-class starting margin
+        base = np.atleast_1d(np.asarray(json.loads(params["base_score"]), dtype=np.float64))
+        if self.objective == "binary:logistic":
+            self.base_margin = np.log(base / (1.0 - base))
+        else:
+            self.base_margin = base
+        self.classes_ = xgb.classes_
+
+    def margins(self, X):
+        X32 = np.asarray(X, dtype=np.float32)
+        return self.table.accumulate(X32) + self.base_margin
+
+    def predict_proba(self, X):
+        margin = self.margins(X)
+        if self.objective == "binary:logistic":
+            p = 1.0 / (1.0 + np.exp(-margin[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        margin -= margin.max(axis=1, keepdims=True)
+        e = np.exp(margin)
+        return e / e.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+# ------------------------------------------------------------
+# Pipeline + Stacking wrappers
+# ------------------------------------------------------------
+class _CompiledImputer:
+    def __init__(self, imputer):
+        stats = np.asarray(imputer.statistics_, dtype=np.float64)
+        if np.isnan(stats).any():
+            raise ValueError("SimpleImputer with all-missing columns is not supported")
+        if not (isinstance(imputer.missing_values, float) and np.isnan(imputer.missing_values)):
+            raise ValueError("Only NaN missing_values are supported")
+        self.stats = stats
+
+    def transform(self, X):
+        mask = np.isnan(X)
+        if mask.any():
+            X = np.where(mask, self.stats, X)
+        return X
+
+
+class _CompiledScaler:
+    def __init__(self, scaler):
+        self.mean = scaler.mean_ if scaler.with_mean else None
+        self.scale = scaler.scale_ if scaler.with_std else None
+
+    def transform(self, X):
+        if self.mean is not None:
+            X = X - self.mean
+        if self.scale is not None:
+            X = X / self.scale
+        return X
+
+
+def _compile_transformer(step):
+    name = type(step).__name__
+    if name == "SimpleImputer" and step.strategy in ("mean", "median", "most_frequent", "constant"):
+        return _CompiledImputer(step)
+    if name == "StandardScaler":
+        return _CompiledScaler(step)
+    # anything else keeps its own (already vectorized) transform
+    return step
+
+
+class CompiledPipeline:
+    """Pipeline whose final step is a compiled classifier."""
+
+    def __init__(self, pipeline):
+        self.steps = [_compile_transformer(step) for _, step in pipeline.steps[:-1]
+                      if step not in (None, "passthrough")]
+        self.final = compile_model(pipeline.steps[-1][1])
+        self.classes_ = self.final.classes_
+
+    def _transform(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        for step in self.steps:
+            X = step.transform(X)
+        return X
+
+    def predict_proba(self, X):
+        return self.final.predict_proba(self._transform(X))
+
+    def predict(self, X):
+        return self.final.predict(self._transform(X))
+
+
+class CompiledStacking:
+    """StackingClassifier: compiled tree members, delegated other members."""
+
+    def __init__(self, stack):
+        if getattr(stack, "passthrough", False):
+            raise ValueError("StackingClassifier(passthrough=True) is not supported")
+        self.members = []
+        for est, method in zip(stack.estimators_, stack.stack_method_):
+            if est == "drop":
+                continue
+            try:
+                compiled = compile_model(est)
+            except ValueError:
+                compiled = est
+            if method not in ("predict_proba", "predict") or not hasattr(compiled, method):
+                compiled = est
+            self.members.append((compiled, method))
+
+        self.final = stack.final_estimator_
+        self.binary = len(stack.classes_) == 2
+        self.classes_ = stack.classes_
+
+    def _meta_features(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        cols = []
+        for est, method in self.members:
+            preds = getattr(est, method)(X)
+            if preds.ndim == 1:
+                preds = preds.reshape(-1, 1)
+            elif method == "predict_proba" and self.binary:
+                preds = preds[:, 1:]
+            cols.append(preds)
+        return np.hstack(cols)
+
+    def _final_predict_index(self, meta):
+        # LogisticRegression: argmax of the linear decision function
+        if type(self.final).__name__ == "LogisticRegression":
+            scores = meta @ self.final.coef_.T + self.final.intercept_
+            if scores.shape[1] == 1:
+                idx = (scores[:, 0] > 0).astype(np.intp)
+            else:
+                idx = np.argmax(scores, axis=1)
+            return self.final.classes_.take(idx)
+        return self.final.predict(meta)
+
+    def predict(self, X):
+        # final estimator was trained on encoded labels 0..n_classes-1
+        return self.classes_.take(self._final_predict_index(self._meta_features(X)))
+
+    def predict_proba(self, X):
+        return self.final.predict_proba(self._meta_features(X))
+
+
+def compile_model(estimator):
+    """
+    Build a compiled evaluator for a fitted estimator.
+    Raises ValueError if the estimator (or its final step) is not supported.
+    """
+    name = type(estimator).__name__
+    if name in ("RandomForestClassifier", "ExtraTreesClassifier"):
+        return CompiledForestClassifier(estimator)
+    if name == "XGBClassifier":
+        return CompiledXGBClassifier(estimator)
+    if name == "Pipeline":
+        return CompiledPipeline(estimator)
+    if name == "StackingClassifier":
+        return CompiledStacking(estimator)
+    raise ValueError(f"No compiled engine for {name}")